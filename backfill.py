@@ -0,0 +1,43 @@
+import time
+from typing import Iterable, Optional
+
+DEFAULT_PREEMPTIBLE_ANNOTATION = "preemptible"
+DEFAULT_RUNTIME_ANNOTATION = "expected-runtime"
+DEFAULT_BACKFILL_WINDOW = 300.0
+
+# Reservation with backfill: a gang that can't fit and can't preempt its
+# way in reserves nodes (node.NodeIndex.reserve) as they free up, so they
+# aren't taken by whatever arrives next. Until it has enough, smaller
+# lower-priority gangs may run on its idle reserved nodes if they are
+# annotated preemptible, or declare an expected runtime (seconds) within the
+# backfill window. Once the reservation holds enough nodes it takes them
+# back through preempt_groups: preemptible gangs right away, the others
+# once their runtime is up.
+
+
+def is_preemptible(pod, annotation=DEFAULT_PREEMPTIBLE_ANNOTATION) -> bool:
+    return (pod.metadata.annotations or {}).get(annotation, "").lower() == "true"
+
+
+def expected_runtime(pod, annotation=DEFAULT_RUNTIME_ANNOTATION) -> Optional[float]:
+    ann = (pod.metadata.annotations or {}).get(annotation)
+    if ann is None:
+        return None
+    try:
+        runtime = float(ann)
+    except ValueError:
+        return None
+    return runtime if runtime >= 0 else None
+
+
+def backfill_deadline(pods: Iterable, window, now=None) -> Optional[float]:
+    # When nodes lent to these pods may be reclaimed, or None if they may
+    # not backfill at all.
+    now = time.monotonic() if now is None else now
+    pods = list(pods)
+    if pods and all(is_preemptible(p) for p in pods):
+        return now
+    runtimes = [expected_runtime(p) for p in pods]
+    if not runtimes or None in runtimes or max(runtimes) > window:
+        return None
+    return now + max(runtimes)
@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from typing import Callable, List, Tuple
+
+DEFAULT_BATCH_WINDOW = 0.2
+
+# Batch assignment: instead of admitting gangs in the order their last
+# member arrived, the scheduler collects the gangs that became ready over a
+# short window and assigns free nodes to all of them at once. Each gang
+# needs one whole node per waiting member, out of the nodes feasible for it.
+#
+# The objective is lexicographic by priority: place as many gangs as
+# possible at the highest priority, then at the next, and so on. Within a
+# priority, taking the smallest gangs first maximizes the count and leaves
+# the most nodes for lower priorities. Nodes are handed out preferring
+# those no constrained gang in the batch could use, so a gang pinned to a
+# few nodes isn't starved by one that can go anywhere. That is exact
+# without constraints and a greedy heuristic with them.
+
+
+@dataclass
+class BatchGang:
+    gang: object  # permit.WaitingGang
+    priority: int
+    size: int
+    feasible: int = -1  # node bitset (feasibility.NodeLabelIndex); -1 allows every node
+    order: int = 0  # when the gang became ready, as the sequential path would see it
+
+
+@dataclass
+class BatchPlan:
+    placed: List[Tuple[BatchGang, List[str]]] = field(default_factory=list)
+    unplaced: List[BatchGang] = field(default_factory=list)
+
+
+@dataclass
+class BatchReport:
+    cycles: int = 0
+    gangs: int = 0
+    placed: int = 0
+    sequential: int = 0
+    seconds: float = 0.0
+
+    def add(self, other: "BatchReport"):
+        self.cycles += other.cycles
+        self.gangs += other.gangs
+        self.placed += other.placed
+        self.sequential += other.sequential
+        self.seconds += other.seconds
+
+
+def solve(gangs: List[BatchGang], free: int, pick: Callable[[int, int], List[str]],
+          rows: Callable[[List[str]], int]) -> BatchPlan:
+    # free: bitset of free nodes. pick(count, mask) chooses count nodes out
+    # of mask; rows(names) turns the chosen names back into a bitset.
+    plan = BatchPlan()
+    order = sorted(gangs, key=lambda g: (-g.priority, g.size, g.order))
+    contested = 0
+    for g in gangs:
+        if g.feasible != -1:
+            contested |= g.feasible
+    for g in order:
+        available = free & g.feasible
+        if available.bit_count() < g.size:
+            plan.unplaced.append(g)
+            continue
+        uncontested = available & ~contested
+        nodes = pick(g.size, uncontested) if uncontested.bit_count() >= g.size else []
+        if len(nodes) < g.size:
+            nodes = pick(g.size, available)
+        if len(nodes) < g.size:
+            plan.unplaced.append(g)
+            continue
+        free &= ~rows(nodes)
+        plan.placed.append((g, nodes))
+    return plan
+
+
+def sequential_count(gangs: List[BatchGang], free: int) -> int:
+    # How many of these gangs admitting them one by one in arrival order
+    # would place, taking the lowest free nodes each gang may use.
+    placed = 0
+    for g in sorted(gangs, key=lambda g: g.order):
+        available = free & g.feasible
+        if available.bit_count() < g.size:
+            continue
+        for _ in range(g.size):
+            lowest = available & -available
+            available ^= lowest
+            free ^= lowest
+        placed += 1
+    return placed
+
@@ -0,0 +1,35 @@
+from kubernetes import client
+
+SCHEDULER_NAME = "foobar"
+
+
+def make_node(name, cpu="32", memory="128Gi", labels=None):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name=name, labels=labels or {}),
+        status=client.V1NodeStatus(allocatable={"cpu": cpu, "memory": memory, "pods": "110"}),
+    )
+
+
+def make_pod(name, group, namespace="default", priority=0, node_name=None, phase=None,
+             cpu="100m", memory="128Mi", group_size=None, scheduler_name=SCHEDULER_NAME):
+    annotations = {"pod-group": group}
+    if group_size is not None:
+        annotations["pod-group-size"] = str(group_size)
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name=name, namespace=namespace, annotations=annotations,
+                                     labels={"app": group}),
+        spec=client.V1PodSpec(
+            scheduler_name=scheduler_name,
+            priority=priority,
+            node_name=node_name,
+            containers=[client.V1Container(
+                name="main", image="busybox",
+                resources=client.V1ResourceRequirements(requests={"cpu": cpu, "memory": memory}))],
+        ),
+        status=client.V1PodStatus(phase=phase or ("Running" if node_name else "Pending")),
+    )
+
+
+def make_gang(group, size, priority=0, namespace="default"):
+    return [make_pod(f"{group}-{i}", group, namespace=namespace, priority=priority, group_size=size)
+            for i in range(size)]
@@ -0,0 +1,183 @@
+"""End-to-end load benchmark against the in-process fake API.
+
+    python -m bench.load --nodes 2000 --gangs 200 --gang-size 8 --latency 0.002
+    python -m bench.load --workers 4 --processes
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+from bench.cluster import make_gang, make_node
+from fake_k8s import FakeApiServer, FakeCoreV1Api, FakeWatch
+from main import Scheduler
+from resources import LeastAllocated, MostAllocated
+from shard import NodeClaims, run_workers
+
+PACKING = {"none": None, "most": MostAllocated, "least": LeastAllocated}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(nodes=2000, gangs=200, gang_size=8, latency=0.0, concurrency=16, packing="none",
+        priorities=1, timeout=120.0, fast_decode=False, workers=1,
+        batch_window=None, processes=False):
+    api = FakeCoreV1Api(latency=latency)
+    for i in range(nodes):
+        api.add_node(make_node(f"node-{i}"))
+    if processes:
+        return _run_processes(api, nodes, gangs, gang_size, concurrency, packing, priorities, timeout,
+                              fast_decode, workers, batch_window)
+
+    strategy = PACKING[packing]
+    log = io.StringIO()
+    # Sharded workers run as threads here, so they share one GIL; this
+    # checks claims and conflicts. processes=True measures scaling.
+    claims = NodeClaims() if workers > 1 else None
+    with contextlib.redirect_stdout(log):
+        schedulers = [Scheduler(v1=api, watch_factory=lambda: FakeWatch(api), concurrency=concurrency,
+                                tick_interval=0.05, packing=strategy() if strategy else None,
+                                fast_decode=fast_decode, shard=(i, workers) if workers > 1 else None,
+                                claims=claims, batch_window=batch_window)
+                      for i in range(workers)]
+        threads = [threading.Thread(target=s.run, daemon=True) for s in schedulers]
+        for thread, scheduler in zip(threads, schedulers):
+            thread.start()
+            scheduler.cache.wait_for_sync(timeout=60)
+        calls_before = sum(api.calls.values())
+
+        created = {}
+        start = time.monotonic()
+        for g in range(gangs):
+            for pod in make_gang(f"gang-{g}", gang_size, priority=g % priorities):
+                created[f"default/{pod.metadata.name}"] = time.monotonic()
+                api.add_pod(pod)
+
+        while len(api.bound_at) < len(created) and time.monotonic() - start < timeout:
+            time.sleep(0.005)
+        elapsed = time.monotonic() - start
+        for scheduler in schedulers:
+            scheduler.stop()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    report = _report(api, nodes, created, elapsed, calls_before)
+    report.update(claim_conflicts=sum(s.claim_conflicts for s in schedulers),
+                  batch_placed=sum(s.batch_totals.placed for s in schedulers),
+                  batch_placed_sequential=sum(s.batch_totals.sequential for s in schedulers),
+                  api_calls=report.pop("api_calls"))
+    return report
+
+
+def _run_processes(api, nodes, gangs, gang_size, concurrency, packing, priorities, timeout, fast_decode,
+                   workers, batch_window):
+    # shard.run_workers against the fake served over HTTP: each worker is a
+    # process with the real kubernetes client, found through KUBECONFIG.
+    # The fake apiserver is one Python process, so it caps the scaling.
+    server = FakeApiServer(api).start()
+    kubeconfig = {"apiVersion": "v1", "kind": "Config", "current-context": "fake",
+                  "clusters": [{"name": "fake", "cluster": {"server": server.url}}],
+                  "users": [{"name": "fake", "user": {}}],
+                  "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}]}
+    stop = threading.Event()
+    saved_env, saved_stdout = os.environ.get("KUBECONFIG"), os.dup(1)
+    with tempfile.NamedTemporaryFile("w", suffix=".kubeconfig") as f, open(os.devnull, "w") as devnull:
+        json.dump(kubeconfig, f)
+        f.flush()
+        os.environ["KUBECONFIG"] = f.name
+        os.dup2(devnull.fileno(), 1)  # the workers inherit it and log quietly
+        try:
+            runner = threading.Thread(target=run_workers, args=(workers,), daemon=True, kwargs=dict(
+                stop=stop, scheduler_name="foobar", concurrency=concurrency, tick_interval=0.05,
+                packing=PACKING[packing]() if PACKING[packing] else None, fast_decode=fast_decode,
+                batch_window=batch_window))
+            runner.start()
+            deadline = time.monotonic() + 60
+            while min(api.calls["watch_pods"], api.calls["watch_nodes"]) < workers and time.monotonic() < deadline:
+                time.sleep(0.05)
+            calls_before = sum(api.calls.values())
+
+            created = {}
+            start = time.monotonic()
+            for g in range(gangs):
+                for pod in make_gang(f"gang-{g}", gang_size, priority=g % priorities):
+                    created[f"default/{pod.metadata.name}"] = time.monotonic()
+                    api.add_pod(pod)
+            while len(api.bound_at) < len(created) and time.monotonic() - start < timeout:
+                time.sleep(0.005)
+            elapsed = time.monotonic() - start
+        finally:
+            stop.set()
+            runner.join(timeout=30)
+            server.stop()
+            os.dup2(saved_stdout, 1)
+            os.close(saved_stdout)
+            if saved_env is None:
+                os.environ.pop("KUBECONFIG", None)
+            else:
+                os.environ["KUBECONFIG"] = saved_env
+    # Conflicts and batch totals stay inside the worker processes.
+    report = _report(api, nodes, created, elapsed, calls_before)
+    report.update(claim_conflicts=None, batch_placed=None, batch_placed_sequential=None,
+                  api_calls=report.pop("api_calls"))
+    return report
+
+
+def _report(api, nodes, created, elapsed, calls_before):
+    latencies = [(api.bound_at[k] - t) * 1000 for k, t in created.items() if k in api.bound_at]
+    bound = len(latencies)
+    calls = sum(api.calls.values()) - calls_before
+    return {
+        "nodes": nodes,
+        "pods": len(created),
+        "pods_bound": bound,
+        "elapsed_s": round(elapsed, 3),
+        "pods_bound_per_s": round(bound / elapsed, 1) if elapsed else 0.0,
+        "p50_pending_to_bound_ms": round(percentile(latencies, 0.50), 2),
+        "p99_pending_to_bound_ms": round(percentile(latencies, 0.99), 2),
+        "api_calls_per_pod": round(calls / max(bound, 1), 3),
+        "api_calls": dict(api.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--gangs", type=int, default=200)
+    parser.add_argument("--gang-size", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--packing", choices=sorted(PACKING), default="none")
+    parser.add_argument("--priorities", type=int, default=1, help="number of distinct gang priorities")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--fast-decode", action="store_true", help="decode pods from raw JSON")
+    parser.add_argument("--workers", type=int, default=1, help="sharded scheduler workers")
+    parser.add_argument("--batch-window", type=float, default=None,
+                        help="seconds to collect ready gangs before assigning them together")
+    parser.add_argument("--processes", action="store_true",
+                        help="run the workers as processes (shard.run_workers) against the fake over HTTP")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(nodes=args.nodes, gangs=args.gangs, gang_size=args.gang_size, latency=args.latency,
+                 concurrency=args.concurrency, packing=args.packing, priorities=args.priorities,
+                 timeout=args.timeout, fast_decode=args.fast_decode, workers=args.workers,
+                 batch_window=args.batch_window, processes=args.processes)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Microbenchmarks for the discovery and selection hot paths.
+
+    python -m bench.micro --scale small medium --save-baseline
+    python -m bench.micro --scale small medium       # compares with bench/baseline.json
+
+Each case is timed over several repeats (median wall time) and traced once
+with tracemalloc for peak memory. Results go to a JSON file, and any case
+slower than --tolerance times its baseline fails the run. Baselines are
+per machine and not committed; comparing without one is an error.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from kubernetes import client
+
+from bench.cluster import make_node, make_pod
+from gang import GroupSelector, PodGroupDiscoverer
+from main import Scheduler
+from node import NodeDiscoverer
+from feasibility import constraints_of
+from pod_decode import decode_pod_list
+from topology import RACK_LABEL, ZONE_LABEL, TopologyScorer
+
+SCALES = {
+    "small": (1_000, 100),
+    "medium": (10_000, 1_000),
+    "large": (100_000, 10_000),
+}
+GANG_SIZE = 8
+RACK_SIZE = 40
+ZONE_SIZE = 1000
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_RESULTS = os.path.join(HERE, "results.json")
+
+
+class _StaticApi:
+    # Serves a fixed cluster with no latency so only scheduler code is measured.
+
+    def __init__(self, pods, nodes):
+        self._pods = SimpleNamespace(items=pods, metadata=SimpleNamespace(resource_version="1", _continue=None))
+        self._nodes = SimpleNamespace(items=nodes, metadata=SimpleNamespace(resource_version="1", _continue=None))
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        return self._pods
+
+    def list_node(self, **kwargs):
+        return self._nodes
+
+
+def synthetic_cluster(pod_count, node_count, seed=0):
+    # Bound gangs fill 90% of the nodes; the rest of the pods are pending gangs.
+    rng = random.Random(seed)
+    nodes = [make_node(f"node-{i}", labels={ZONE_LABEL: f"zone-{i // ZONE_SIZE}", RACK_LABEL: f"rack-{i // RACK_SIZE}"})
+             for i in range(node_count)]
+    pods = []
+    gang = 0
+    while len(pods) < pod_count:
+        priority = rng.choice((0, 10, 100, 1000))
+        for i in range(min(GANG_SIZE, pod_count - len(pods))):
+            index = len(pods)
+            node_name = f"node-{index}" if index < node_count * 9 // 10 else None
+            pods.append(make_pod(f"gang-{gang}-{i}", f"gang-{gang}", priority=priority,
+                                 node_name=node_name, group_size=GANG_SIZE))
+        gang += 1
+    return pods, nodes
+
+
+def _cases(pods, nodes):
+    api = _StaticApi(pods, nodes)
+    gangs = PodGroupDiscoverer(api)
+    node_discovery = NodeDiscoverer(api)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler = Scheduler(v1=api)
+        scheduler.cache._relist(scheduler.cache._nodes)
+        scheduler.cache._relist(scheduler.cache._pods)
+    pending = next(p for p in reversed(pods) if not p.spec.node_name)
+    preemptor = pending.metadata.annotations["pod-group"]
+
+    def select_node(pod=pending):
+        scheduler._select_node(pod)
+        scheduler.node_index.forget(f"default/{pod.metadata.name}")
+
+    # A pending pod restricted to the last zone, where the free nodes are.
+    zoned = make_pod("zoned", "zoned")
+    zoned.spec.node_selector = {ZONE_LABEL: nodes[-1].metadata.labels[ZONE_LABEL]}
+    zoned_constraints = constraints_of(zoned)
+
+    # One LIST response body, decoded into client models and by pod_decode.
+    api_client = client.ApiClient()
+    payload = json.dumps(api_client.sanitize_for_serialization(client.V1PodList(items=pods))).encode()
+
+    def preempt_dry_run():
+        try:
+            scheduler._preempt_for_group(preemptor, dry_run=True)
+        except Exception:
+            pass
+
+    # The same free nodes in a scorer without NumPy, for comparison.
+    python_scorer = TopologyScorer(vectorized=False)
+    for node in nodes:
+        python_scorer.on_node_event("ADDED", node)
+    for name in scheduler.node_index.free_nodes():
+        python_scorer.set_free(name, True)
+
+    indexed = scheduler.gang_manager
+    return {
+        "groups": lambda: indexed.groups(GroupSelector()),
+        "groups_max_priority": lambda: indexed.groups(GroupSelector(max_priority=100)),
+        "get_group": lambda: indexed.get_group(preemptor),
+        "groups_scan": lambda: gangs.groups(GroupSelector()),
+        "groups_scan_top_k": lambda: gangs.groups(GroupSelector(max_priority=100), limit=16),
+        "get_group_scan": lambda: gangs.get_group(preemptor),
+        "get_nodes_with_status": node_discovery.get_nodes_with_status,
+        "select_node": select_node,
+        "select_node_selector": lambda: select_node(zoned),
+        "feasible_mask": lambda: scheduler.node_index.labels._compute(zoned_constraints),
+        "rank_topology": lambda: scheduler.node_index.rank_free_nodes(GANG_SIZE),
+        "rank_topology_python": lambda: python_scorer.rank(GANG_SIZE),
+        "preempt_for_group_dry_run": preempt_dry_run,
+        "decode_pod_list_models": lambda: api_client.deserialize(payload, "V1PodList", "application/json"),
+        "decode_pod_list_fast": lambda: decode_pod_list(payload),
+    }
+
+
+def _measure(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": statistics.median(times), "peak_bytes": peak}
+
+
+def run(scales, repeats=5, only=None):
+    results = {}
+    for scale in scales:
+        pod_count, node_count = SCALES[scale]
+        pods, nodes = synthetic_cluster(pod_count, node_count)
+        for name, fn in _cases(pods, nodes).items():
+            if only and name not in only:
+                continue
+            results[f"{scale}/{name}"] = _measure(fn, repeats)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, result in sorted(results.items()):
+        base = baseline.get(case)
+        if base is None or not base["seconds"]:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > tolerance:
+            regressions.append((case, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", nargs="+", choices=sorted(SCALES), default=["small", "medium"])
+    parser.add_argument("--case", nargs="*", help="only run these cases")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--results", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="fail when a case is slower than this multiple of its baseline")
+    args = parser.parse_args()
+
+    results = run(args.scale, repeats=args.repeats, only=args.case)
+    for case, result in sorted(results.items()):
+        print(f"{case:<42} {result['seconds'] * 1000:>10.3f} ms {result['peak_bytes'] / 1024:>10.1f} KiB")
+
+    with open(args.results, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save-baseline")
+        sys.exit(2)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for case in sorted(set(results) - set(baseline)):
+        print(f"WARNING {case}: not in baseline, not compared")
+    regressions = compare(results, baseline, args.tolerance)
+    for case, ratio in regressions:
+        print(f"REGRESSION {case}: {ratio:.2f}x baseline")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
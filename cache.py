@@ -0,0 +1,344 @@
+import json
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from kubernetes import watch
+from kubernetes.watch.watch import iter_resp_lines
+from kubernetes.client.exceptions import ApiException
+from pod_decode import decode_pod, decode_pod_list
+from pod_utils import is_terminated_phase
+
+DEFAULT_RESYNC_PERIOD = 300
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_EVICT_BATCH = 1000
+DEFAULT_RETRY_INITIAL = 0.5
+DEFAULT_RETRY_MAX = 30.0
+HTTP_GONE = 410
+
+# Terminated pods hold no node and never join a gang again, so the scheduler
+# asks the apiserver to leave them out; a watch with this selector reports a
+# pod that finishes as DELETED.
+ACTIVE_POD_FIELD_SELECTOR = "status.phase!=Succeeded,status.phase!=Failed"
+BOUND_POD_FIELD_SELECTOR = "spec.nodeName!=," + ACTIVE_POD_FIELD_SELECTOR
+
+
+def pod_key(pod):
+    return f"{pod.metadata.namespace or 'default'}/{pod.metadata.name}"
+
+
+def node_key(node):
+    return node.metadata.name
+
+
+def _version_of(obj):
+    return obj.metadata.resource_version
+
+
+def _pod_finished(pod):
+    return is_terminated_phase(getattr(pod.status, "phase", None))
+
+
+def list_pages(list_fn, page_size=DEFAULT_PAGE_SIZE, decode=None, **selectors):
+    # Follows continue tokens; the pages of one listing share a snapshot and
+    # the last page carries its resource version. With decode, pages are
+    # fetched as raw JSON and decode(body) builds the page instead of the
+    # client models.
+    token = None
+    while True:
+        if decode is None:
+            resp = list_fn(limit=page_size, _continue=token, **selectors)
+        else:
+            resp = decode(list_fn(limit=page_size, _continue=token, _preload_content=False, **selectors).data)
+        yield resp
+        token = getattr(resp.metadata, "_continue", None)
+        if not isinstance(token, str) or not token:
+            return
+
+
+def list_items(list_fn, page_size=DEFAULT_PAGE_SIZE, decode=None, **selectors):
+    for page in list_pages(list_fn, page_size, decode, **selectors):
+        yield from page.items
+
+
+class _Store:
+    def __init__(self, kind, list_fn, key_fn, selectors=None, decode_list=None, decode_object=None,
+                 transform=None, finished_fn=None):
+        self.kind = kind
+        self.list_fn = list_fn
+        self.key_fn = key_fn
+        self.decode_list = decode_list
+        self.decode_object = decode_object
+        self.transform = transform
+        self.finished_fn = finished_fn
+        self.selectors = {k: v for k, v in (selectors or {}).items() if v}
+        self.items: Dict[str, object] = {}
+        # Keys of finished objects in the order they finished (dict as an
+        # ordered set), evicted in batches by evict_finished.
+        self.finished: Dict[str, None] = {}
+        self.handlers: List[Callable] = []
+        self.synced = threading.Event()
+        self.watcher = None
+        # Last resource version seen from a listing, event or bookmark; the
+        # watch resumes from here and only a 410 Gone clears it.
+        self.resource_version: Optional[str] = None
+
+
+class ResourceExpired(Exception):
+    pass
+
+
+class RawWatch:
+    # Watch events as parsed JSON dicts, for fast_decode. watch.Watch with
+    # deserialize=False can't report an ERROR event (it reads a raw_object
+    # key it only sets when deserializing), so a 410 would surface as a
+    # KeyError; here ERROR events are yielded like any other.
+
+    def __init__(self):
+        self._stopped = False
+
+    def stream(self, func, deserialize=False, **kwargs):
+        self._stopped = False
+        resp = func(watch=True, _preload_content=False, **kwargs)
+        try:
+            status = getattr(resp, "status", None)
+            if isinstance(status, int) and not 200 <= status <= 299:
+                raise ApiException(status=status, reason=getattr(resp, "reason", None))
+            for line in iter_resp_lines(resp):
+                if self._stopped:
+                    return
+                if line and not line.isspace():
+                    yield json.loads(line)
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    def stop(self):
+        self._stopped = True
+
+
+# Handlers are called as handler(event_type, obj) under the cache lock,
+# so they must be cheap and must not call back into the API. With
+# fast_decode, pods are pod_decode.Pod objects instead of client.V1Pod;
+# pod_transform/node_transform (e.g. records.PodRecord.from_pod) are
+# applied to every object before it is stored or handed to handlers.
+class ClusterCache:
+
+    def __init__(self, v1, resync_period=DEFAULT_RESYNC_PERIOD, watch_factory=watch.Watch,
+                 page_size=DEFAULT_PAGE_SIZE, pod_field_selector=None, pod_label_selector=None,
+                 fast_decode=False, pod_transform=None, node_transform=None,
+                 retry_initial=DEFAULT_RETRY_INITIAL, retry_max=DEFAULT_RETRY_MAX):
+        self.v1 = v1
+        self.resync_period = resync_period
+        self.page_size = page_size
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._watch_factory = watch_factory
+        # Raw events need RawWatch in place of watch.Watch; other factories
+        # (e.g. fake_k8s.FakeWatch) must honour deserialize=False themselves.
+        self._raw_watch_factory = RawWatch if watch_factory is watch.Watch else watch_factory
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pods = _Store("pods", v1.list_pod_for_all_namespaces, pod_key,
+                            {"field_selector": pod_field_selector, "label_selector": pod_label_selector},
+                            decode_list=decode_pod_list if fast_decode else None,
+                            decode_object=decode_pod if fast_decode else None,
+                            transform=pod_transform, finished_fn=_pod_finished)
+        self._nodes = _Store("nodes", v1.list_node, node_key, transform=node_transform)
+
+    def add_pod_handler(self, handler):
+        self._pods.handlers.append(handler)
+
+    def add_node_handler(self, handler):
+        self._nodes.handlers.append(handler)
+
+    def start(self):
+        self._stop.clear()
+        for store in (self._nodes, self._pods):
+            t = threading.Thread(target=self._run, args=(store,), name=f"cache-{store.kind}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        for store in (self._nodes, self._pods):
+            if store.watcher is not None:
+                store.watcher.stop()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for store in (self._nodes, self._pods):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not store.synced.wait(remaining):
+                return False
+        return True
+
+    def has_synced(self) -> bool:
+        return self._nodes.synced.is_set() and self._pods.synced.is_set()
+
+    def list_pods(self):
+        with self._lock:
+            return list(self._pods.items.values())
+
+    def list_nodes(self):
+        with self._lock:
+            return list(self._nodes.items.values())
+
+    def get_pod(self, key):
+        with self._lock:
+            return self._pods.items.get(key)
+
+    def get_node(self, name):
+        with self._lock:
+            return self._nodes.items.get(name)
+
+    def state(self):
+        # (pods, pods version, nodes, nodes version), copied under the lock.
+        with self._lock:
+            return (list(self._pods.items.values()), self._pods.resource_version,
+                    list(self._nodes.items.values()), self._nodes.resource_version)
+
+    def restore(self, pods, pods_version, nodes, nodes_version):
+        # Seeds the stores from saved state before start(). The stores count
+        # as synced straight away and their watches resume from the saved
+        # versions, relisting only if the server has expired them.
+        for store, objs, version in ((self._nodes, nodes, nodes_version), (self._pods, pods, pods_version)):
+            with self._lock:
+                for obj in objs:
+                    obj = store.transform(obj) if store.transform else obj
+                    key = store.key_fn(obj)
+                    event_type = "MODIFIED" if key in store.items else "ADDED"
+                    self._put(store, key, obj)
+                    self._notify(store, event_type, obj)
+            store.resource_version = version
+            store.synced.set()
+
+    def evict_finished(self, limit=DEFAULT_EVICT_BATCH) -> int:
+        # Drops up to limit Succeeded/Failed pods, oldest first, reporting
+        # each as DELETED. Bounded so a burst of finished jobs is cleared
+        # over a few calls instead of stalling the caller.
+        evicted = 0
+        with self._lock:
+            store = self._pods
+            while store.finished and evicted < limit:
+                key = next(iter(store.finished))
+                del store.finished[key]
+                obj = store.items.pop(key, None)
+                if obj is not None:
+                    self._notify(store, "DELETED", obj)
+                    evicted += 1
+        return evicted
+
+    def _run(self, store):
+        # Watches resume from the last resource version seen; a full relist
+        # only happens at startup and when the server says that version is
+        # gone. Other failures retry with jittered exponential backoff so
+        # many schedulers don't reconnect in lockstep after an apiserver blip.
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                if store.resource_version is None:
+                    self._relist(store)
+                self._watch(store)
+                failures = 0
+            except ResourceExpired as e:
+                print(f"Cache {store.kind} resource version expired, relisting: {e}")
+                store.resource_version = None
+            except Exception as e:
+                if isinstance(e, ApiException) and e.status == HTTP_GONE:
+                    print(f"Cache {store.kind} resource version expired, relisting: {e.reason}")
+                    store.resource_version = None
+                    continue
+                delay = self._retry_delay(failures)
+                failures += 1
+                print(f"Cache {store.kind} watch failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+
+    def _retry_delay(self, failures):
+        return random.uniform(0.5, 1.0) * min(self.retry_max, self.retry_initial * 2 ** failures)
+
+    def _relist(self, store):
+        # Pages are applied as they arrive so a full listing is never held
+        # twice; whatever the listing did not mention is deleted at the end.
+        seen = set()
+        resource_version = None
+        for page in list_pages(store.list_fn, self.page_size, store.decode_list, **store.selectors):
+            with self._lock:
+                for obj in page.items:
+                    obj = store.transform(obj) if store.transform else obj
+                    key = store.key_fn(obj)
+                    seen.add(key)
+                    old = store.items.get(key)
+                    if old is not None and _version_of(old) == _version_of(obj):
+                        # Unchanged since we last saw it: no event, so a
+                        # relist doesn't replay every pending pod.
+                        continue
+                    self._put(store, key, obj)
+                    self._notify(store, "ADDED" if old is None else "MODIFIED", obj)
+            resource_version = page.metadata.resource_version
+        with self._lock:
+            for key in [k for k in store.items if k not in seen]:
+                self._notify(store, "DELETED", self._pop(store, key))
+        store.resource_version = resource_version
+        store.synced.set()
+        return resource_version
+
+    def _watch(self, store):
+        # The server closes the watch after resync_period; the caller
+        # reconnects from store.resource_version. Bookmarks keep that
+        # version fresh when nothing matching our selectors changes.
+        raw = store.decode_object is not None
+        store.watcher = self._raw_watch_factory() if raw else self._watch_factory()
+        kwargs = dict(store.selectors, allow_watch_bookmarks=True)
+        if raw:
+            # Events arrive as parsed JSON dicts rather than models.
+            kwargs["deserialize"] = False
+        for event in store.watcher.stream(store.list_fn, resource_version=store.resource_version,
+                                          timeout_seconds=self.resync_period, **kwargs):
+            if self._stop.is_set():
+                store.watcher.stop()
+                return
+            event_type = event["type"]
+            if event_type == "ERROR":
+                status = event.get("raw_object", event.get("object"))
+                if isinstance(status, dict) and status.get("code") == HTTP_GONE:
+                    raise ResourceExpired(status.get("message"))
+                raise RuntimeError(f"watch error: {status}")
+            if event_type == "BOOKMARK":
+                store.resource_version = event["object"]["metadata"]["resourceVersion"]
+                continue
+            obj = store.decode_object(event["object"]) if raw else event["object"]
+            if store.transform:
+                obj = store.transform(obj)
+            self._apply(store, event_type, obj)
+            store.resource_version = _version_of(obj) or store.resource_version
+
+    def _apply(self, store, event_type, obj):
+        key = store.key_fn(obj)
+        with self._lock:
+            if event_type == "DELETED":
+                self._pop(store, key)
+            else:
+                self._put(store, key, obj)
+            self._notify(store, event_type, obj)
+
+    @staticmethod
+    def _put(store, key, obj):
+        store.items[key] = obj
+        if store.finished_fn is not None and store.finished_fn(obj):
+            store.finished.setdefault(key)
+        else:
+            store.finished.pop(key, None)
+
+    @staticmethod
+    def _pop(store, key):
+        store.finished.pop(key, None)
+        return store.items.pop(key, None)
+
+    def _notify(self, store, event_type, obj):
+        for handler in store.handlers:
+            try:
+                handler(event_type, obj)
+            except Exception as e:
+                print(f"Cache {store.kind} handler error: {e}")
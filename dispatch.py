@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+DEFAULT_CONCURRENCY = 16
+
+
+@dataclass
+class CallResult:
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def serial_map(fn: Callable, items: Iterable) -> List[CallResult]:
+    return [Dispatcher._call(fn, item) for item in items]
+
+
+class Dispatcher:
+    # Bounded worker pool for blocking API calls (bindings, evictions).
+    # map() returns one CallResult per item, in input order, and never raises
+    # for a failed call so callers can do their own group-level accounting.
+
+    def __init__(self, max_workers=DEFAULT_CONCURRENCY):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+
+    def map(self, fn: Callable, items: Iterable) -> List[CallResult]:
+        items = list(items)
+        if len(items) <= 1:
+            return [self._call(fn, item) for item in items]
+        futures = [self._pool.submit(self._call, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    @staticmethod
+    def _call(fn, item):
+        try:
+            return CallResult(item=item, value=fn(item))
+        except Exception as e:
+            return CallResult(item=item, error=e)
@@ -0,0 +1,427 @@
+import bisect
+import copy
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+
+# In-process stand-in for the parts of CoreV1Api the scheduler uses: pod and
+# node list/watch, binding and eviction. Stored objects are never mutated in
+# place; every change stores a fresh copy and appends a watch event.
+# FakePolicyV1Api lists the disruption budgets added to a FakeCoreV1Api;
+# FakeApiServer serves one over HTTP so scheduler processes can share it.
+
+_SERIALIZER = client.ApiClient()
+
+_FIELD_GETTERS = {
+    "metadata.name": lambda o: o.metadata.name,
+    "metadata.namespace": lambda o: o.metadata.namespace or "",
+    "spec.nodeName": lambda o: (o.spec.node_name or "") if o.spec else "",
+    "spec.schedulerName": lambda o: (o.spec.scheduler_name or "") if o.spec else "",
+    "status.phase": lambda o: (o.status.phase or "") if o.status else "",
+}
+
+
+def _match_fields(obj, selector):
+    for term in filter(None, (selector or "").split(",")):
+        if "!=" in term:
+            field_name, value = term.split("!=", 1)
+            if _FIELD_GETTERS[field_name](obj) == value:
+                return False
+        else:
+            field_name, value = term.replace("==", "=").split("=", 1)
+            if _FIELD_GETTERS[field_name](obj) != value:
+                return False
+    return True
+
+
+def _match_labels(obj, selector):
+    labels = obj.metadata.labels or {}
+    # Commas inside "key in (a,b)" don't separate terms.
+    for term in filter(None, re.split(r",(?![^(]*\))", selector or "")):
+        if " in (" in term or " notin (" in term:
+            key, op, values = re.match(r"(\S+) (in|notin) \((.*)\)$", term.strip()).groups()
+            if (labels.get(key) in values.split(",")) != (op == "in"):
+                return False
+        elif "!=" in term:
+            key, value = term.split("!=", 1)
+            if labels.get(key) == value:
+                return False
+        elif "=" in term:
+            key, value = term.replace("==", "=").split("=", 1)
+            if labels.get(key) != value:
+                return False
+        elif term.startswith("!"):
+            if term[1:] in labels:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+class _Kind:
+    def __init__(self, name, list_type):
+        self.name = name
+        self.list_type = list_type
+        self.items = {}
+        self.log = []
+
+
+class FakeCoreV1Api:
+    def __init__(self, latency=0.0, eviction_delay=0.0, max_log=100000):
+        self.latency = latency
+        self.eviction_delay = eviction_delay
+        self.max_log = max_log
+        self.calls = Counter()
+        self.bound_at = {}
+        self._cond = threading.Condition()
+        self._resource_version = 0
+        self._compacted = 0
+        self._pods = _Kind("pods", client.V1PodList)
+        self._nodes = _Kind("nodes", client.V1NodeList)
+        self._budgets = []
+
+    # Driver-side helpers: not part of the CoreV1Api surface and not counted.
+
+    def add_node(self, node):
+        self._put(self._nodes, node.metadata.name, node, "ADDED")
+
+    def add_pod(self, pod):
+        self._put(self._pods, self._pod_key(pod.metadata.namespace, pod.metadata.name), pod, "ADDED")
+
+    def add_disruption_budget(self, namespace, match_labels, disruptions_allowed, name=None):
+        # PodDisruptionBudget stand-in: evicting matching pods beyond
+        # disruptions_allowed is refused with 429, as by the eviction API.
+        with self._cond:
+            name = name or f"pdb-{len(self._budgets)}"
+            self._budgets.append([namespace, dict(match_labels), disruptions_allowed, name])
+
+    def remove_pod(self, namespace, name):
+        self._remove(self._pods, self._pod_key(namespace, name))
+
+    def get_pod(self, namespace, name):
+        with self._cond:
+            return self._pods.items.get(self._pod_key(namespace, name))
+
+    def pods(self):
+        with self._cond:
+            return list(self._pods.items.values())
+
+    def compact(self):
+        # Drop the whole event history, as an apiserver does after etcd
+        # compaction; watches from older versions then get 410 Gone.
+        with self._cond:
+            for kind in (self._pods, self._nodes):
+                kind.log.clear()
+            self._compacted = self._resource_version
+
+    # CoreV1Api surface.
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        return self._list(self._pods, "list_pod_for_all_namespaces", **kwargs)
+
+    def list_node(self, **kwargs):
+        return self._list(self._nodes, "list_node", **kwargs)
+
+    def create_namespaced_pod_binding(self, name, namespace, body, **kwargs):
+        self._call("create_namespaced_pod_binding")
+        with self._cond:
+            key = self._pod_key(namespace, name)
+            pod = self._pods.items.get(key)
+            if pod is None:
+                raise ApiException(status=404, reason=f"pod {key} not found")
+            if pod.spec.node_name:
+                raise ApiException(status=409, reason=f"pod {key} is already assigned to node {pod.spec.node_name}")
+            bound = copy.copy(pod)
+            bound.spec = copy.copy(pod.spec)
+            bound.spec.node_name = body.target.name
+            bound.status = client.V1PodStatus(phase="Running")
+            self.bound_at[key] = time.monotonic()
+            self._put(self._pods, key, bound, "MODIFIED")
+
+    def create_namespaced_pod_eviction(self, name, namespace, body, **kwargs):
+        self._call("create_namespaced_pod_eviction")
+        with self._cond:
+            key = self._pod_key(namespace, name)
+            pod = self._pods.items.get(key)
+            if pod is None:
+                raise ApiException(status=404, reason=f"pod {key} not found")
+            labels = pod.metadata.labels or {}
+            budgets = [b for b in self._budgets
+                       if b[0] == (namespace or "default") and all(labels.get(k) == v for k, v in b[1].items())]
+            if any(b[2] <= 0 for b in budgets):
+                raise ApiException(status=429, reason="Cannot evict pod as it would violate the pod's disruption budget.")
+            options = getattr(body, "delete_options", None)
+            if options is not None and options.dry_run:
+                return
+            for budget in budgets:
+                budget[2] -= 1
+            terminating = copy.copy(pod)
+            terminating.metadata = copy.copy(pod.metadata)
+            terminating.metadata.deletion_timestamp = datetime.now(timezone.utc)
+            self._put(self._pods, key, terminating, "MODIFIED")
+        if self.eviction_delay > 0:
+            timer = threading.Timer(self.eviction_delay, self._remove, args=(self._pods, key))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._remove(self._pods, key)
+
+    # Watch support, used through FakeWatch.
+
+    def events_since(self, kind_name, resource_version, timeout, stopped, field_selector=None,
+                     label_selector=None, bookmarks=False):
+        kind = self._pods if kind_name == "pods" else self._nodes
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            since = self._resource_version if resource_version is None else int(resource_version)
+            if since < self._compacted:
+                raise ApiException(status=410, reason="Expired: too old resource version")
+        while not stopped():
+            with self._cond:
+                batch = kind.log[bisect.bisect_right(kind.log, since, key=lambda e: e[0]):]
+                expired = False
+                if not batch:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    expired = remaining is not None and remaining <= 0
+                    if not expired:
+                        self._cond.wait(min(remaining, 0.1) if remaining is not None else 0.1)
+                        continue
+                    # Everything of this kind up to now has been sent.
+                    latest = str(self._resource_version)
+            if expired:
+                if bookmarks:
+                    yield {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": latest}}}
+                return
+            for rv, event_type, obj, previous in batch:
+                since = rv
+                if field_selector or label_selector:
+                    event_type = self._filtered_event(event_type, obj, previous, field_selector, label_selector)
+                    if event_type is None:
+                        continue
+                yield {"type": event_type, "object": obj, "raw_object": None}
+
+    @staticmethod
+    def _filtered_event(event_type, obj, previous, field_selector, label_selector):
+        # As the apiserver does for a filtered watch: an object that starts
+        # matching is ADDED and one that stops matching is DELETED.
+        def matches(o):
+            return o is not None and _match_fields(o, field_selector) and _match_labels(o, label_selector)
+
+        was, now = matches(previous), matches(obj)
+        if event_type == "DELETED":
+            return event_type if was else None
+        if was and now:
+            return "MODIFIED"
+        if now:
+            return "ADDED"
+        return "DELETED" if was else None
+
+    def _list(self, kind, method, field_selector=None, label_selector=None, limit=None,
+              _continue=None, _preload_content=True, **kwargs):
+        self._call(method)
+        with self._cond:
+            items = [o for o in kind.items.values()
+                     if _match_fields(o, field_selector) and _match_labels(o, label_selector)]
+            resource_version = str(self._resource_version)
+        start = int(_continue or 0)
+        end = len(items) if not limit else min(len(items), start + limit)
+        token = str(end) if end < len(items) else None
+        meta = client.V1ListMeta(resource_version=resource_version, _continue=token)
+        resp = kind.list_type(metadata=meta, items=items[start:end])
+        if not _preload_content:
+            # Like the real client: an HTTP response whose body is the JSON.
+            return SimpleNamespace(data=json.dumps(_SERIALIZER.sanitize_for_serialization(resp)).encode())
+        return resp
+
+    def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _put(self, kind, key, obj, event_type):
+        with self._cond:
+            self._resource_version += 1
+            obj = copy.copy(obj)
+            obj.metadata = copy.copy(obj.metadata)
+            obj.metadata.resource_version = str(self._resource_version)
+            previous = kind.items.get(key)
+            kind.items[key] = obj
+            self._log(kind, event_type, obj, previous)
+
+    def _remove(self, kind, key):
+        with self._cond:
+            obj = kind.items.pop(key, None)
+            if obj is None:
+                return
+            self._resource_version += 1
+            self._log(kind, "DELETED", obj, obj)
+
+    def _log(self, kind, event_type, obj, previous):
+        kind.log.append((self._resource_version, event_type, obj, previous))
+        if len(kind.log) > 2 * self.max_log:
+            self._compacted = kind.log[-self.max_log - 1][0]
+            del kind.log[:-self.max_log]
+        self._cond.notify_all()
+
+    @staticmethod
+    def _pod_key(namespace, name):
+        return f"{namespace or 'default'}/{name}"
+
+
+class FakeWatch:
+    # Drop-in for kubernetes.watch.Watch against a FakeCoreV1Api.
+
+    def __init__(self, api):
+        self.api = api
+        self._stopped = False
+
+    def stream(self, func, resource_version=None, timeout_seconds=None, field_selector=None,
+               label_selector=None, deserialize=True, allow_watch_bookmarks=False, **kwargs):
+        self._stopped = False
+        kind = "nodes" if func.__name__ == "list_node" else "pods"
+        self.api._call(f"watch_{kind}")
+        for event in self.api.events_since(kind, resource_version, timeout_seconds, lambda: self._stopped,
+                                           field_selector, label_selector, allow_watch_bookmarks):
+            if not deserialize and event["type"] != "BOOKMARK":
+                event = {"type": event["type"], "object": _SERIALIZER.sanitize_for_serialization(event["object"])}
+            yield event
+
+    def stop(self):
+        self._stopped = True
+
+
+class FakePolicyV1Api:
+    def __init__(self, core: FakeCoreV1Api):
+        self.core = core
+
+    def list_namespaced_pod_disruption_budget(self, namespace, **kwargs):
+        self.core._call("list_namespaced_pod_disruption_budget")
+        with self.core._cond:
+            budgets = [client.V1PodDisruptionBudget(
+                metadata=client.V1ObjectMeta(name=name, namespace=ns),
+                spec=client.V1PodDisruptionBudgetSpec(selector=client.V1LabelSelector(match_labels=dict(labels))),
+                status=client.V1PodDisruptionBudgetStatus(current_healthy=0, desired_healthy=0, expected_pods=0,
+                                                          disruptions_allowed=max(allowed, 0)))
+                for ns, labels, allowed, name in self.core._budgets if ns == namespace]
+        return client.V1PodDisruptionBudgetList(items=budgets)
+
+
+_PATHS = {"/api/v1/pods": "pods", "/api/v1/nodes": "nodes"}
+_POD_ACTION = re.compile(r"^/api/v1/namespaces/([^/]+)/pods/([^/]+)/(binding|eviction)$")
+
+
+class FakeApiServer:
+    # The FakeCoreV1Api surface over HTTP, enough for the kubernetes client:
+    # pod and node list/watch (newline-delimited events, ERROR on 410),
+    # binding and eviction. Each request is served on its own thread.
+
+    def __init__(self, api: FakeCoreV1Api, host="127.0.0.1", port=0):
+        self.api = api
+        self._server = ThreadingHTTPServer((host, port), _ApiHandler)
+        self._server.daemon_threads = True
+        self._server.api = api
+        self._server.stopping = threading.Event()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-apiserver", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so watches can be chunked: the client only hands on what a
+    # chunk completes, as it does with a real apiserver.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        kind = _PATHS.get(url.path)
+        if kind is None:
+            return self._status(404, "NotFound", url.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        selectors = {"field_selector": query.get("fieldSelector"), "label_selector": query.get("labelSelector")}
+        if query.get("watch") == "true":
+            return self._watch(kind, query, selectors)
+        list_fn = self.server.api.list_pod_for_all_namespaces if kind == "pods" else self.server.api.list_node
+        resp = list_fn(limit=int(query.get("limit", 0)) or None, _continue=query.get("continue"),
+                       _preload_content=False, **selectors)
+        self._send(200, resp.data)
+
+    def do_POST(self):
+        match = _POD_ACTION.match(urlparse(self.path).path)
+        if match is None:
+            return self._status(404, "NotFound", self.path)
+        namespace, name, action = match.groups()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        try:
+            if action == "binding":
+                target = SimpleNamespace(name=body["target"]["name"])
+                self.server.api.create_namespaced_pod_binding(name, namespace, SimpleNamespace(target=target))
+            else:
+                options = body.get("deleteOptions") or {}
+                self.server.api.create_namespaced_pod_eviction(
+                    name, namespace, SimpleNamespace(delete_options=SimpleNamespace(dry_run=options.get("dryRun"))))
+        except ApiException as e:
+            return self._status(e.status, e.reason, e.reason)
+        self._send(201, json.dumps(body).encode())
+
+    def _watch(self, kind, query, selectors):
+        self.server.api._call(f"watch_{kind}")
+        timeout = query.get("timeoutSeconds")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            try:
+                for event in self.server.api.events_since(
+                        kind, query.get("resourceVersion") or None, float(timeout) if timeout else None,
+                        self.server.stopping.is_set, selectors["field_selector"], selectors["label_selector"],
+                        query.get("allowWatchBookmarks") == "true"):
+                    obj = event["object"]
+                    line = {"type": event["type"],
+                            "object": obj if isinstance(obj, dict) else _SERIALIZER.sanitize_for_serialization(obj)}
+                    self._chunk(json.dumps(line).encode() + b"\n")
+            except ApiException as e:
+                status = {"kind": "Status", "status": "Failure", "code": e.status, "reason": "Expired",
+                          "message": e.reason}
+                self._chunk(json.dumps({"type": "ERROR", "object": status}).encode() + b"\n")
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the watcher went away
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _status(self, code, reason, message):
+        status = {"kind": "Status", "apiVersion": "v1", "status": "Failure", "code": code, "reason": reason,
+                  "message": message}
+        self._send(code, json.dumps(status).encode())
+
+    def _send(self, code, data):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
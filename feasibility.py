@@ -0,0 +1,282 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Node feasibility for a pod: nodeSelector, required node affinity, taints
+# and cordoned nodes. Pods carry their constraints in a normalized,
+# hashable form; nodes are indexed by label and taint into int bitsets (one
+# bit per node), so a pod's feasible set is a few ANDs and ORs instead of
+# a predicate per node.
+
+HARD_TAINT_EFFECTS = ("NoSchedule", "NoExecute")
+_NAME_FIELD = "metadata.name"
+
+
+@dataclass(frozen=True)
+class Constraints:
+    # node_selector: ((key, value), ...)
+    # affinity: required terms, ORed; each a tuple of (key, operator,
+    #   values) requirements, ANDed. Field requirements use "metadata.name".
+    #   None means no required affinity.
+    # tolerations: ((key, operator, value, effect), ...)
+    node_selector: tuple = ()
+    affinity: Optional[tuple] = None
+    tolerations: tuple = ()
+
+    def fields(self) -> tuple:
+        return (self.node_selector, self.affinity, self.tolerations)
+
+
+class Constrained:
+    # Base for pod views that carry their constraints precomputed
+    # (records.PodRecord).
+    __slots__ = ()
+
+
+_shared: Dict[tuple, Constraints] = {}
+
+
+def shared_constraints(fields) -> Constraints:
+    # Pods of one workload have identical constraints; keep one copy.
+    constraints = _shared.get(fields)
+    if constraints is None:
+        constraints = _shared[fields] = Constraints(*fields)
+    return constraints
+
+
+def _get(obj, name, camel):
+    # Client models have snake_case attributes, pod_decode keeps raw JSON.
+    if isinstance(obj, dict):
+        return obj.get(camel)
+    return getattr(obj, name, None)
+
+
+def _items(value):
+    return value if isinstance(value, (list, tuple)) else ()
+
+
+def _requirements(term):
+    reqs = []
+    for attr, camel, field in (("match_expressions", "matchExpressions", False),
+                               ("match_fields", "matchFields", True)):
+        for r in _items(_get(term, attr, camel)):
+            key = _get(r, "key", "key")
+            reqs.append((_NAME_FIELD if field and key == _NAME_FIELD else key, _get(r, "operator", "operator"),
+                         tuple(_items(_get(r, "values", "values")))))
+    return tuple(reqs)
+
+
+def constraints_of(pod) -> Optional[Constraints]:
+    # None for a pod with no nodeSelector, required affinity or tolerations.
+    if isinstance(pod, Constrained):
+        return pod.constraints
+    spec = pod.spec
+    if spec is None:
+        return None
+    selector = _get(spec, "node_selector", "nodeSelector")
+    selector = tuple(sorted(selector.items())) if isinstance(selector, dict) else ()
+    node_affinity = _get(_get(spec, "affinity", "affinity"), "node_affinity", "nodeAffinity")
+    required = _get(node_affinity, "required_during_scheduling_ignored_during_execution",
+                    "requiredDuringSchedulingIgnoredDuringExecution")
+    terms = _get(required, "node_selector_terms", "nodeSelectorTerms") if required is not None else None
+    affinity = tuple(_requirements(t) for t in terms) if isinstance(terms, (list, tuple)) else None
+    tolerations = tuple((_get(t, "key", "key"), _get(t, "operator", "operator"), _get(t, "value", "value"),
+                         _get(t, "effect", "effect"))
+                        for t in _items(_get(spec, "tolerations", "tolerations")))
+    if not selector and affinity is None and not tolerations:
+        return None
+    return shared_constraints((selector, affinity, tolerations))
+
+
+def tolerates(tolerations, taint) -> bool:
+    key, value, effect = taint
+    for t_key, operator, t_value, t_effect in tolerations:
+        if t_effect and t_effect != effect:
+            continue
+        if operator == "Exists":
+            if not t_key or t_key == key:
+                return True
+        elif t_key == key and (t_value or "") == (value or ""):
+            return True
+    return False
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class NodeLabelIndex:
+    # Inverted indexes from label and taint to node bitsets, updated from
+    # node events. Rows of deleted nodes are reused. Feasible masks are
+    # memoized per Constraints until the next node change.
+
+    def __init__(self):
+        self._rows: Dict[str, int] = {}
+        self._names: List[Optional[str]] = []
+        self._spare: List[int] = []
+        self._node_labels: Dict[str, Dict[str, str]] = {}
+        self._node_taints: Dict[str, Tuple[tuple, ...]] = {}
+        self._by_label: Dict[Tuple[str, str], int] = {}
+        self._by_key: Dict[str, int] = {}
+        self._by_taint: Dict[tuple, int] = {}
+        self._unschedulable = 0
+        self._all = 0
+        self.free = 0
+        self._memo: Dict[Optional[Constraints], int] = {}
+
+    def on_node_event(self, event_type, node):
+        name = node.metadata.name
+        self._memo.clear()
+        if name in self._rows:
+            self._unindex(name)
+        if event_type == "DELETED":
+            # Re-indexing keeps the free bit; only a deleted node loses it.
+            row = self._rows.pop(name, None)
+            if row is not None:
+                self.free &= ~(1 << row)
+                self._names[row] = None
+                self._spare.append(row)
+            return
+        bit = 1 << self._row(name)
+        labels = getattr(node.metadata, "labels", None)
+        labels = dict(labels) if isinstance(labels, dict) else {}
+        spec = getattr(node, "spec", None)
+        taints = tuple((t.key, t.value, t.effect) for t in _items(getattr(spec, "taints", None))
+                       if t.effect in HARD_TAINT_EFFECTS)
+        self._node_labels[name] = labels
+        self._node_taints[name] = taints
+        for key, value in labels.items():
+            self._by_label[(key, value)] = self._by_label.get((key, value), 0) | bit
+            self._by_key[key] = self._by_key.get(key, 0) | bit
+        for taint in taints:
+            self._by_taint[taint] = self._by_taint.get(taint, 0) | bit
+        if getattr(spec, "unschedulable", None) is True:
+            self._unschedulable |= bit
+        self._all |= bit
+
+    def set_free(self, name, free):
+        row = self._rows.get(name)
+        if row is None:
+            if not free:
+                return
+            row = self._row(name)
+        self.free = self.free | 1 << row if free else self.free & ~(1 << row)
+
+    def restricts(self, constraints) -> bool:
+        # False when every node is feasible for these constraints.
+        return constraints is not None or bool(self._unschedulable or self._by_taint)
+
+    def feasible(self, constraints: Optional[Constraints]) -> int:
+        mask = self._memo.get(constraints)
+        if mask is None:
+            mask = self._memo[constraints] = self._compute(constraints)
+        return mask
+
+    def contains(self, mask, name) -> bool:
+        row = self._rows.get(name)
+        return row is not None and (mask >> row) & 1 == 1
+
+    def mask_of(self, names) -> int:
+        mask = 0
+        for name in names:
+            row = self._rows.get(name)
+            if row is not None:
+                mask |= 1 << row
+        return mask
+
+    def lowest(self, mask, count) -> List[str]:
+        names = []
+        while mask and len(names) < count:
+            low = mask & -mask
+            names.append(self._names[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    def names(self, mask) -> List[str]:
+        digits = bin(mask)[:1:-1]
+        names = []
+        row = digits.find("1")
+        while row >= 0:
+            names.append(self._names[row])
+            row = digits.find("1", row + 1)
+        return names
+
+    def _compute(self, constraints):
+        mask = self._all & ~self._unschedulable
+        tolerations = constraints.tolerations if constraints is not None else ()
+        for taint, nodes in self._by_taint.items():
+            if not tolerates(tolerations, taint):
+                mask &= ~nodes
+        if constraints is None:
+            return mask
+        for pair in constraints.node_selector:
+            mask &= self._by_label.get(pair, 0)
+        if constraints.affinity is not None:
+            terms = 0
+            for term in constraints.affinity:
+                terms |= self._term(term)
+            mask &= terms
+        return mask
+
+    def _term(self, requirements):
+        if not requirements:
+            return 0
+        mask = self._all
+        for key, operator, values in requirements:
+            mask &= self._requirement(key, operator, values)
+        return mask
+
+    def _requirement(self, key, operator, values):
+        if key == _NAME_FIELD:
+            matched = 0
+            for name in values:
+                row = self._rows.get(name)
+                if row is not None:
+                    matched |= 1 << row
+        elif operator in ("In", "NotIn"):
+            matched = 0
+            for value in values:
+                matched |= self._by_label.get((key, value), 0)
+        elif operator in ("Exists", "DoesNotExist"):
+            matched = self._by_key.get(key, 0)
+        elif operator in ("Gt", "Lt") and len(values) == 1 and _as_int(values[0]) is not None:
+            bound = _as_int(values[0])
+            matched = 0
+            for (label, value), nodes in self._by_label.items():
+                number = _as_int(value) if label == key else None
+                if number is not None and (number > bound if operator == "Gt" else number < bound):
+                    matched |= nodes
+        else:
+            return 0
+        if operator in ("NotIn", "DoesNotExist"):
+            return self._all & ~matched
+        return matched
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is None:
+            row = self._spare.pop() if self._spare else len(self._names)
+            if row == len(self._names):
+                self._names.append(name)
+            else:
+                self._names[row] = name
+            self._rows[name] = row
+        return row
+
+    def _unindex(self, name):
+        clear = ~(1 << self._rows[name])
+        for key, value in self._node_labels.pop(name, {}).items():
+            self._by_label[(key, value)] &= clear
+            if not self._by_label[(key, value)]:
+                del self._by_label[(key, value)]
+            self._by_key[key] &= clear
+            if not self._by_key[key]:
+                del self._by_key[key]
+        for taint in self._node_taints.pop(name, ()):
+            self._by_taint[taint] &= clear
+            if not self._by_taint[taint]:
+                del self._by_taint[taint]
+        self._unschedulable &= clear
+        self._all &= clear
@@ -1,9 +1,16 @@
 from __future__ import annotations
+import bisect
+import functools
+import heapq
+import threading
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Iterable, Set
+from typing import Dict, List, Optional, Iterable, Set, Tuple
 from kubernetes import client
+from cache import ACTIVE_POD_FIELD_SELECTOR, list_items, pod_key
+from dispatch import serial_map
 from pod_utils import (
-    is_terminating, is_terminated_phase,
+    is_evictable, is_terminated_phase,
     should_skip_pod_for_scheduling
 )
 
@@ -17,6 +24,7 @@ class GroupSelector:
     group_annotation: str = DEFAULT_GROUP_ANNOTATION
     priority_annotation: str = DEFAULT_PRIORITY_ANNOTATION
     allowed_statuses: Optional[Set[str]] = None
+    scheduler_name: Optional[str] = None
 
 
 @dataclass
@@ -27,31 +35,211 @@ class PodGroup:
     priority: int = 0
 
 
-class PodGroupDiscoverer:
-    def __init__(self, v1: client.CoreV1Api):
-        self.v1 = v1
+def _group_order(g):
+    return (g.priority, -g.size)
+
+
+def _ordered(groups, limit):
+    # Cheapest first; with a limit only that many are partially ordered.
+    if limit is not None:
+        return heapq.nsmallest(limit, groups, key=_group_order)
+    groups.sort(key=_group_order)
+    return groups
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_priority(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
 
-    def groups(self, selector):
-        pods = self._list_pods()
-        pods = self._filter_system_pods(pods)
-        pods = self._filter_status_and_scheduler(pods, selector)
-        pods = self._filter_priorities(pods, selector)
-        groups = self._group_pods(pods, selector)
-        groups = self._compute_group_priority(groups, selector)
 
-        groups.sort(key=lambda g: (g.priority, -g.size))
-        return groups
+class _Gang:
+    def __init__(self):
+        self.members: Dict[str, object] = {}
+        self.priorities: Counter = Counter()
+        # Members groups() considers at all: not system/DaemonSet pods and
+        # not Succeeded/Failed, with their priority.
+        self.eligible: Dict[str, Tuple[object, int]] = {}
+        self.eligible_priorities: Counter = Counter()
+        self.min_priority: Optional[int] = None
+
+
+class GangIndex:
+    # Gang id -> members, kept up to date from cache pod events so
+    # get_group is O(group size). Gangs with eligible members are also kept
+    # in a list sorted by their lowest member priority, so the
+    # max_priority queries preemption makes bisect straight to the k
+    # gangs that can match. Pods without a group annotation are not
+    # indexed; preemption never picks them.
+
+    def __init__(self, group_annotation=DEFAULT_GROUP_ANNOTATION,
+                 priority_annotation=DEFAULT_PRIORITY_ANNOTATION):
+        self.group_annotation = group_annotation
+        self.priority_annotation = priority_annotation
+        self._lock = threading.RLock()
+        self._gangs: Dict[str, _Gang] = {}
+        self._gang_of: Dict[str, str] = {}
+        self._by_min_priority: List[Tuple[int, str]] = []
+
+    def on_pod_event(self, event_type, pod):
+        key = pod_key(pod)
+        gang_id = None if event_type == "DELETED" else PodGroupDiscoverer._group_of(pod, self.group_annotation)
+        with self._lock:
+            old = self._gang_of.pop(key, None)
+            if old is not None:
+                self._remove(old, key)
+            if gang_id is not None:
+                self._gang_of[key] = gang_id
+                self._add(gang_id, key, pod)
+
+    def serves(self, selector) -> bool:
+        return (selector.allowed_statuses is None
+                and selector.group_annotation == self.group_annotation
+                and selector.priority_annotation == self.priority_annotation)
+
+    def get_group(self, gang_id) -> Optional[PodGroup]:
+        with self._lock:
+            gang = self._gangs.get(gang_id)
+            if gang is None:
+                return None
+            return PodGroup(gang_id=gang_id, pods=list(gang.members.values()), size=len(gang.members),
+                            priority=max(gang.priorities))
+
+    def groups(self, selector, limit=None) -> List[PodGroup]:
+        ceiling = selector.max_priority
+        with self._lock:
+            end = (len(self._by_min_priority) if ceiling is None
+                   else bisect.bisect_right(self._by_min_priority, ceiling, key=lambda e: e[0]))
+            out = []
+            for _, gang_id in self._by_min_priority[:end]:
+                gang = self._gangs[gang_id]
+                if ceiling is None and not selector.scheduler_name:
+                    pods = [pod for pod, _ in gang.eligible.values()]
+                    out.append(PodGroup(gang_id=gang_id, pods=pods, size=len(pods),
+                                        priority=max(gang.eligible_priorities)))
+                    continue
+                pods, priority = [], None
+                for pod, prio in gang.eligible.values():
+                    if ceiling is not None and prio > ceiling:
+                        continue
+                    if selector.scheduler_name and getattr(pod.spec, "scheduler_name", None) != selector.scheduler_name:
+                        continue
+                    pods.append(pod)
+                    priority = prio if priority is None else max(priority, prio)
+                if pods:
+                    out.append(PodGroup(gang_id=gang_id, pods=pods, size=len(pods), priority=priority))
+        return _ordered(out, limit)
+
+    def _add(self, gang_id, key, pod):
+        gang = self._gangs.get(gang_id)
+        if gang is None:
+            gang = self._gangs[gang_id] = _Gang()
+        prio = PodGroupDiscoverer._priority_of(pod, self.priority_annotation)
+        gang.members[key] = pod
+        gang.priorities[prio] += 1
+        if not should_skip_pod_for_scheduling(pod) and not is_terminated_phase(getattr(pod.status, "phase", None)):
+            gang.eligible[key] = (pod, prio)
+            gang.eligible_priorities[prio] += 1
+            self._reposition(gang_id, gang)
+
+    def _remove(self, gang_id, key):
+        gang = self._gangs[gang_id]
+        pod = gang.members.pop(key)
+        self._decrement(gang.priorities, PodGroupDiscoverer._priority_of(pod, self.priority_annotation))
+        entry = gang.eligible.pop(key, None)
+        if entry is not None:
+            self._decrement(gang.eligible_priorities, entry[1])
+            self._reposition(gang_id, gang)
+        if not gang.members:
+            del self._gangs[gang_id]
+
+    def _reposition(self, gang_id, gang):
+        lowest = min(gang.eligible_priorities) if gang.eligible_priorities else None
+        if lowest == gang.min_priority:
+            return
+        if gang.min_priority is not None:
+            entry = (gang.min_priority, gang_id)
+            del self._by_min_priority[bisect.bisect_left(self._by_min_priority, entry)]
+        if lowest is not None:
+            bisect.insort(self._by_min_priority, (lowest, gang_id))
+        gang.min_priority = lowest
+
+    @staticmethod
+    def _decrement(counter, value):
+        counter[value] -= 1
+        if not counter[value]:
+            del counter[value]
 
-    def _list_pods(self):
-        return self.v1.list_pod_for_all_namespaces().items
 
-    def _filter_system_pods(self, pods):
-        out = []
+class PodGroupDiscoverer:
+    # group_label names a label that mirrors the group annotation on every
+    # pod; when set, get_group asks the apiserver for just that group.
+    def __init__(self, v1: client.CoreV1Api, cache=None, dispatcher=None, group_label=None,
+                 index: Optional[GangIndex] = None):
+        self.v1 = v1
+        self.cache = cache
+        self.dispatcher = dispatcher
+        self.group_label = group_label
+        self.index = index
+
+    def groups(self, selector, pods: Optional[Iterable] = None, limit: Optional[int] = None):
+        # pods may be any iterable, e.g. a generator over LIST pages; it is
+        # consumed once. With limit, only the limit cheapest groups come back.
+        if pods is None:
+            if self.index is not None and self.index.serves(selector):
+                return self.index.groups(selector, limit)
+            pods = self._list_pods(field_selector=self._field_selector(selector))
+        return _ordered(self._aggregate(pods, selector), limit)
+
+    def _aggregate(self, pods, selector):
+        # One pass: each pod's eligibility, priority and group are worked
+        # out once and folded straight into its group.
+        statuses = selector.allowed_statuses
+        ceiling = selector.max_priority
+        scheduler_name = selector.scheduler_name
+        groups: Dict[Optional[str], PodGroup] = {}
         for p in pods:
-            if not self._should_skip_eviction(p):
-                out.append(p)
-        return out
+            if self._should_skip_eviction(p):
+                continue
+            if scheduler_name and getattr(p.spec, "scheduler_name", None) != scheduler_name:
+                continue
+            phase = getattr(p.status, "phase", None)
+            if (phase not in statuses) if statuses is not None else is_terminated_phase(phase):
+                continue
+            prio = self._priority_of(p, selector.priority_annotation)
+            if ceiling is not None and prio > ceiling:
+                continue
+            gid = self._group_of(p, selector.group_annotation)
+            group = groups.get(gid)
+            if group is None:
+                groups[gid] = PodGroup(gang_id=gid, pods=[p], size=1, priority=prio)
+            else:
+                group.pods.append(p)
+                group.size += 1
+                if prio > group.priority:
+                    group.priority = prio
+        return list(groups.values())
+
+    def _list_pods(self, field_selector=None, label_selector=None):
+        if self.cache is not None:
+            return self.cache.list_pods()
+        return list_items(self.v1.list_pod_for_all_namespaces,
+                          field_selector=field_selector, label_selector=label_selector)
 
+    @staticmethod
+    def _field_selector(selector):
+        # Server-side half of the _aggregate filters; the local ones
+        # still run, so this only has to narrow, not be exact.
+        terms = []
+        if selector.allowed_statuses is None:
+            terms.append(ACTIVE_POD_FIELD_SELECTOR)
+        elif len(selector.allowed_statuses) == 1:
+            terms.append(f"status.phase={next(iter(selector.allowed_statuses))}")
+        if selector.scheduler_name:
+            terms.append(f"spec.schedulerName={selector.scheduler_name}")
+        return ",".join(terms) or None
 
     @staticmethod
     def _priority_of(p, priority_annotation):
@@ -59,57 +247,18 @@ class PodGroupDiscoverer:
             return p.spec.priority
         ann = (p.metadata.annotations or {}).get(priority_annotation)
         if ann is not None:
-            try:
-                return int(ann)
-            except ValueError:
-                return 0
+            return _parse_priority(ann)
         return 0
 
     @staticmethod
     def _group_of(p, group_annotation):
         return (p.metadata.annotations or {}).get(group_annotation)
 
-    def _filter_status_and_scheduler(self, pods, selector):
-        out = []
-        for p in pods:
-            phase = getattr(p.status, "phase", None)
-            if selector.allowed_statuses is None:
-                if phase not in ("Succeeded", "Failed"):
-                    out.append(p)
-            else:
-                if phase in selector.allowed_statuses:
-                    out.append(p)
-        return out
-
-    def _filter_priorities(self, pods, selector):
-        out = []
-        for p in pods:
-            prio = self._priority_of(p, selector.priority_annotation)
-            if selector.max_priority is not None and prio > selector.max_priority:
-                continue
-            out.append(p)
-        return out
-
-    def _group_pods(self, pods, selector):
-        groups = {}
-        singles = []
-
-        for p in pods:
-            gid = self._group_of(p, selector.group_annotation)
-            groups.setdefault(gid, []).append(p)
-
-        agg = [PodGroup(gang_id=gid, pods=pl, size=len(pl)) for gid, pl in groups.items()]
-        agg.extend(singles)
-        return agg
-
-    def _compute_group_priority(self, groups, selector):
-        for g in groups:
-            prios = [self._priority_of(p, selector.priority_annotation) for p in g.pods]
-            g.priority = max(prios) if prios else 0
-        return groups
-
     def get_group(self, gang_id):
-        pods = self._list_pods()
+        if self.index is not None:
+            return self.index.get_group(gang_id)
+        label_selector = f"{self.group_label}={gang_id}" if self.group_label else None
+        pods = self._list_pods(label_selector=label_selector)
         group_pods = []
 
         for p in pods:
@@ -129,35 +278,51 @@ class PodGroupDiscoverer:
         return should_skip_pod_for_scheduling(p)
 
     def preempt_group(self, gang_id, grace_period_seconds=0, use_eviction=True):
-        group = self.get_group(gang_id)
-        if not group:
-            return
-
-        count = 0
-        for pod in group.pods:
-            phase = getattr(pod.status, "phase", None)
-            if is_terminating(pod) or is_terminated_phase(phase):
+        return self.preempt_groups([gang_id], grace_period_seconds, use_eviction).get(gang_id)
+
+    def preempt_groups(self, gang_ids, grace_period_seconds=0, use_eviction=True, dry_run=False):
+        # Evictions for all groups go out in one batch; the result maps each
+        # gang id to its evicted pod count, or None if the group is unknown.
+        # With dry_run the apiserver only checks them (disruption budgets
+        # included) and nothing is evicted.
+        counts = {}
+        victims = []
+        for gang_id in gang_ids:
+            group = self.get_group(gang_id)
+            if not group:
+                counts[gang_id] = None
                 continue
 
-            if self._should_skip_eviction(pod):
-                continue
+            counts[gang_id] = 0
+            for pod in group.pods:
+                if is_evictable(pod):
+                    victims.append((gang_id, pod))
 
-            namespace = pod.metadata.namespace
-            name = pod.metadata.name
+        if not use_eviction:
+            return counts
 
-            if use_eviction:
-                success = self._try_eviction(name, namespace, grace_period_seconds)
-                if success:
-                    count += 1
+        def evict(victim):
+            pod = victim[1]
+            return self._try_eviction(pod.metadata.name, pod.metadata.namespace, grace_period_seconds, dry_run)
+
+        dispatch = self.dispatcher.map if self.dispatcher is not None else serial_map
+        for result in dispatch(evict, victims):
+            gang_id, pod = result.item
+            if result.ok and result.value:
+                counts[gang_id] += 1
+            else:
+                verb = "would be refused" if dry_run else "failed"
+                print(f"Eviction {verb} for {pod.metadata.namespace}/{pod.metadata.name} (group: {gang_id})")
 
-        return count
+        return counts
 
 
-    def _try_eviction(self, name, namespace, grace_period_seconds):
+    def _try_eviction(self, name, namespace, grace_period_seconds, dry_run=False):
         try:
             eviction = client.V1Eviction(
                 metadata=client.V1ObjectMeta(name=name, namespace=namespace),
-                delete_options=client.V1DeleteOptions(grace_period_seconds=grace_period_seconds)
+                delete_options=client.V1DeleteOptions(grace_period_seconds=grace_period_seconds,
+                                                      dry_run=["All"] if dry_run else None)
             )
             self.v1.create_namespaced_pod_eviction(
                 name=name,
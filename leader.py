@@ -0,0 +1,251 @@
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+
+DEFAULT_LEASE_DURATION = 15.0
+DEFAULT_RENEW_INTERVAL = 5.0
+DEFAULT_LEASE_NAME = "foobar-scheduler"
+
+# Active/standby replicas: every replica runs the cache so its state stays
+# warm, and only the holder of the lease schedules. A lease backend offers
+# try_acquire(identity, duration, now) -> bool, which takes the lease if it
+# is free or expired and renews it if identity already holds it, and
+# release(identity).
+
+
+def default_identity():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class LeaseRecord:
+    holder: Optional[str] = None
+    renewed_at: float = 0.0
+    duration: float = 0.0
+    transitions: int = 0
+
+    def held_by_other(self, identity, now):
+        return self.holder not in (None, identity) and now < self.renewed_at + self.duration
+
+    def take(self, identity, duration, now):
+        if self.holder != identity:
+            self.transitions += 1
+        self.holder = identity
+        self.renewed_at = now
+        self.duration = duration
+
+
+class InMemoryLease:
+    # Shared by replicas in one process; for tests and benchmarks.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.record = LeaseRecord()
+
+    def try_acquire(self, identity, duration, now) -> bool:
+        with self._lock:
+            if self.record.held_by_other(identity, now):
+                return False
+            self.record.take(identity, duration, now)
+            return True
+
+    def release(self, identity):
+        with self._lock:
+            if self.record.holder == identity:
+                self.record.holder = None
+
+
+class FileLease:
+    # Lease kept as JSON in a file on storage shared by the replicas,
+    # updated under an exclusive flock.
+
+    def __init__(self, path):
+        self.path = path
+
+    def try_acquire(self, identity, duration, now) -> bool:
+        with self._locked() as f:
+            record = self._read(f)
+            if record.held_by_other(identity, now):
+                return False
+            record.take(identity, duration, now)
+            self._write(f, record)
+            return True
+
+    def release(self, identity):
+        with self._locked() as f:
+            record = self._read(f)
+            if record.holder == identity:
+                record.holder = None
+                self._write(f, record)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(f):
+        f.seek(0)
+        data = f.read()
+        try:
+            return LeaseRecord(**json.loads(data)) if data else LeaseRecord()
+        except (ValueError, TypeError):
+            return LeaseRecord()
+
+    @staticmethod
+    def _write(f, record):
+        f.seek(0)
+        f.truncate()
+        json.dump(asdict(record), f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class KubernetesLease:
+    # coordination.k8s.io/v1 Lease. Updates carry the resourceVersion that
+    # was read, so two replicas racing for an expired lease cannot both win:
+    # the loser gets 409 Conflict.
+
+    def __init__(self, name=DEFAULT_LEASE_NAME, namespace="kube-system", api=None):
+        self.name = name
+        self.namespace = namespace
+        self.api = api or client.CoordinationV1Api()
+
+    def try_acquire(self, identity, duration, now) -> bool:
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            return self._create(identity, duration, now)
+
+        spec = lease.spec
+        renewed = spec.renew_time.timestamp() if spec.renew_time else 0.0
+        record = LeaseRecord(holder=spec.holder_identity, renewed_at=renewed,
+                             duration=spec.lease_duration_seconds or 0,
+                             transitions=spec.lease_transitions or 0)
+        if record.held_by_other(identity, now):
+            return False
+        if record.holder != identity:
+            spec.acquire_time = _timestamp(now)
+        record.take(identity, duration, now)
+        spec.holder_identity = identity
+        spec.lease_duration_seconds = int(duration)
+        spec.renew_time = _timestamp(now)
+        spec.lease_transitions = record.transitions
+        try:
+            self.api.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def release(self, identity):
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+            if lease.spec.holder_identity != identity:
+                return
+            lease.spec.holder_identity = None
+            self.api.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            print(f"Failed to release lease {self.namespace}/{self.name}: {e.reason}")
+
+    def _create(self, identity, duration, now):
+        body = client.V1Lease(
+            metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+            spec=client.V1LeaseSpec(holder_identity=identity, lease_duration_seconds=int(duration),
+                                    acquire_time=_timestamp(now), renew_time=_timestamp(now),
+                                    lease_transitions=0),
+        )
+        try:
+            self.api.create_namespaced_lease(self.namespace, body)
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+
+def _timestamp(now):
+    return datetime.fromtimestamp(now, tz=timezone.utc)
+
+
+class LeaderElector:
+    # Renews every renew_interval. Leadership is only claimed while the
+    # last successful renewal is younger than lease_duration, so a leader
+    # cut off from the backend stops acting before anyone else can take
+    # over.
+
+    def __init__(self, lease, identity=None, lease_duration=DEFAULT_LEASE_DURATION,
+                 renew_interval=DEFAULT_RENEW_INTERVAL, clock=time.time):
+        self.lease = lease
+        self.identity = identity or default_identity()
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        self.on_started_leading: Optional[Callable[[], None]] = None
+        self.on_stopped_leading: Optional[Callable[[], None]] = None
+        self._clock = clock
+        self._renewed_at: Optional[float] = None
+        self._leading = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        renewed = self._renewed_at
+        return renewed is not None and self._clock() < renewed + self.lease_duration
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.renew_interval + 1)
+        if self._renewed_at is not None:
+            self._renewed_at = None
+            self.lease.release(self.identity)
+        self._transition()
+
+    def try_acquire(self) -> bool:
+        now = self._clock()
+        try:
+            acquired = self.lease.try_acquire(self.identity, self.lease_duration, now)
+        except Exception as e:
+            print(f"Leader election for {self.identity} failed: {e}")
+            acquired = False
+        if acquired:
+            self._renewed_at = now
+        self._transition()
+        return acquired
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.try_acquire()
+            self._stop.wait(self.renew_interval)
+
+    def _transition(self):
+        leading = self.is_leader
+        if leading == self._leading:
+            return
+        self._leading = leading
+        print(f"{self.identity} {'became' if leading else 'is no longer'} the leader")
+        callback = self.on_started_leading if leading else self.on_stopped_leading
+        if callback is not None:
+            callback()
@@ -1,10 +1,26 @@
-import random
 import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
 from kubernetes import client, config, watch
 from kubernetes.client.exceptions import ApiException
 
-from gang import PodGroupDiscoverer, GroupSelector
-from node import NodeDiscoverer
+from backfill import backfill_deadline
+from batch import BatchGang, BatchPlan, BatchReport, sequential_count, solve
+from cache import ACTIVE_POD_FIELD_SELECTOR, ClusterCache, DEFAULT_RESYNC_PERIOD, pod_key
+from dispatch import Dispatcher, DEFAULT_CONCURRENCY
+from gang import GangIndex, PodGroupDiscoverer
+from node import NodeDiscoverer, NodeIndex, DEFAULT_NOMINATION_TTL
+from preemption import PreemptionPlanner
+from rebalance import RebalancePolicy, Rebalancer
+from records import NodeRecord, PodRecord
+from shard import DEFAULT_CLAIM_TTL, run_workers, shard_of
+from snapshot import DEFAULT_SNAPSHOT_INTERVAL, restore_cache, save_cache
+from topology import TopologyScorer
+from permit import GangPermit, DEFAULT_PERMIT_TIMEOUT, min_member_of
+from pod_utils import is_terminated_phase
+from scheduling_queue import SchedulingQueue
 
 class SchedulingError(Exception):
     pass
@@ -15,15 +31,86 @@ class NoNodesAvailableError(SchedulingError):
 class InsufficientResourcesError(SchedulingError):
     pass
 
+class PreemptionError(SchedulingError):
+    pass
+
 
 class Scheduler:
-    def __init__(self, scheduler_name="foobar"):
+    def __init__(self, scheduler_name="foobar", v1=None, resync_period=DEFAULT_RESYNC_PERIOD,
+                 sync_timeout=300, watch_factory=watch.Watch, permit_timeout=DEFAULT_PERMIT_TIMEOUT,
+                 tick_interval=1.0, concurrency=DEFAULT_CONCURRENCY,
+                 preemption_timeout=DEFAULT_NOMINATION_TTL, packing=None, fast_decode=False,
+                 compact_pods=True, snapshot_path=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 elector=None, shard=None, claims=None, claim_ttl=DEFAULT_CLAIM_TTL, topology=True,
+                 batch_window=None, backfill_window=None, rebalance=None, policy_v1=None):
         self.scheduler_name = scheduler_name
-        self._load_config()
-        self.v1 = client.CoreV1Api()
-        self.watcher = watch.Watch()
-        self.node_discovery = NodeDiscoverer(v1=self.v1)
-        self.gang_manager = PodGroupDiscoverer(v1=self.v1)
+        self.sync_timeout = sync_timeout
+        self.tick_interval = tick_interval
+        self.preemption_timeout = preemption_timeout
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._next_snapshot = 0.0
+        # With an elector, replicas share a lease: all of them keep the cache
+        # and indexes warm, only the leader pops the queue, binds and evicts.
+        self.elector = elector
+        # shard=(index, count) restricts this worker to its share of the
+        # gangs; claims (shard.NodeClaims) arbitrates nodes between workers.
+        self.shard = shard
+        self.claims = claims
+        self.claim_ttl = claim_ttl
+        self.claim_holder = f"{scheduler_name}-shard-{shard[0]}" if shard else scheduler_name
+        self.claim_conflicts = 0
+        # batch_window (seconds): collect pods this long and place the
+        # gangs that became ready together (batch.py) instead of one by one.
+        self.batch_window = batch_window
+        self.last_batch: Optional[BatchReport] = None
+        self.batch_totals = BatchReport()
+        # backfill_window (seconds): gangs that can't fit reserve nodes as
+        # they free up, and lower-priority gangs that are preemptible or
+        # expected to finish within the window may use them meanwhile
+        # (backfill.py). _backfilled maps those gangs to when their nodes
+        # may be taken back.
+        self.backfill_window = backfill_window
+        self._backfilled: Dict[str, float] = {}
+        if v1 is None:
+            self._load_config()
+            v1 = client.CoreV1Api()
+            policy_v1 = policy_v1 or client.PolicyV1Api()
+        self.v1 = v1
+        # policy_v1 reads PodDisruptionBudgets for the rebalancer.
+        self.policy_v1 = policy_v1
+        self.cache = ClusterCache(self.v1, resync_period=resync_period, watch_factory=watch_factory,
+                                  pod_field_selector=ACTIVE_POD_FIELD_SELECTOR, fast_decode=fast_decode,
+                                  pod_transform=PodRecord.from_pod if compact_pods else None,
+                                  node_transform=NodeRecord.from_node if compact_pods else None)
+        # topology: True for the default TopologyScorer, a scorer with
+        # custom levels/weights, or False to pick free nodes at random.
+        if topology is True:
+            topology = TopologyScorer()
+        self.node_index = NodeIndex(packing=packing, topology=topology or None)
+        self.node_index.on_nominated_free = self._on_nominated_free
+        self.cache.add_node_handler(self.node_index.on_node_event)
+        self.cache.add_pod_handler(self.node_index.on_pod_event)
+        self.gang_index = GangIndex()
+        self.cache.add_pod_handler(self.gang_index.on_pod_event)
+        self.node_discovery = NodeDiscoverer(v1=self.v1, cache=self.cache, index=self.node_index)
+        self.dispatcher = Dispatcher(max_workers=concurrency)
+        self.gang_manager = PodGroupDiscoverer(v1=self.v1, cache=self.cache, dispatcher=self.dispatcher,
+                                               index=self.gang_index)
+        self.planner = PreemptionPlanner(self.gang_manager, self.node_index)
+        # rebalance: True for the default RebalancePolicy or a custom one.
+        # Consolidating only means something when pods share nodes.
+        if rebalance is True:
+            rebalance = RebalancePolicy()
+        if rebalance and packing is None:
+            print("Rebalancing needs a packing strategy; disabled")
+            rebalance = None
+        self.rebalancer = Rebalancer(self.node_discovery, self.gang_manager, rebalance, v1=self.v1,
+                                     policy_v1=self.policy_v1) if rebalance else None
+        self.permit = GangPermit(timeout=permit_timeout)
+        self.queue = SchedulingQueue()
+        self._stop = threading.Event()
+        self.cache.add_pod_handler(self._on_pod_event)
 
     def _load_config(self):
         try:
@@ -34,41 +121,66 @@ class Scheduler:
     def _get_group_id(self, pod):
         return (pod.metadata.annotations or {}).get("pod-group", "")
 
-    def _preempt_for_group(self, group_id: str):
-        current_group = self.gang_manager.get_group(group_id)
-        if not current_group:
+    def _preempt_for_group(self, group_id: str, dry_run=False):
+        plan = self.planner.plan(group_id)
+        if plan is None:
             raise InsufficientResourcesError(f"Group {group_id} not found")
+        if not plan.feasible:
+            raise InsufficientResourcesError(
+                f"Insufficient preemptible pods available: can free {plan.freed}/{plan.needed_nodes} "
+                f"{'nodes' if self.node_index.packing is None else 'pods worth of room'}")
+        if dry_run or not plan.victims:
+            return plan
+        if not self.is_leader:
+            raise PreemptionError(f"Not the leader, not preempting for group {group_id}")
 
-        min_size = current_group.size
-        groups = self.gang_manager.groups(GroupSelector(
-            max_priority=current_group.priority - 1,
-        ))
-        groups = [group for group in groups if group.gang_id != group_id]
+        print(f"Preempting {len(plan.victims)} groups ({plan.evicted_pods} pods) to free "
+              f"{len(plan.freed_nodes)} nodes for group {group_id}")
+        counts = self.gang_manager.preempt_groups([group.gang_id for group in plan.victims])
+        partial = [group.gang_id for group in plan.victims
+                   if counts.get(group.gang_id) != plan.victim_pods[group.gang_id]]
+        if partial:
+            raise PreemptionError(f"Partially preempted groups: {', '.join(partial)}")
+        return plan
 
-        available_capacity = sum(group.size for group in groups)
-        if available_capacity < min_size:
-            raise InsufficientResourcesError("Insufficient preemptible pods available")
-
-        preempted = 0
-        for group in groups:
-            if group.gang_id == group_id:
-                continue
+    def _select_node(self, pod, preferred=None, borrow=()):
+        # Reserve the node for this pod right away so back-to-back decisions
+        # don't land on it before the watch reports the binding.
+        key = pod_key(pod)
+        gang_id = self._get_group_id(pod)
+        request = self.node_index.request_of(pod)
+        feasible = self.node_index.feasible_mask(pod)
+        while True:
+            node_name = self.node_index.assume_free_node(key, gang_id, request=request, preferred=preferred,
+                                                         feasible=feasible, borrow=borrow)
+            if node_name is None:
+                raise NoNodesAvailableError("No available nodes")
+            if self._claim(node_name, self.claim_ttl):
+                return node_name
+            # Another worker is binding there; our watch hasn't caught up.
+            # Hide the node until it has, and try the next one.
+            self.claim_conflicts += 1
+            self.node_index.forget(key)
+            self.node_index.hold(f"claimed/{node_name}", node_name)
 
-            local_p = self.gang_manager.preempt_group(group.gang_id)
-            if local_p != group.size:
-                raise Exception('preempted partial group')
+    def _claim(self, node_name, ttl):
+        return self.claims is None or self.claims.claim(node_name, self.claim_holder, ttl)
 
-            preempted += group.size
-            if preempted >= min_size:
-                break
+    def _release(self, pod):
+        key = pod_key(pod)
+        node_name = self.node_index.node_of(key)
+        self.node_index.forget(key)
+        # With packing other pods of ours may still be assumed there; the
+        # claim then simply runs out.
+        if self.claims is not None and node_name is not None and not self.node_index.occupants(node_name):
+            self.claims.release(node_name, self.claim_holder)
 
-    def _select_node(self):
-        free_nodes = self.node_discovery.get_free_nodes()
-        if not free_nodes:
-            raise NoNodesAvailableError("No available nodes")
-        return random.choice(free_nodes).name
+    def _owns(self, pod):
+        return self.shard is None or shard_of(self._get_group_id(pod), self.shard[1]) == self.shard[0]
 
     def _bind_pod(self, pod_name, node_name, namespace):
+        if not self.is_leader:
+            raise SchedulingError(f"Not the leader, not binding {pod_name}")
         target = client.V1ObjectReference(api_version="v1", kind="Node", name=node_name)
         meta = client.V1ObjectMeta(name=pod_name, namespace=namespace)
         body = client.V1Binding(metadata=meta, target=target)
@@ -84,84 +196,398 @@ class Scheduler:
                 and pod.status.phase == "Pending" 
                 and pod.spec 
                 and pod.spec.scheduler_name == self.scheduler_name 
-                and not pod.spec.node_name)
+                and not pod.spec.node_name
+                and not self.node_index.is_assumed(pod_key(pod))
+                and self._owns(pod))
 
     def _schedule_pod(self, pod):
-        pod_name = pod.metadata.name
-        namespace = pod.metadata.namespace or "default"
         group_id = self._get_group_id(pod)
         if not group_id:
             print('no group_id given, will not schedule')
-            return
+            return None
+
+        gang = self.permit.add(group_id, pod, self._min_member(pod, group_id))
+        return self._try_admit(gang)
+
+    def _min_member(self, pod, group_id):
+        size = min_member_of(pod)
+        if size is not None:
+            return size
+        group = self.gang_manager.get_group(group_id)
+        if not group:
+            return 1
+        return sum(1 for p in group.pods if not is_terminated_phase(getattr(p.status, "phase", None)))
+
+    def _bound_members(self, group_id):
+        return len(self._member_nodes(group_id))
+
+    def _member_nodes(self, group_id):
+        group = self.gang_manager.get_group(group_id)
+        if not group:
+            return []
+        return [p.spec.node_name for p in group.pods
+                if p.spec and p.spec.node_name and not is_terminated_phase(getattr(p.status, "phase", None))]
+
+    def _try_admit(self, gang, preempt=True):
+        missing = gang.min_member - self._bound_members(gang.gang_id) - len(gang.pods)
+        if missing > 0:
+            print(f"Group {gang.gang_id} waiting for {missing} more pods")
+            return False
+
+        if self._reserve_and_bind(gang):
+            return True
+        if self.permit.get(gang.gang_id) is not gang:
+            # Nodes were reserved but some binds failed; those pods are
+            # backed off and retry with the bound members counted.
+            return False
+        if not preempt:
+            return False
+        if self.node_index.has_nomination(gang.gang_id):
+            if self.node_index.reservation(gang.gang_id) is not None:
+                self._reserve(gang)
+            return False
 
         try:
-            node_name = self._select_node()
-        except NoNodesAvailableError:
+            plan = self._preempt_for_group(gang.gang_id)
+        except InsufficientResourcesError as e:
+            print(f"Failed to schedule group {gang.gang_id}: {e}")
+            if self.backfill_window is not None and self.node_index.packing is None:
+                self._reserve(gang)
+            return False
+        except PreemptionError as e:
+            print(f"Failed to schedule group {gang.gang_id}: {e}")
+            return False
+        if not plan.victims:
+            return self._schedule_entire_group(gang.gang_id)
+
+        # Victims take their grace period to go away; hold the nodes they
+        # free (plus any already free ones we counted on) for this gang and
+        # admit it from _on_nominated_free once enough of them are clear.
+        # Nominated nodes are claimed as well, so other workers leave them be.
+        feasible = self.node_index.feasible_mask(next(iter(gang.pods.values())))
+        free = self.node_index.feasible_free_nodes(feasible)[:plan.pending - plan.needed_nodes]
+        nodes = {n for n in set(plan.freed_nodes) | set(free) if self._claim(n, self.preemption_timeout)}
+        self.node_index.nominate(gang.gang_id, nodes, ttl=self.preemption_timeout)
+        print(f"Nominated {len(nodes)} nodes for group {gang.gang_id}, waiting for evictions")
+        return False
+
+    def _reserve(self, gang):
+        # Hold on to free and freed nodes until the gang fits; then take
+        # back any lent out to backfilled gangs.
+        pods = list(gang.pods.values())
+        group = self.gang_manager.get_group(gang.gang_id)
+        created = self.node_index.reservation(gang.gang_id) is None
+        self.node_index.reserve(gang.gang_id, len(pods), priority=group.priority if group else 0,
+                                feasible=self.node_index.feasible_mask(pods[0]), ttl=self.preemption_timeout)
+        if created:
+            print(f"Reserving nodes for group {gang.gang_id} as they free up")
+        self._reclaim(gang.gang_id)
+
+    def _reclaim(self, gang_id):
+        keys = self.node_index.reclaimable(gang_id)
+        if not keys or not self.is_leader:
+            return
+        now = time.monotonic()
+        victims = set()
+        for key in keys:
+            pod = self.cache.get_pod(key)
+            group_id = self._get_group_id(pod) if pod is not None else None
+            if group_id in self._backfilled and self._backfilled[group_id] <= now:
+                victims.add(group_id)
+        if not victims:
+            return
+        victims = sorted(victims)
+        print(f"Reclaiming reserved nodes for group {gang_id} from backfilled groups {', '.join(victims)}")
+        for group_id in victims:
+            del self._backfilled[group_id]
+        self.gang_manager.preempt_groups(victims)
+
+    def _backfill_targets(self, gang) -> List[str]:
+        # Reservations whose idle nodes this gang may borrow: those of
+        # higher priority gangs that are also larger, so a borrower fills
+        # gaps in a reservation instead of standing in for the gang.
+        if self.backfill_window is None:
+            return []
+        reservations = [r for r in self.node_index.reservations() if r.gang_id != gang.gang_id]
+        if not reservations or backfill_deadline(gang.pods.values(), self.backfill_window) is None:
+            return []
+        group = self.gang_manager.get_group(gang.gang_id)
+        priority = group.priority if group else 0
+        return [r.gang_id for r in reservations if priority < r.priority and len(gang.pods) < r.want]
+
+    def _reserve_and_bind(self, gang, preferred=None):
+        # Reserve a node for every waiting member or for none of them.
+        pods = list(gang.pods.values())
+        placements = []
+        borrow = self._backfill_targets(gang)
+        # Members of a gang normally share one pod template, so rank for the
+        # first one; each member is still checked on its own when placed.
+        if preferred is None:
+            preferred = self.node_index.rank_free_nodes(len(pods), near=self._member_nodes(gang.gang_id),
+                                                        feasible=self.node_index.feasible_mask(pods[0]))
+        for pod in pods:
             try:
-                self._preempt_for_group(group_id)
-                self._schedule_entire_group(group_id)
-                return
-            except (InsufficientResourcesError, NoNodesAvailableError) as e:
-                print(f"Failed to schedule {pod_name}: {e}")
-                return
+                placements.append((pod, self._select_node(pod, preferred, borrow)))
+            except NoNodesAvailableError:
+                for reserved, _ in placements:
+                    self._release(reserved)
+                print(f"Not enough free nodes for group {gang.gang_id}: {len(placements)}/{len(pods)}")
+                return False
 
-        try:
-            print(f"Binding {pod_name} -> {node_name}")
-            self._bind_pod(pod_name, node_name, namespace)
-        except ApiException as e:
+        self.permit.remove(gang.gang_id)
+        self.node_index.clear_nominations(gang.gang_id)
+        lent = sum(1 for _, node in placements if self.node_index.nominated_to(node) in borrow)
+        if lent:
+            self._backfilled[gang.gang_id] = backfill_deadline(pods, self.backfill_window)
+            print(f"Backfilling group {gang.gang_id} onto {lent} reserved nodes")
+        return self._bind_group(gang.gang_id, placements)
+
+    def _bind_group(self, group_id, placements):
+        for pod, node_name in placements:
+            print(f"Binding {pod.metadata.name} -> {node_name} (group: {group_id})")
+
+        def bind(placement):
+            pod, node_name = placement
+            self._bind_pod(pod.metadata.name, node_name, pod.metadata.namespace or "default")
+
+        scheduled_count = 0
+        for result in self.dispatcher.map(bind, placements):
+            pod, _ = result.item
+            if result.ok:
+                scheduled_count += 1
+                continue
+            self._release(pod)
+            self.queue.backoff(pod)
+            print(self._describe_bind_error(pod.metadata.name, result.error))
+
+        print(f"Scheduled {scheduled_count}/{len(placements)} pods in group {group_id}")
+        return scheduled_count == len(placements)
+
+    @staticmethod
+    def _describe_bind_error(pod_name, error):
+        if isinstance(error, ApiException):
             try:
-                msg = json.loads(e.body).get("message", e.body)
-            except (json.JSONDecodeError, AttributeError):
-                msg = str(e)
-            print(f"Bind failed for {pod_name}: {msg}")
-        except Exception as e:
-            print(f"Error binding {pod_name}: {e}")
+                msg = json.loads(error.body).get("message", error.body)
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                msg = str(error)
+            return f"Bind failed for {pod_name}: {msg}"
+        return f"Error binding {pod_name}: {error}"
 
     def _schedule_entire_group(self, group_id: str):
         group = self.gang_manager.get_group(group_id)
         if not group:
             print(f"Group {group_id} not found for scheduling")
-            return
+            return False
 
         unscheduled_pods = []
         for pod in group.pods:
             if (pod.status.phase == "Pending" and 
                 pod.spec and 
                 pod.spec.scheduler_name == self.scheduler_name and 
-                not pod.spec.node_name):
+                not pod.spec.node_name and
+                not self.node_index.is_assumed(pod_key(pod))):
                 unscheduled_pods.append(pod)
 
         if not unscheduled_pods:
             print(f"No unscheduled pods found in group {group_id}")
-            return
+            return False
 
-        scheduled_count = 0
+        gang = None
         for pod in unscheduled_pods:
-            try:
-                node_name = self._select_node()
-                pod_name = pod.metadata.name
-                namespace = pod.metadata.namespace or "default"
-                
-                print(f"Binding {pod_name} -> {node_name} (group: {group_id})")
-                self._bind_pod(pod_name, node_name, namespace)
-                scheduled_count += 1
-            except (NoNodesAvailableError, ApiException) as e:
-                print(f"Failed to schedule pod {pod.metadata.name} in group {group_id}: {e}")
+            gang = self.permit.add(group_id, pod, self._min_member(pod, group_id))
+        return self._reserve_and_bind(gang)
+
+    def _on_tick(self):
+        for gang in self.permit.expire():
+            print(f"Group {gang.gang_id} timed out waiting for admission, releasing {len(gang.pods)} pods")
+        for gang_id in self.node_index.expire_nominations():
+            print(f"Nominated nodes for group {gang_id} were not released in time")
+        for reservation in self.node_index.reservations():
+            self._reclaim(reservation.gang_id)
+        for group_id in [g for g in self._backfilled if not self.gang_manager.get_group(g)]:
+            del self._backfilled[group_id]
+        if self.rebalancer is not None and self.is_leader and self.rebalancer.due():
+            self._rebalance()
+        self.cache.evict_finished()
+        self.queue.flush()
+        if self.snapshot_path and time.monotonic() >= self._next_snapshot:
+            self._save_snapshot()
+
+    def _rebalance(self):
+        # Free whole nodes for the waiting gang furthest from fitting, or
+        # up to the policy's min_free_nodes when none is waiting.
+        short, target = 0, None
+        for gang in self.permit.waiting():
+            missing = len(gang.pods) - self._capacity_for(gang)
+            if missing > short:
+                short, target = missing, gang
+        # With packing, short counts pods, so the rebalancer stops once the
+        # freed nodes have room for that many of the gang's pods.
+        if target is not None:
+            moves = self.rebalancer.step(short, for_pods=list(target.pods.values()))
+        else:
+            moves = self.rebalancer.step(self.rebalancer.policy.min_free_nodes - self.node_index.count_free_nodes())
+        if moves and target is not None:
+            # Keep the recreated pods off the nodes being cleared.
+            self.node_index.nominate(target.gang_id, [m.node for m in moves], ttl=self.preemption_timeout)
+
+    def _save_snapshot(self):
+        self._next_snapshot = time.monotonic() + self.snapshot_interval
+        try:
+            save_cache(self.cache, self.snapshot_path)
+        except OSError as e:
+            print(f"Failed to write snapshot {self.snapshot_path}: {e}")
+
+    def _on_pod_event(self, event_type, pod):
+        # Runs on the cache thread: only enqueue, never schedule inline.
+        if self._is_schedulable(pod, event_type):
+            self.queue.add(pod)
+            return
+        key = pod_key(pod)
+        self.queue.delete(key)
+        self.permit.discard_pod(self._get_group_id(pod), key)
+
+    def _on_nominated_free(self, gang_id):
+        gang = self.permit.get(gang_id)
+        if gang and self._capacity_for(gang) >= len(gang.pods):
+            self.queue.activate(gang.pods.values())
+
+    def _capacity_for(self, gang):
+        pods = list(gang.pods.values())
+        feasible = self.node_index.feasible_mask(pods[0]) if pods else None
+        return self.node_index.capacity_for(pods, gang.gang_id, feasible)
+
+    def _process(self, pod):
+        if not self._is_schedulable(pod, "MODIFIED"):
+            return
+        scheduled = self._schedule_pod(pod)
+        if scheduled is None:
+            return
+        self._requeue(pod, scheduled)
+
+    def _requeue(self, pod, scheduled):
+        key = pod_key(pod)
+        if scheduled or self.node_index.is_assumed(key):
+            # Bound, even if another member's bind failed.
+            self.queue.done(key)
+        elif not self.queue.backing_off(key):
+            # Pods whose bind failed were already backed off by _bind_group.
+            self.queue.backoff(pod)
+
+    def _run_batch(self):
+        # The window opens with the first pod that arrives.
+        pod = self.queue.pop(timeout=self.tick_interval)
+        if pod is None:
+            return
+        pods = [pod]
+        deadline = time.monotonic() + self.batch_window
+        while (remaining := deadline - time.monotonic()) > 0:
+            pod = self.queue.pop(timeout=remaining)
+            if pod is not None:
+                pods.append(pod)
+        self._schedule_batch(pods)
+
+    def _schedule_batch(self, pods):
+        start = time.perf_counter()
+        gangs, members, ready_at = {}, [], {}
+        for i, pod in enumerate(pods):
+            if not self._is_schedulable(pod, "MODIFIED"):
                 continue
-            except Exception as e:
-                print(f"Error scheduling pod {pod.metadata.name} in group {group_id}: {e}")
+            group_id = self._get_group_id(pod)
+            if not group_id:
+                print('no group_id given, will not schedule')
                 continue
+            gangs[group_id] = self.permit.add(group_id, pod, self._min_member(pod, group_id))
+            members.append(pod)
+            # The sequential path would find the gang complete at its last pod.
+            ready_at[group_id] = i
 
-        print(f"Scheduled {scheduled_count}/{len(unscheduled_pods)} pods in group {group_id}")
+        admitted, batch = {}, []
+        for group_id, gang in gangs.items():
+            missing = gang.min_member - self._bound_members(group_id) - len(gang.pods)
+            if missing > 0 or self.node_index.has_nomination(group_id):
+                # Incomplete, or already holding nodes freed by preemption.
+                admitted[group_id] = self._try_admit(gang)
+                continue
+            group = self.gang_manager.get_group(group_id)
+            feasible = self.node_index.feasible_mask(next(iter(gang.pods.values())))
+            batch.append(BatchGang(gang=gang, priority=group.priority if group else 0, size=len(gang.pods),
+                                   feasible=-1 if feasible is None else feasible, order=ready_at[group_id]))
+
+        free = self.node_index.labels.free
+        if self.node_index.packing is None:
+            plan = solve(batch, free, self.node_index.pick_free_nodes, self.node_index.labels.mask_of)
+        else:
+            # Nodes are shared by fit with packing; just go by priority.
+            plan = BatchPlan(unplaced=sorted(batch, key=lambda g: (-g.priority, g.size, g.order)))
+        for g, nodes in plan.placed:
+            admitted[g.gang.gang_id] = self._reserve_and_bind(g.gang, preferred=nodes)
+            if not admitted[g.gang.gang_id] and self.permit.get(g.gang.gang_id) is g.gang:
+                # The planned nodes were taken meanwhile; binds weren't tried.
+                admitted[g.gang.gang_id] = self._try_admit(g.gang)
+        # What didn't fit may still preempt, highest priority first.
+        for g in plan.unplaced:
+            admitted[g.gang.gang_id] = self._try_admit(g.gang)
+
+        for pod in members:
+            self._requeue(pod, admitted[self._get_group_id(pod)])
+
+        report = BatchReport(cycles=1, gangs=len(batch), seconds=time.perf_counter() - start,
+                             placed=sum(1 for g in batch if admitted[g.gang.gang_id]),
+                             sequential=sequential_count(batch, free))
+        self.last_batch = report
+        self.batch_totals.add(report)
+        if batch:
+            print(f"Batch cycle: placed {report.placed}/{report.gangs} gangs (arrival order would place "
+                  f"{report.sequential}) in {report.seconds * 1000:.1f} ms")
+        return report
+
+    @property
+    def is_leader(self) -> bool:
+        return self.elector is None or self.elector.is_leader
 
     def run(self):
         print(f"Starting scheduler: {self.scheduler_name}")
-        for event in self.watcher.stream(self.v1.list_pod_for_all_namespaces):
-            pod = event["object"]
-            if self._is_schedulable(pod, event["type"]):
-                self._schedule_pod(pod)
+        if self.snapshot_path:
+            snap = restore_cache(self.cache, self.snapshot_path)
+            if snap is not None:
+                print(f"Restored {len(snap.pods)} pods and {len(snap.nodes)} nodes from {self.snapshot_path}")
+            self._next_snapshot = time.monotonic() + self.snapshot_interval
+        self.cache.start()
+        if not self.cache.wait_for_sync(timeout=self.sync_timeout):
+            raise SchedulingError("Timed out waiting for the cluster cache to sync")
+        if self.elector is not None:
+            self.elector.start()
+        next_tick = time.monotonic() + self.tick_interval
+        while not self._stop.is_set():
+            if self.is_leader and self.batch_window:
+                self._run_batch()
+            elif self.is_leader:
+                pod = self.queue.pop(timeout=self.tick_interval)
+                if pod is not None:
+                    self._process(pod)
+            else:
+                # Standby: the watch keeps filling cache, indexes and queue.
+                self._stop.wait(self.tick_interval)
+            if time.monotonic() >= next_tick:
+                self._on_tick()
+                next_tick = time.monotonic() + self.tick_interval
+
+        if self.elector is not None:
+            self.elector.stop()
+        if self.snapshot_path:
+            self._save_snapshot()
+        self.cache.stop()
+        self.dispatcher.shutdown()
+
+    def stop(self):
+        self._stop.set()
 
 
 if __name__ == "__main__":
-    scheduler = Scheduler(scheduler_name="foobar")
-    scheduler.run()
+    workers = int(os.environ.get("SCHEDULER_WORKERS", "1"))
+    if workers > 1:
+        run_workers(workers, scheduler_name="foobar")
+    else:
+        scheduler = Scheduler(scheduler_name="foobar")
+        scheduler.run()
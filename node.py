@@ -1,21 +1,498 @@
-from dataclasses import dataclass
-from typing import List, Set
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 from kubernetes import client
-from pod_utils import is_system_namespace, is_daemonset_pod
+from cache import BOUND_POD_FIELD_SELECTOR, list_items, pod_key
+from feasibility import NodeLabelIndex, constraints_of
+from pod_utils import active_node_of, bound_node_of
+from resources import fits, group_requests, max_copies, node_allocatable, pod_requests
 
 
 @dataclass
 class NodeStatus:
     name: str
     is_free: bool
+    allocatable: Dict[str, int] = field(default_factory=dict)
+    requested: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def available(self) -> Dict[str, int]:
+        return {r: v - self.requested.get(r, 0) for r, v in self.allocatable.items()}
+
+
+@dataclass
+class Reservation:
+    # A gang that can't fit yet collects up to `want` nodes as they free up;
+    # priority decides between reservations competing for a node.
+    gang_id: str
+    want: int
+    priority: int = 0
+    feasible: Optional[int] = None
+
+
+DEFAULT_ASSUME_TTL = 30.0
+DEFAULT_NOMINATION_TTL = 120.0
+# Random free nodes tried against a feasible set before enumerating it.
+_FEASIBLE_SAMPLES = 8
+
+
+class NodeIndex:
+    # Node occupancy kept up to date from cache events. Free nodes live in a
+    # list with a position map so pick/add/remove are all O(1).
+    #
+    # Pods we decided to bind are "assumed" onto their node straight away so
+    # the next decision doesn't see it as free. The assumption is confirmed
+    # when the watch shows the pod on a node and rolled back by forget() or
+    # once assume_ttl passes without confirmation.
+    #
+    # Nodes being cleared by preemption are nominated to the preemptor gang:
+    # once free they go to that gang's own pool instead of the shared free
+    # list, and on_nominated_free(gang_id) is called (under the index lock).
+    # A reservation is a nomination that also takes nodes as they free up
+    # until it has `want`; other gangs may borrow its idle nodes (backfill).
+    #
+    # With a packing strategy (resources.MostAllocated/LeastAllocated) nodes
+    # also track allocatable minus summed pod requests, and pods are placed
+    # by fit and score instead of taking a whole empty node. "Free" still
+    # means a node with no occupants.
+    #
+    # With a topology scorer (topology.TopologyScorer) the shared free list
+    # is mirrored into it, and rank_free_nodes() orders free nodes for a
+    # whole gang; callers pass that order to assume_free_node as preferred.
+    #
+    # Labels, taints and cordons are indexed into bitsets (feasibility.
+    # NodeLabelIndex). feasible_mask(pod) gives the nodes a pod may use, or
+    # None when it may use any; placement calls accept it as `feasible`.
+
+    def __init__(self, assume_ttl=DEFAULT_ASSUME_TTL, clock=time.monotonic, packing=None, topology=None):
+        self.assume_ttl = assume_ttl
+        self.packing = packing
+        self.topology = topology
+        self.labels = NodeLabelIndex()
+        self.on_nominated_free: Optional[Callable[[str], None]] = None
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._assumed: Dict[str, float] = {}
+        self._assume_deadlines: Deque[Tuple[float, str]] = deque()
+        self._nominated: Dict[str, str] = {}
+        self._nominations: Dict[str, Set[str]] = {}
+        self._nominated_free: Dict[str, Set[str]] = {}
+        self._nomination_deadlines: Dict[str, float] = {}
+        self._reservations: Dict[str, Reservation] = {}
+        self._nodes: Set[str] = set()
+        self._pod_nodes: Dict[str, str] = {}
+        self._occupants: Dict[str, Set[str]] = {}
+        self._free: List[str] = []
+        self._free_pos: Dict[str, int] = {}
+        self._allocatable: Dict[str, Dict[str, int]] = {}
+        self._requested: Dict[str, Dict[str, int]] = {}
+        self._pod_requests: Dict[str, Dict[str, int]] = {}
+
+    def on_node_event(self, event_type, node):
+        name = node.metadata.name
+        with self._lock:
+            self.labels.on_node_event(event_type, node)
+            if self.topology is not None:
+                self.topology.on_node_event(event_type, node)
+            if event_type == "DELETED":
+                self._nodes.discard(name)
+                self._allocatable.pop(name, None)
+            else:
+                self._nodes.add(name)
+                if self.packing is not None:
+                    self._allocatable[name] = node_allocatable(node)
+            self._refresh(name)
+
+    def on_pod_event(self, event_type, pod):
+        key = pod_key(pod)
+        node = None if event_type == "DELETED" else bound_node_of(pod)
+        # System and DaemonSet pods don't make a node busy, but with packing
+        # their requests still use up its allocatable.
+        occupies = node is not None and active_node_of(pod) is not None
+        if not occupies and self.packing is None:
+            node = None
+        request = self.request_of(pod) if node is not None else None
+        with self._lock:
+            if key in self._assumed:
+                if node is None and event_type != "DELETED":
+                    return
+                del self._assumed[key]
+            self._place(key, node, request, occupies)
+
+    def request_of(self, pod) -> Optional[Dict[str, int]]:
+        return pod_requests(pod) if self.packing is not None else None
+
+    def feasible_mask(self, pod) -> Optional[int]:
+        with self._lock:
+            constraints = constraints_of(pod)
+            if not self.labels.restricts(constraints):
+                return None
+            return self.labels.feasible(constraints)
+
+    def assume_free_node(self, key, gang_id=None, request=None, preferred=None, feasible=None,
+                         borrow=()) -> Optional[str]:
+        # preferred: list of node names, consumed from the front; taken or
+        # infeasible nodes in it are skipped. borrow: reserving gangs whose
+        # idle nodes may be used once no free node is left.
+        with self._lock:
+            self._expire_assumed()
+            if self.packing is not None:
+                node = self._best_fit(request or {}, gang_id, feasible)
+            else:
+                nominated = self._nominated_free.get(gang_id) if gang_id else None
+                while preferred and (preferred[0] not in self._free_pos
+                                     or not self._allows(feasible, preferred[0])):
+                    preferred.pop(0)
+                node = next((n for n in nominated if self._allows(feasible, n)), None) if nominated else None
+                if node is None and preferred:
+                    node = preferred.pop(0)
+                if node is None:
+                    node = self._pick_free(feasible)
+                if node is None:
+                    node = next((n for g in borrow for n in self._nominated_free.get(g, ())
+                                 if self._allows(feasible, n)), None)
+            if node is None:
+                return None
+            self.assume(key, node, request)
+            return node
+
+    def assume(self, key, node, request=None):
+        with self._lock:
+            deadline = self._clock() + self.assume_ttl
+            self._assumed[key] = deadline
+            self._assume_deadlines.append((deadline, key))
+            self._place(key, node, request)
+
+    def hold(self, key, node):
+        # Assume a placeholder that takes the whole node, e.g. while another
+        # scheduler worker binds to it; it lapses like any assumption.
+        with self._lock:
+            request = self._allocatable.get(node) if self.packing is not None else None
+            self.assume(key, node, request)
+
+    def rank_free_nodes(self, count, near=(), feasible=None) -> List[str]:
+        # Best free nodes for a gang needing count more, near the nodes it
+        # already has. Empty without a topology scorer or with packing.
+        if self.topology is None or self.packing is not None:
+            return []
+        with self._lock:
+            self._expire_assumed()
+            if feasible is None:
+                return self.topology.rank(count, near)
+            # Hand the scorer whichever side of the split is smaller.
+            allowed = feasible & self.labels.free
+            blocked = self.labels.free & ~feasible
+            if allowed.bit_count() <= blocked.bit_count():
+                return self.topology.rank(count, near, only=self.labels.names(allowed))
+            return self.topology.rank(count, near, exclude=self.labels.names(blocked))
+
+    def pick_free_nodes(self, count, within, near=()) -> List[str]:
+        # Up to count free nodes out of the bitset `within`, ranked by
+        # topology when there is a scorer.
+        with self._lock:
+            ranked = self.rank_free_nodes(count, near, feasible=within)
+            if ranked:
+                return ranked
+            return self.labels.lowest(within & self.labels.free, count)
+
+    def feasible_free_nodes(self, feasible=None) -> List[str]:
+        with self._lock:
+            self._expire_assumed()
+            if feasible is None:
+                return list(self._free)
+            return self.labels.names(feasible & self.labels.free)
+
+    def capacity_for(self, pods, gang_id=None, feasible=None, evicting=(), nodes=None) -> int:
+        # How many of these pods could be placed right now, on nodes in
+        # the feasible mask if one is given. With packing, the pods keyed
+        # in evicting count as gone and nodes limits the nodes looked at,
+        # so preemption can measure the room its victims leave.
+        pods = list(pods)
+        if self.packing is None:
+            return min(len(pods), self.count_free_nodes(gang_id, feasible))
+        with self._lock:
+            self._expire_assumed()
+            simulated = {}
+            for key in evicting:
+                name, request = self._pod_nodes.get(key), self._pod_requests.get(key)
+                if name is None or not request:
+                    continue
+                requested = simulated.setdefault(name, dict(self._requested.get(name, {})))
+                for r, v in request.items():
+                    requested[r] = requested.get(r, 0) - v
+            placed = 0
+            for request, count in group_requests(self.request_of(p) for p in pods):
+                for name in self._candidate_nodes(gang_id):
+                    if count == 0:
+                        break
+                    if not self._allows(feasible, name) or (nodes is not None and name not in nodes):
+                        continue
+                    requested = simulated.setdefault(name, dict(self._requested.get(name, {})))
+                    n = max_copies(request, self._allocatable.get(name, {}), requested, count)
+                    for r, v in request.items():
+                        requested[r] = requested.get(r, 0) + v * n
+                    count -= n
+                    placed += n
+            return placed
+
+    def forget(self, key):
+        with self._lock:
+            if self._assumed.pop(key, None) is not None:
+                self._place(key, None)
+
+    def is_assumed(self, key) -> bool:
+        return key in self._assumed
+
+    def node_of(self, key) -> Optional[str]:
+        return self._pod_nodes.get(key)
+
+    def nominate(self, gang_id, nodes, ttl=DEFAULT_NOMINATION_TTL):
+        with self._lock:
+            self._nomination_deadlines[gang_id] = self._clock() + ttl
+            owned = self._nominations.setdefault(gang_id, set())
+            for name in nodes:
+                previous = self._nominated.get(name)
+                if previous == gang_id:
+                    continue
+                if previous is not None:
+                    self._nominations[previous].discard(name)
+                    self._nominated_free.get(previous, set()).discard(name)
+                self._nominated[name] = gang_id
+                owned.add(name)
+                self._refresh(name)
+
+    def reserve(self, gang_id, want, priority=0, feasible=None, ttl=DEFAULT_NOMINATION_TTL):
+        # Nominate free nodes to the gang now and freed ones later, up to
+        # want. Calling it again refreshes the deadline.
+        with self._lock:
+            self._expire_assumed()
+            self._reservations[gang_id] = Reservation(gang_id=gang_id, want=want, priority=priority,
+                                                      feasible=feasible)
+            missing = want - len(self._nominations.get(gang_id, ()))
+            free = list(self._free) if feasible is None else self.labels.names(feasible & self.labels.free)
+            self.nominate(gang_id, free[:max(missing, 0)], ttl=ttl)
+
+    def reservation(self, gang_id) -> Optional[Reservation]:
+        return self._reservations.get(gang_id)
+
+    def reservations(self) -> List[Reservation]:
+        with self._lock:
+            return list(self._reservations.values())
+
+    def nominated_to(self, name) -> Optional[str]:
+        return self._nominated.get(name)
+
+    def reclaimable(self, gang_id) -> Set[str]:
+        # Pods on a reservation's nodes once it holds enough of them but
+        # some are still lent out; empty otherwise.
+        with self._lock:
+            reservation = self._reservations.get(gang_id)
+            owned = self._nominations.get(gang_id, set())
+            if reservation is None or len(owned) < reservation.want:
+                return set()
+            if len(self._nominated_free.get(gang_id, ())) >= reservation.want:
+                return set()
+            return {key for name in owned for key in self._occupants.get(name, ())}
+
+    def clear_nominations(self, gang_id):
+        with self._lock:
+            self._reservations.pop(gang_id, None)
+            self._nomination_deadlines.pop(gang_id, None)
+            self._nominated_free.pop(gang_id, None)
+            for name in self._nominations.pop(gang_id, ()):
+                if self._nominated.get(name) == gang_id:
+                    del self._nominated[name]
+                    self._refresh(name)
+
+    def has_nomination(self, gang_id) -> bool:
+        return gang_id in self._nomination_deadlines
+
+    def expire_nominations(self) -> List[str]:
+        now = self._clock()
+        with self._lock:
+            expired = [g for g, deadline in self._nomination_deadlines.items() if deadline <= now]
+            for gang_id in expired:
+                self.clear_nominations(gang_id)
+            return expired
+
+    def pick_free_node(self) -> Optional[str]:
+        with self._lock:
+            self._expire_assumed()
+            if not self._free:
+                return None
+            return random.choice(self._free)
+
+    def free_nodes(self) -> List[str]:
+        with self._lock:
+            self._expire_assumed()
+            return list(self._free)
+
+    def count_free_nodes(self, gang_id=None, feasible=None) -> int:
+        with self._lock:
+            self._expire_assumed()
+            nominated = self._nominated_free.get(gang_id, ()) if gang_id else ()
+            if feasible is None:
+                return len(self._free) + len(nominated)
+            return ((feasible & self.labels.free).bit_count()
+                    + sum(1 for n in nominated if self._allows(feasible, n)))
+
+    def occupants(self, name) -> frozenset:
+        with self._lock:
+            return frozenset(self._occupants.get(name, ()))
+
+    def is_free(self, name) -> bool:
+        return name in self._nodes and not self._occupants.get(name)
+
+    def statuses(self) -> List[NodeStatus]:
+        with self._lock:
+            return [NodeStatus(name=n, is_free=self.is_free(n),
+                               allocatable=dict(self._allocatable.get(n, {})),
+                               requested=dict(self._requested.get(n, {})))
+                    for n in self._nodes]
+
+    def _allows(self, feasible, name):
+        return feasible is None or self.labels.contains(feasible, name)
+
+    def _pick_free(self, feasible):
+        if not self._free:
+            return None
+        if feasible is None:
+            return random.choice(self._free)
+        # Feasible sets are usually most of the cluster or a small slice:
+        # sampling settles the first case, enumerating the second.
+        for _ in range(_FEASIBLE_SAMPLES):
+            name = random.choice(self._free)
+            if self.labels.contains(feasible, name):
+                return name
+        names = self.labels.names(feasible & self.labels.free)
+        return random.choice(names) if names else None
+
+    def _candidate_nodes(self, gang_id):
+        # Nodes nominated to this gang first, then everything not nominated.
+        own = [n for n in self._nominations.get(gang_id, ()) if n in self._nodes] if gang_id else []
+        return own + [n for n in self._nodes if n not in self._nominated]
+
+    def _best_fit(self, request, gang_id, feasible=None):
+        best, best_score = None, None
+        own = set(self._nominations.get(gang_id, ())) if gang_id else set()
+        for name in self._candidate_nodes(gang_id):
+            if best is not None and best in own and name not in own:
+                break
+            if not self._allows(feasible, name):
+                continue
+            allocatable = self._allocatable.get(name, {})
+            requested = self._requested.get(name, {})
+            if not fits(request, allocatable, requested):
+                continue
+            score = self.packing.score(allocatable, requested, request)
+            if best_score is None or score > best_score:
+                best, best_score = name, score
+        return best
+
+    def _place(self, key, node, request=None, occupies=True):
+        old = self._pod_nodes.get(key)
+        if old == node:
+            return
+        if old is not None:
+            del self._pod_nodes[key]
+            occupants = self._occupants.get(old)
+            if occupants is not None:
+                occupants.discard(key)
+                if not occupants:
+                    del self._occupants[old]
+            self._adjust_requested(old, self._pod_requests.pop(key, None), -1)
+            self._refresh(old)
+        if node is not None:
+            self._pod_nodes[key] = node
+            if occupies:
+                self._occupants.setdefault(node, set()).add(key)
+            if request:
+                self._pod_requests[key] = request
+                self._adjust_requested(node, request, 1)
+            self._refresh(node)
+
+    def _adjust_requested(self, node, request, sign):
+        if not request:
+            return
+        requested = self._requested.setdefault(node, {})
+        for name, value in request.items():
+            requested[name] = requested.get(name, 0) + sign * value
+
+    def _expire_assumed(self):
+        # Deadlines are appended in order, so only the head can be due.
+        now = self._clock()
+        while self._assume_deadlines and self._assume_deadlines[0][0] <= now:
+            deadline, key = self._assume_deadlines.popleft()
+            if self._assumed.get(key) == deadline:
+                del self._assumed[key]
+                self._place(key, None)
+
+    def _refresh(self, name):
+        free = self.is_free(name)
+        gang_id = self._nominated.get(name)
+        if gang_id is None and free and self._reservations:
+            gang_id = self._reserve_node(name)
+        if gang_id is None:
+            if free:
+                self._add_free(name)
+            else:
+                self._remove_free(name)
+            return
+
+        self._remove_free(name)
+        pool = self._nominated_free.setdefault(gang_id, set())
+        if not free:
+            pool.discard(name)
+        elif name not in pool:
+            pool.add(name)
+            if self.on_nominated_free is not None:
+                self.on_nominated_free(gang_id)
+
+    def _reserve_node(self, name):
+        # A freed node goes to the highest-priority reservation still short.
+        for r in sorted(self._reservations.values(), key=lambda r: -r.priority):
+            owned = self._nominations.get(r.gang_id)
+            if owned is not None and len(owned) < r.want and self._allows(r.feasible, name):
+                self._nominated[name] = r.gang_id
+                owned.add(name)
+                return r.gang_id
+        return None
+
+    def _add_free(self, name):
+        if name in self._free_pos:
+            return
+        self._free_pos[name] = len(self._free)
+        self._free.append(name)
+        self.labels.set_free(name, True)
+        if self.topology is not None:
+            self.topology.set_free(name, True)
+
+    def _remove_free(self, name):
+        pos = self._free_pos.pop(name, None)
+        if pos is None:
+            return
+        self.labels.set_free(name, False)
+        if self.topology is not None:
+            self.topology.set_free(name, False)
+        last = self._free.pop()
+        if pos < len(self._free):
+            self._free[pos] = last
+            self._free_pos[last] = pos
 
 
 class NodeDiscoverer:
 
-    def __init__(self, v1: client.CoreV1Api):
+    def __init__(self, v1: client.CoreV1Api, cache=None, index: Optional[NodeIndex] = None):
         self.v1 = v1
+        self.cache = cache
+        self.index = index
 
     def get_nodes_with_status(self):
+        if self.index is not None:
+            return self.index.statuses()
 
         all_nodes = self._list_nodes()
         used_nodes = self._nodes_with_active_pods()
@@ -27,30 +504,49 @@ class NodeDiscoverer:
 
 
     def get_free_nodes(self):
+        if self.index is not None:
+            return [NodeStatus(name=n, is_free=True) for n in self.index.free_nodes()]
         free = [node for node in self.get_nodes_with_status() if node.is_free]
         return free
 
+    def get_feasible_nodes(self, pod):
+        # Free nodes this pod may run on given its nodeSelector, required
+        # node affinity and tolerations, and node cordons.
+        if self.index is not None:
+            names = self.index.feasible_free_nodes(self.index.feasible_mask(pod))
+            return [NodeStatus(name=n, is_free=True) for n in names]
+        labels = NodeLabelIndex()
+        for node in self._list_nodes():
+            labels.on_node_event("ADDED", node)
+        feasible = labels.feasible(constraints_of(pod))
+        return [ns for ns in self.get_free_nodes() if labels.contains(feasible, ns.name)]
+
     def count_free_nodes(self):
+        if self.index is not None:
+            return self.index.count_free_nodes()
         return sum(1 for ns in self.get_nodes_with_status() if ns.is_free)
 
+    def pick_free_node(self) -> Optional[str]:
+        if self.index is not None:
+            return self.index.pick_free_node()
+        free = self.get_free_nodes()
+        return random.choice(free).name if free else None
+
     def _list_nodes(self):
-        return self.v1.list_node().items
+        if self.cache is not None:
+            return self.cache.list_nodes()
+        return list_items(self.v1.list_node)
+
+    def _list_pods(self, field_selector=None):
+        if self.cache is not None:
+            return self.cache.list_pods()
+        return list_items(self.v1.list_pod_for_all_namespaces, field_selector=field_selector)
 
     def _nodes_with_active_pods(self):
-        pods = self.v1.list_pod_for_all_namespaces().items
         used = set()
-        for p in pods:
-            if not p.spec or not p.status:
-                continue
-            if is_system_namespace(p):
-                continue
-            phase = p.status.phase
-            if phase not in ("Running", "Pending"):
-                continue
-            if is_daemonset_pod(p):
-                continue
-            if p.spec.node_name:
-                used.add(p.spec.node_name)
+        for p in self._list_pods(field_selector=BOUND_POD_FIELD_SELECTOR):
+            node = active_node_of(p)
+            if node:
+                used.add(node)
 
         return used
-
@@ -0,0 +1,76 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from cache import pod_key
+
+DEFAULT_GROUP_SIZE_ANNOTATION = "pod-group-size"
+DEFAULT_PERMIT_TIMEOUT = 60.0
+
+
+@dataclass
+class WaitingGang:
+    gang_id: str
+    since: float
+    pods: Dict[str, object] = field(default_factory=dict)
+    min_member: int = 0
+
+
+def min_member_of(pod, size_annotation=DEFAULT_GROUP_SIZE_ANNOTATION):
+    ann = (pod.metadata.annotations or {}).get(size_annotation)
+    if ann is None:
+        return None
+    try:
+        return max(int(ann), 1)
+    except ValueError:
+        return None
+
+
+class GangPermit:
+    # Holds pending members of a pod-group until the whole gang is present.
+    # Gangs that don't complete within `timeout` are dropped so their pods
+    # can be retried from scratch.
+
+    def __init__(self, timeout=DEFAULT_PERMIT_TIMEOUT, clock=time.monotonic):
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._gangs: Dict[str, WaitingGang] = {}
+
+    def add(self, gang_id, pod, min_member) -> WaitingGang:
+        with self._lock:
+            gang = self._gangs.get(gang_id)
+            if gang is None:
+                gang = self._gangs[gang_id] = WaitingGang(gang_id=gang_id, since=self._clock())
+            gang.pods[pod_key(pod)] = pod
+            gang.min_member = max(gang.min_member, min_member)
+            return gang
+
+    def get(self, gang_id) -> Optional[WaitingGang]:
+        with self._lock:
+            return self._gangs.get(gang_id)
+
+    def waiting(self) -> List[WaitingGang]:
+        with self._lock:
+            return list(self._gangs.values())
+
+    def discard_pod(self, gang_id, key):
+        with self._lock:
+            gang = self._gangs.get(gang_id)
+            if gang is None:
+                return
+            gang.pods.pop(key, None)
+            if not gang.pods:
+                del self._gangs[gang_id]
+
+    def remove(self, gang_id):
+        with self._lock:
+            return self._gangs.pop(gang_id, None)
+
+    def expire(self) -> List[WaitingGang]:
+        now = self._clock()
+        with self._lock:
+            expired = [g for g in self._gangs.values() if now - g.since >= self.timeout]
+            for g in expired:
+                del self._gangs[g.gang_id]
+            return expired
@@ -0,0 +1,153 @@
+import gc
+import json
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Fast path for pod LIST/WATCH payloads: parse the raw JSON and build only
+# the fields the scheduler reads, shaped like the client models so the
+# predicates in pod_utils, gang and node work on either.
+
+
+class OwnerReference:
+    __slots__ = ("kind", "name")
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+
+class ResourceRequirements:
+    __slots__ = ("requests",)
+
+    def __init__(self, requests):
+        self.requests = requests
+
+
+class Container:
+    __slots__ = ("name", "resources")
+
+    def __init__(self, name, resources):
+        self.name = name
+        self.resources = resources
+
+
+class PodMetadata:
+    __slots__ = ("name", "namespace", "annotations", "labels", "owner_references",
+                 "deletion_timestamp", "resource_version")
+
+    def __init__(self, name, namespace, annotations, labels, owner_references, deletion_timestamp,
+                 resource_version):
+        self.name = name
+        self.namespace = namespace
+        self.annotations = annotations
+        self.labels = labels
+        self.owner_references = owner_references
+        self.deletion_timestamp = deletion_timestamp
+        self.resource_version = resource_version
+
+
+class PodSpec:
+    # node_selector, affinity and tolerations stay raw JSON; feasibility
+    # reads them in either shape.
+    __slots__ = ("node_name", "scheduler_name", "priority", "containers", "init_containers", "overhead",
+                 "node_selector", "affinity", "tolerations")
+
+    def __init__(self, node_name, scheduler_name, priority, containers, init_containers, overhead,
+                 node_selector=None, affinity=None, tolerations=None):
+        self.node_name = node_name
+        self.scheduler_name = scheduler_name
+        self.priority = priority
+        self.containers = containers
+        self.init_containers = init_containers
+        self.overhead = overhead
+        self.node_selector = node_selector
+        self.affinity = affinity
+        self.tolerations = tolerations
+
+
+class PodStatus:
+    __slots__ = ("phase",)
+
+    def __init__(self, phase):
+        self.phase = phase
+
+
+class Pod:
+    __slots__ = ("metadata", "spec", "status")
+
+    def __init__(self, metadata, spec, status):
+        self.metadata = metadata
+        self.spec = spec
+        self.status = status
+
+
+class ListMeta:
+    __slots__ = ("resource_version", "_continue")
+
+    def __init__(self, resource_version, _continue):
+        self.resource_version = resource_version
+        self._continue = _continue
+
+
+class PodList:
+    __slots__ = ("metadata", "items")
+
+    def __init__(self, metadata, items):
+        self.metadata = metadata
+        self.items = items
+
+
+def _containers(raw):
+    if not raw:
+        return None
+    return [Container(c.get("name"), ResourceRequirements((c.get("resources") or {}).get("requests")))
+            for c in raw]
+
+
+def decode_pod(obj) -> Pod:
+    meta = obj.get("metadata") or {}
+    spec = obj.get("spec") or {}
+    status = obj.get("status") or {}
+    owners = meta.get("ownerReferences")
+    return Pod(
+        PodMetadata(
+            meta.get("name"),
+            meta.get("namespace"),
+            meta.get("annotations"),
+            meta.get("labels"),
+            [OwnerReference(o.get("kind"), o.get("name")) for o in owners] if owners else None,
+            meta.get("deletionTimestamp"),
+            meta.get("resourceVersion"),
+        ),
+        PodSpec(
+            spec.get("nodeName"),
+            spec.get("schedulerName"),
+            spec.get("priority"),
+            _containers(spec.get("containers")),
+            _containers(spec.get("initContainers")),
+            spec.get("overhead"),
+            spec.get("nodeSelector"),
+            spec.get("affinity"),
+            spec.get("tolerations"),
+        ),
+        PodStatus(status.get("phase")),
+    )
+
+
+def decode_pod_list(data) -> PodList:
+    # A page allocates hundreds of thousands of acyclic objects; letting the
+    # cyclic collector run in the middle of that only rescans them.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        body = _loads(data)
+        meta = body.get("metadata") or {}
+        return PodList(ListMeta(meta.get("resourceVersion"), meta.get("continue")),
+                       [decode_pod(item) for item in body.get("items") or ()])
+    finally:
+        if enabled:
+            gc.enable()
@@ -29,4 +29,28 @@ def should_skip_pod_for_scheduling(pod):
     if is_daemonset_pod(pod):
         return True
 
-    return False
\ No newline at end of file
+    return False
+
+
+def is_evictable(pod):
+    # Pods preemption can still evict: not already going away, and not
+    # system or DaemonSet pods.
+    if is_terminating(pod) or is_terminated_phase(getattr(pod.status, "phase", None)):
+        return False
+    return not should_skip_pod_for_scheduling(pod)
+
+
+def bound_node_of(pod):
+    # Node whose resources a pod uses, whoever it belongs to.
+    if not pod.spec or not pod.status:
+        return None
+    if pod.status.phase not in ("Running", "Pending"):
+        return None
+    return pod.spec.node_name or None
+
+
+def active_node_of(pod):
+    # Node a pod holds for scheduling purposes, or None if it holds none.
+    if is_system_namespace(pod) or is_daemonset_pod(pod):
+        return None
+    return bound_node_of(pod)
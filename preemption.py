@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+from cache import pod_key
+from gang import GroupSelector, PodGroup
+from pod_utils import active_node_of, is_evictable
+
+
+@dataclass
+class PreemptionPlan:
+    gang_id: str
+    needed_nodes: int
+    pending: int = 0
+    victims: List[PodGroup] = field(default_factory=list)
+    freed_nodes: Set[str] = field(default_factory=set)
+    evicted_pods: int = 0
+    priority_cost: int = 0
+    # Pods each victim group should lose; terminating ones are not counted.
+    victim_pods: Dict[str, int] = field(default_factory=dict)
+    # Progress towards needed_nodes: nodes freed, or with packing (where
+    # needed_nodes counts pods) how many pending pods the victims' room holds.
+    freed: int = 0
+
+    @property
+    def feasible(self):
+        return self.freed >= self.needed_nodes
+
+
+@dataclass(eq=False)
+class _Candidate:
+    group: PodGroup
+    keys: Set[str]
+    nodes: Set[str]
+    exclusive: int = 0
+
+    @property
+    def cost(self):
+        return (len(self.keys), len(self.keys) * self.group.priority)
+
+
+class PreemptionPlanner:
+    # Picks the victim groups for a preemptor before anything is evicted.
+    # Cost is (pods evicted, size-weighted victim priority), compared
+    # lexicographically. A 0/1 knapsack over the nodes each group frees on
+    # its own finds the cheapest cover; shared nodes are then accounted for
+    # exactly and the set is topped up or pruned until it is minimal. With
+    # packing, pods share nodes, so progress is the pending pods that fit
+    # in the room victims leave (NodeIndex.capacity_for) and the set is
+    # built greedily from nothing instead.
+
+    def __init__(self, gang_manager, node_index):
+        self.gang_manager = gang_manager
+        self.node_index = node_index
+
+    def plan(self, gang_id) -> Optional[PreemptionPlan]:
+        group = self.gang_manager.get_group(gang_id)
+        if not group:
+            return None
+
+        pending = [p for p in group.pods
+                   if getattr(p.status, "phase", None) == "Pending"
+                   and not (p.spec and p.spec.node_name)
+                   and not self.node_index.is_assumed(pod_key(p))]
+        # Only nodes the preemptor can use count, both free and freed.
+        feasible = self.node_index.feasible_mask(pending[0]) if pending else None
+        needed = len(pending) - self.node_index.capacity_for(pending, gang_id, feasible)
+        plan = PreemptionPlan(gang_id=gang_id, needed_nodes=max(needed, 0), pending=len(pending))
+        if needed <= 0:
+            return plan
+
+        candidates = self._candidates(group, feasible)
+        if self.node_index.packing is None:
+            def progress(chosen):
+                return len(self._freed_nodes(chosen))
+            chosen = self._knapsack(candidates, needed)
+        else:
+            def progress(chosen):
+                keys = set().union(*(c.keys for c in chosen))
+                nodes = set().union(*(c.nodes for c in chosen))
+                index = self.node_index
+                return (index.capacity_for(pending, gang_id, feasible, evicting=keys, nodes=nodes)
+                        - index.capacity_for(pending, gang_id, feasible, nodes=nodes))
+            chosen = []
+        chosen = self._top_up(candidates, chosen, needed, progress)
+        chosen = self._prune(chosen, needed, progress)
+
+        plan.victims = [c.group for c in chosen]
+        plan.freed = progress(chosen)
+        if self.node_index.packing is None:
+            plan.freed_nodes = self._freed_nodes(chosen)
+        else:
+            plan.freed_nodes = set().union(*(c.nodes for c in chosen))
+        plan.victim_pods = {c.group.gang_id: len(c.keys) for c in chosen}
+        plan.evicted_pods = sum(plan.victim_pods.values())
+        plan.priority_cost = sum(c.cost[1] for c in chosen)
+        return plan
+
+    def _candidates(self, group, feasible=None):
+        # Only evictable pods count, and only nodes the preemptor could use
+        # that aren't nominated to another gang; groups left with no node
+        # are left out. Pods already terminating free their nodes without
+        # us, and evicting them again would count as a failure.
+        groups = self.gang_manager.groups(GroupSelector(max_priority=group.priority - 1))
+        candidates = []
+        owner: Dict[str, _Candidate] = {}
+        for g in groups:
+            if g.gang_id == group.gang_id or g.gang_id is None:
+                continue
+            pods = [p for p in g.pods if is_evictable(p)]
+            keys = {pod_key(p) for p in pods}
+            nodes = {n for n in (active_node_of(p) for p in pods)
+                     if n and (feasible is None or self.node_index.labels.contains(feasible, n))
+                     and self.node_index.nominated_to(n) in (None, group.gang_id)}
+            if not nodes:
+                continue
+            candidate = _Candidate(group=g, keys=keys, nodes=nodes)
+            candidates.append(candidate)
+            for key in keys:
+                owner[key] = candidate
+
+        for candidate in candidates:
+            candidate.exclusive = sum(
+                1 for n in candidate.nodes
+                if all(owner.get(k) is candidate for k in self.node_index.occupants(n))
+            )
+        return candidates
+
+    @staticmethod
+    def _knapsack(candidates, needed):
+        # best[c] = (cost, chosen) freeing at least c nodes; chosen is a
+        # linked tuple (candidate, rest) so states share their tails.
+        best: List[Optional[Tuple[Tuple[int, int], Optional[tuple]]]] = [None] * (needed + 1)
+        best[0] = ((0, 0), None)
+        for candidate in candidates:
+            if candidate.exclusive == 0:
+                continue
+            size, prio = candidate.cost
+            for c in range(needed, -1, -1):
+                if best[c] is None:
+                    continue
+                (pods, prio_cost), chain = best[c]
+                target = min(needed, c + candidate.exclusive)
+                cost = (pods + size, prio_cost + prio)
+                if best[target] is None or cost < best[target][0]:
+                    best[target] = (cost, (candidate, chain))
+
+        reachable = [c for c in range(needed, -1, -1) if best[c] is not None]
+        chain = best[reachable[0]][1]
+        chosen = []
+        while chain is not None:
+            chosen.append(chain[0])
+            chain = chain[1]
+        return chosen
+
+    def _freed_nodes(self, chosen):
+        keys = set()
+        nodes = set()
+        for c in chosen:
+            keys |= c.keys
+            nodes |= c.nodes
+        return {n for n in nodes if self.node_index.occupants(n) <= keys}
+
+    @staticmethod
+    def _top_up(candidates, chosen, needed, progress):
+        # Nodes shared between groups only free up once every occupant
+        # goes, so greedily add whichever group adds the most per pod.
+        chosen = list(chosen)
+        remaining = [c for c in candidates if c not in chosen]
+        done = progress(chosen)
+        while done < needed and remaining:
+            gains = {id(c): (progress(chosen + [c]) - done) / len(c.keys) for c in remaining}
+            best = max(remaining, key=lambda c: (gains[id(c)], -c.cost[1]))
+            if gains[id(best)] == 0 and len(remaining) > 1:
+                # No single group helps; take the cheapest to unlock shared nodes.
+                best = min(remaining, key=lambda c: c.cost)
+            remaining.remove(best)
+            chosen.append(best)
+            done = progress(chosen)
+        return chosen
+
+    @staticmethod
+    def _prune(chosen, needed, progress):
+        if progress(chosen) < needed:
+            return chosen
+        for c in sorted(chosen, key=lambda c: c.cost, reverse=True):
+            rest = [o for o in chosen if o is not c]
+            if progress(rest) >= needed:
+                chosen = rest
+        return chosen
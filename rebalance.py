@@ -0,0 +1,243 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from kubernetes.client.exceptions import ApiException
+from cache import list_items, pod_key
+from gang import GroupSelector
+from pod_utils import active_node_of, is_daemonset_pod, is_evictable, is_terminating
+from resources import MostAllocated, fits, group_requests, max_copies, pod_requests
+
+DEFAULT_REBALANCE_INTERVAL = 30.0
+DEFAULT_MAX_EVICTIONS = 10
+
+# Defragmentation for packed clusters: low-priority pods left spread over
+# many nodes keep every node partly used, so large gangs have to preempt.
+# The rebalancer looks for nodes whose pods all belong to relocatable
+# low-priority groups that would fit into the spare room of other busy
+# nodes, and evicts those groups so their controllers recreate the pods and
+# the packing strategy places them on the fuller nodes. Groups move whole.
+#
+# Disruption is bounded: at most max_evictions pods per interval, and a
+# group only moves if its PodDisruptionBudgets allow evicting all of its
+# pods. A budget's allowance is shared by every pod it covers, so the pods
+# of a move are counted against each budget's disruptionsAllowed (read via
+# PolicyV1Api) before anything is evicted; per-pod dry runs only see one
+# pod at a time. A group the eviction API still splits is reported and the
+# step stops.
+
+
+@dataclass
+class RebalancePolicy:
+    interval: float = DEFAULT_REBALANCE_INTERVAL
+    max_evictions: int = DEFAULT_MAX_EVICTIONS  # pods per interval
+    max_priority: int = 0  # groups above this priority are never moved
+    min_free_nodes: int = 0  # free nodes to keep even with no gang waiting
+
+
+@dataclass
+class Move:
+    node: str  # the node this frees
+    groups: List[str] = field(default_factory=list)
+    pods: int = 0
+
+
+def _relocatable(group) -> bool:
+    # Only pods a controller will recreate can be moved by eviction.
+    return bool(group.gang_id) and all(
+        p.metadata.owner_references and not is_daemonset_pod(p) and not is_terminating(p)
+        and active_node_of(p) for p in group.pods)
+
+
+class Rebalancer:
+    def __init__(self, node_discovery, gang_manager, policy: Optional[RebalancePolicy] = None,
+                 clock=time.monotonic, v1=None, policy_v1=None):
+        # v1 and policy_v1 list pods and disruption budgets; without
+        # policy_v1 only the per-pod dry runs guard against budgets.
+        self.node_discovery = node_discovery
+        self.gang_manager = gang_manager
+        self.v1 = v1
+        self.policy_v1 = policy_v1
+        self.policy = policy or RebalancePolicy()
+        self._clock = clock
+        self._next_run = 0.0
+        self._strategy = MostAllocated()
+
+    def plan(self, want, budget=None, for_pods=None) -> List[Move]:
+        # Up to `want` moves, each freeing one node, evicting at most
+        # `budget` pods in total. With for_pods, want counts those pods
+        # instead: moves stop once the freed nodes have room for that many
+        # of them, and nodes they can't use are not cleared.
+        budget = self.policy.max_evictions if budget is None else budget
+        index = self.node_discovery.index
+        requests = group_requests(pod_requests(p) for p in for_pods) if for_pods else None
+        feasible = index.feasible_mask(for_pods[0]) if for_pods and index is not None else None
+        statuses = {s.name: s for s in self.node_discovery.get_nodes_with_status()}
+        requested = {name: dict(s.requested) for name, s in statuses.items()}
+        groups_on: Dict[str, list] = {}
+        for group in self.gang_manager.groups(GroupSelector(max_priority=self.policy.max_priority)):
+            if not _relocatable(group):
+                continue
+            for node in {active_node_of(p) for p in group.pods}:
+                groups_on.setdefault(node, []).append(group)
+
+        def used(name):
+            s = statuses[name]
+            return self._strategy.score(s.allocatable, requested[name], {})
+
+        # Emptiest nodes are the cheapest to clear; free ones stay free.
+        busy = sorted((n for n, s in statuses.items() if not s.is_free and n in groups_on), key=used)
+        moves: List[Move] = []
+        freed: Set[str] = set()
+        moved: Set[str] = set()
+        room = 0
+        for node in busy:
+            if (room if for_pods else len(moves)) >= want:
+                break
+            if feasible is not None and not index.labels.contains(feasible, node):
+                continue
+            groups = [g for g in groups_on[node] if g.gang_id not in moved]
+            pods = [p for g in groups for p in g.pods]
+            if not groups or len(pods) > budget:
+                continue
+            trial = self._relocate(pods, node, statuses, requested, freed | {node})
+            if trial is None:
+                continue
+            gained = _room(requests, statuses[node].allocatable, trial[node]) if for_pods else 1
+            if not gained:
+                continue
+            room += gained
+            requested = trial
+            freed.add(node)
+            moved.update(g.gang_id for g in groups)
+            budget -= len(pods)
+            moves.append(Move(node=node, groups=[g.gang_id for g in groups], pods=len(pods)))
+        return moves
+
+    def _relocate(self, pods, node, statuses, requested, excluded):
+        # Requested resources after moving pods off their nodes, or None if
+        # something else is left on `node` or a pod fits nowhere.
+        # System and DaemonSet pods stay behind; they don't keep a node busy.
+        index = self.node_discovery.index
+        if index is not None and not index.occupants(node) <= {pod_key(p) for p in pods}:
+            return None
+        trial = {name: dict(r) for name, r in requested.items()}
+        requests = [(p, pod_requests(p)) for p in pods]
+        for p, request in requests:
+            current = trial.setdefault(active_node_of(p), {})
+            for name, value in request.items():
+                current[name] = current.get(name, 0) - value
+        if index is None and any(trial[node].values()):
+            return None
+        targets = [n for n, s in statuses.items() if not s.is_free and n not in excluded]
+        for p, request in sorted(requests, key=lambda r: -sum(r[1].values())):
+            feasible = index.feasible_mask(p) if index is not None else None
+            best, best_score = None, None
+            for name in targets:
+                allocatable = statuses[name].allocatable
+                if feasible is not None and not index.labels.contains(feasible, name):
+                    continue
+                if not fits(request, allocatable, trial[name]):
+                    continue
+                score = self._strategy.score(allocatable, trial[name], request)
+                if best_score is None or score > best_score:
+                    best, best_score = name, score
+            if best is None:
+                return None
+            for name, value in request.items():
+                trial[best][name] = trial[best].get(name, 0) + value
+        return trial
+
+    def due(self) -> bool:
+        return self._clock() >= self._next_run
+
+    def step(self, want, for_pods=None) -> List[Move]:
+        # Called from the scheduler tick; acts at most once per interval.
+        if want <= 0 or not self.due():
+            return []
+        self._next_run = self._clock() + self.policy.interval
+        done = []
+        budgets: Dict[str, list] = {}
+        for move in self.plan(want, for_pods=for_pods):
+            victims = {g: self._victims(g) for g in move.groups}
+            keys = {pod_key(p) for pods in victims.values() for p in pods}
+            refusing = self._over_budget(keys, budgets)
+            if refusing is not None:
+                print(f"Not freeing {move.node}: disruption budget {refusing} can't cover evicting "
+                      f"{', '.join(move.groups)}")
+                continue
+            counts = self.gang_manager.preempt_groups(move.groups, dry_run=True)
+            if any(counts.get(g) is None or counts[g] < len(victims[g]) for g in move.groups):
+                print(f"Not freeing {move.node}: disruption budget refuses evicting {', '.join(move.groups)}")
+                continue
+            print(f"Freeing {move.node} by relocating {move.pods} pods of groups {', '.join(move.groups)}")
+            counts = self.gang_manager.preempt_groups(move.groups)
+            split = [g for g in move.groups if counts.get(g) is None or counts[g] < len(victims[g])]
+            if split:
+                print(f"Rebalancing {move.node} split groups {', '.join(split)}: only some of their pods "
+                      f"were evicted; stopping")
+                break
+            for budget in budgets.values():
+                for entry in budget:
+                    entry[2] -= len(entry[1] & keys)
+            done.append(move)
+        return done
+
+    def _victims(self, gang_id):
+        group = self.gang_manager.get_group(gang_id)
+        return [p for p in group.pods if is_evictable(p)] if group else []
+
+    def _over_budget(self, keys, budgets) -> Optional[str]:
+        # The first budget with fewer disruptions left than the pods with
+        # these keys it covers, or None. budgets caches [name, covered pod
+        # keys, disruptions left] per namespace for the step.
+        if self.policy_v1 is None or self.v1 is None:
+            return None
+        for namespace in sorted({key.split("/", 1)[0] for key in keys}):
+            if namespace not in budgets:
+                try:
+                    budgets[namespace] = self._budgets(namespace)
+                except ApiException as e:
+                    print(f"Failed to read disruption budgets in {namespace}: {e.reason}")
+                    return f"{namespace}/* (unreadable)"
+            for name, covered, allowed in budgets[namespace]:
+                if len(covered & keys) > allowed:
+                    return f"{namespace}/{name}"
+        return None
+
+    def _budgets(self, namespace):
+        budgets = []
+        for pdb in self.policy_v1.list_namespaced_pod_disruption_budget(namespace).items:
+            selector = _label_selector(pdb.spec.selector) if pdb.spec else None
+            if selector is None:
+                continue
+            covered = {pod_key(p) for p in list_items(self.v1.list_pod_for_all_namespaces,
+                                                      field_selector=f"metadata.namespace={namespace}",
+                                                      label_selector=selector)}
+            allowed = (pdb.status.disruptions_allowed if pdb.status else None) or 0
+            budgets.append([pdb.metadata.name, covered, allowed])
+        return budgets
+
+
+def _room(requests, allocatable, requested) -> int:
+    # How many pods of the grouped requests fit next to what's requested.
+    requested = dict(requested)
+    placed = 0
+    for request, count in requests:
+        n = max_copies(request, allocatable, requested, count)
+        for name, value in request.items():
+            requested[name] = requested.get(name, 0) + value * n
+        placed += n
+    return placed
+
+
+def _label_selector(selector) -> Optional[str]:
+    # A V1LabelSelector as a label selector string; None selects nothing
+    # and "" everything, as for a PodDisruptionBudget.
+    if selector is None:
+        return None
+    terms = [f"{k}={v}" for k, v in sorted((selector.match_labels or {}).items())]
+    for e in selector.match_expressions or ():
+        values = ",".join(e.values or ())
+        terms.append({"In": f"{e.key} in ({values})", "NotIn": f"{e.key} notin ({values})",
+                      "Exists": e.key, "DoesNotExist": f"!{e.key}"}[e.operator])
+    return ",".join(terms)
@@ -0,0 +1,250 @@
+import sys
+from typing import Dict, FrozenSet, Optional, Tuple
+from backfill import DEFAULT_PREEMPTIBLE_ANNOTATION, DEFAULT_RUNTIME_ANNOTATION
+from feasibility import Constrained, constraints_of, shared_constraints
+from gang import DEFAULT_GROUP_ANNOTATION, DEFAULT_PRIORITY_ANNOTATION
+from permit import DEFAULT_GROUP_SIZE_ANNOTATION
+from resources import CPU, pod_requests
+
+# Annotations the scheduler reads; everything else (last-applied
+# configuration, tooling metadata) is dropped from the record.
+DEFAULT_RECORD_ANNOTATIONS: FrozenSet[str] = frozenset(
+    {DEFAULT_GROUP_ANNOTATION, DEFAULT_PRIORITY_ANNOTATION, DEFAULT_GROUP_SIZE_ANNOTATION,
+     DEFAULT_PREEMPTIBLE_ANNOTATION, DEFAULT_RUNTIME_ANNOTATION})
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Owner:
+    __slots__ = ("kind",)
+
+    def __init__(self, kind):
+        self.kind = kind
+
+
+class _Requests:
+    # Stands in for both a container and its resources: one per distinct
+    # effective request, shared by every record with that request. key is
+    # the request in units, as a sorted tuple.
+    __slots__ = ("requests", "key")
+
+    def __init__(self, requests, key):
+        self.requests = requests
+        self.key = key
+
+    @property
+    def resources(self):
+        return self
+
+
+_owners: Dict[str, Tuple[_Owner, ...]] = {}
+_requests: Dict[tuple, Tuple[_Requests, ...]] = {}
+
+
+def _owners_of(refs):
+    if not refs:
+        return None
+    return _owners_from_kinds(",".join(sorted(r.kind or "" for r in refs)))
+
+
+def _owners_from_kinds(kinds):
+    shared = _owners.get(kinds)
+    if shared is None:
+        shared = _owners[sys.intern(kinds)] = tuple(_Owner(sys.intern(k)) for k in kinds.split(","))
+    return shared
+
+
+def _containers_of(pod):
+    # Stored as quantities so resources.pod_requests gives back exactly the
+    # effective request of the original pod.
+    request = pod_requests(pod)
+    return _containers_from_request(tuple(sorted(request.items())))
+
+
+def _containers_from_request(key):
+    shared = _requests.get(key)
+    if shared is None:
+        quantities = {name: f"{value}m" if name == CPU else str(value) for name, value in key}
+        shared = _requests[key] = (_Requests(quantities, key),)
+    return shared
+
+
+class PodRecord(Constrained):
+    # Compact, immutable view of a pod holding only what scheduling reads.
+    # metadata, spec and status all return the record itself, so code
+    # written against client.V1Pod (pod.metadata.name, pod.spec.node_name,
+    # pod.status.phase, ...) works on it unchanged. Node selector, affinity
+    # and tolerations are kept only as feasibility.Constraints.
+    __slots__ = ("name", "namespace", "annotations", "owner_references", "deletion_timestamp",
+                 "resource_version", "node_name", "scheduler_name", "priority", "phase", "containers",
+                 "constraints")
+
+    def __init__(self, name, namespace, annotations, owner_references, deletion_timestamp,
+                 resource_version, node_name, scheduler_name, priority, phase, containers, constraints=None):
+        set_ = object.__setattr__
+        set_(self, "name", name)
+        set_(self, "namespace", namespace)
+        set_(self, "annotations", annotations)
+        set_(self, "owner_references", owner_references)
+        set_(self, "deletion_timestamp", deletion_timestamp)
+        set_(self, "resource_version", resource_version)
+        set_(self, "node_name", node_name)
+        set_(self, "scheduler_name", scheduler_name)
+        set_(self, "priority", priority)
+        set_(self, "phase", phase)
+        set_(self, "containers", containers)
+        set_(self, "constraints", constraints)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"PodRecord is immutable; cannot set {name}")
+
+    @property
+    def metadata(self):
+        return self
+
+    @property
+    def spec(self):
+        return self
+
+    @property
+    def status(self):
+        return self
+
+    @property
+    def init_containers(self):
+        return None
+
+    @property
+    def overhead(self):
+        return None
+
+    def __repr__(self):
+        return f"PodRecord({self.namespace}/{self.name}, node={self.node_name}, phase={self.phase})"
+
+    def fields(self) -> tuple:
+        # Plain values only (str/int/dict/tuple/None), e.g. for marshal.
+        deleted = self.deletion_timestamp
+        return (self.name, self.namespace, self.annotations,
+                ",".join(o.kind for o in self.owner_references) if self.owner_references else None,
+                None if deleted is None else str(deleted), self.resource_version, self.node_name,
+                self.scheduler_name, self.priority, self.phase,
+                self.containers[0].key if self.containers else None,
+                self.constraints.fields() if self.constraints else None)
+
+    @classmethod
+    def from_fields(cls, fields):
+        (name, namespace, annotations, owner_kinds, deleted, resource_version, node_name,
+         scheduler_name, priority, phase, request, constraints) = fields
+        return cls(
+            name=name,
+            namespace=_intern(namespace),
+            annotations={sys.intern(k): _intern(v) for k, v in annotations.items()} if annotations else None,
+            owner_references=_owners_from_kinds(owner_kinds) if owner_kinds is not None else None,
+            deletion_timestamp=deleted,
+            resource_version=resource_version,
+            node_name=_intern(node_name),
+            scheduler_name=_intern(scheduler_name),
+            priority=priority,
+            phase=_intern(phase),
+            containers=_containers_from_request(request) if request is not None else None,
+            constraints=shared_constraints(constraints) if constraints is not None else None,
+        )
+
+    @classmethod
+    def from_pod(cls, pod, annotations: Optional[FrozenSet[str]] = DEFAULT_RECORD_ANNOTATIONS):
+        # Accepts client.V1Pod, pod_decode.Pod or another record.
+        if isinstance(pod, cls):
+            return pod
+        meta, spec, status = pod.metadata, pod.spec, pod.status
+        kept = meta.annotations or {}
+        if annotations is not None:
+            kept = {sys.intern(k): _intern(v) for k, v in kept.items() if k in annotations}
+        return cls(
+            name=meta.name,
+            namespace=_intern(meta.namespace),
+            annotations=kept or None,
+            owner_references=_owners_of(meta.owner_references),
+            deletion_timestamp=meta.deletion_timestamp,
+            resource_version=meta.resource_version,
+            node_name=_intern(spec.node_name) if spec else None,
+            scheduler_name=_intern(spec.scheduler_name) if spec else None,
+            priority=spec.priority if spec else None,
+            phase=_intern(status.phase) if status else None,
+            containers=_containers_of(pod) if spec else None,
+            constraints=constraints_of(pod) if spec else None,
+        )
+
+
+class _Taint:
+    __slots__ = ("key", "value", "effect")
+
+    def __init__(self, key, value, effect):
+        self.key = key
+        self.value = value
+        self.effect = effect
+
+
+class NodeRecord:
+    # Node counterpart of PodRecord: metadata, spec and status are the
+    # record itself, keeping what placement reads.
+    __slots__ = ("name", "labels", "taints", "unschedulable", "allocatable", "resource_version")
+
+    def __init__(self, name, labels, taints, unschedulable, allocatable, resource_version):
+        set_ = object.__setattr__
+        set_(self, "name", name)
+        set_(self, "labels", labels)
+        set_(self, "taints", taints)
+        set_(self, "unschedulable", unschedulable)
+        set_(self, "allocatable", allocatable)
+        set_(self, "resource_version", resource_version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"NodeRecord is immutable; cannot set {name}")
+
+    @property
+    def metadata(self):
+        return self
+
+    @property
+    def spec(self):
+        return self
+
+    @property
+    def status(self):
+        return self
+
+    def __repr__(self):
+        return f"NodeRecord({self.name})"
+
+    def fields(self) -> tuple:
+        taints = tuple((t.key, t.value, t.effect) for t in self.taints) if self.taints else None
+        return (self.name, self.labels, taints, self.unschedulable, self.allocatable, self.resource_version)
+
+    @classmethod
+    def from_fields(cls, fields):
+        name, labels, taints, unschedulable, allocatable, resource_version = fields
+        return cls(
+            name=sys.intern(name),
+            labels={sys.intern(k): _intern(v) for k, v in labels.items()} if labels else None,
+            taints=tuple(_Taint(*t) for t in taints) if taints else None,
+            unschedulable=unschedulable,
+            allocatable=allocatable,
+            resource_version=resource_version,
+        )
+
+    @classmethod
+    def from_node(cls, node):
+        if isinstance(node, cls):
+            return node
+        meta, spec, status = node.metadata, node.spec, node.status
+        taints = spec.taints if spec else None
+        return cls.from_fields((
+            meta.name,
+            meta.labels,
+            tuple((t.key, t.value, t.effect) for t in taints) if taints else None,
+            bool(spec.unschedulable) if spec else False,
+            dict(status.allocatable) if status and status.allocatable else None,
+            meta.resource_version,
+        ))
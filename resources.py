@@ -0,0 +1,99 @@
+import math
+from typing import Dict, Iterable, Optional
+from kubernetes.utils import parse_quantity
+
+CPU = "cpu"
+MEMORY = "memory"
+
+# CPU is tracked in millicores, everything else in whole units (bytes for
+# memory, devices for extended resources like nvidia.com/gpu).
+_SCALE = {CPU: 1000}
+
+
+def _to_units(name, quantity):
+    return int(math.ceil(parse_quantity(quantity) * _SCALE.get(name, 1)))
+
+
+def parse_resources(quantities) -> Dict[str, int]:
+    return {name: _to_units(name, q) for name, q in (quantities or {}).items()}
+
+
+def _add(total, extra):
+    for name, value in extra.items():
+        total[name] = total.get(name, 0) + value
+    return total
+
+
+def pod_requests(pod) -> Dict[str, int]:
+    # Effective request: sum of app containers, at least the largest init
+    # container, plus pod overhead.
+    spec = pod.spec
+    total: Dict[str, int] = {}
+    for container in spec.containers or []:
+        _add(total, parse_resources(container.resources.requests if container.resources else None))
+    for container in spec.init_containers or []:
+        init = parse_resources(container.resources.requests if container.resources else None)
+        for name, value in init.items():
+            total[name] = max(total.get(name, 0), value)
+    return _add(total, parse_resources(getattr(spec, "overhead", None)))
+
+
+def node_allocatable(node) -> Dict[str, int]:
+    status = node.status
+    return parse_resources(status.allocatable if status else None)
+
+
+def fits(request, allocatable, requested) -> bool:
+    for name, value in request.items():
+        if value and requested.get(name, 0) + value > allocatable.get(name, 0):
+            return False
+    return True
+
+
+class _UtilizationStrategy:
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights or {CPU: 1.0, MEMORY: 1.0}
+
+    def _utilization(self, allocatable, requested, request):
+        total = weight_sum = 0.0
+        for name, weight in self.weights.items():
+            capacity = allocatable.get(name, 0)
+            if not capacity:
+                continue
+            used = requested.get(name, 0) + request.get(name, 0)
+            total += weight * used / capacity
+            weight_sum += weight
+        return total / weight_sum if weight_sum else 0.0
+
+
+class MostAllocated(_UtilizationStrategy):
+    # Bin-packs: prefer the node that is fullest after placing the pod.
+    def score(self, allocatable, requested, request):
+        return self._utilization(allocatable, requested, request)
+
+
+class LeastAllocated(_UtilizationStrategy):
+    # Spreads: prefer the node with the most room left after placing the pod.
+    def score(self, allocatable, requested, request):
+        return 1.0 - self._utilization(allocatable, requested, request)
+
+
+def max_copies(request, allocatable, requested, limit) -> int:
+    # How many pods with this request still fit on a node, capped at limit.
+    count = limit
+    for name, value in request.items():
+        if value:
+            count = min(count, (allocatable.get(name, 0) - requested.get(name, 0)) // value)
+    return max(count, 0)
+
+
+def request_key(request) -> tuple:
+    return tuple(sorted((k, v) for k, v in request.items() if v))
+
+
+def group_requests(requests: Iterable[Dict[str, int]]):
+    counts: Dict[tuple, int] = {}
+    for request in requests:
+        key = request_key(request)
+        counts[key] = counts.get(key, 0) + 1
+    return [(dict(key), n) for key, n in counts.items()]
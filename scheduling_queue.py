@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from cache import pod_key
+from gang import PodGroupDiscoverer, DEFAULT_PRIORITY_ANNOTATION
+
+DEFAULT_INITIAL_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 10.0
+_COMPACT_SLACK = 64
+
+
+class SchedulingQueue:
+    # Sits between the watch and the scheduling loop. Pods are keyed by
+    # namespace/name so repeated updates coalesce into one entry holding the
+    # latest object, the active heap pops the highest priority first, and
+    # pods that failed to schedule wait out an exponential backoff.
+
+    def __init__(self, initial_backoff=DEFAULT_INITIAL_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 priority_annotation=DEFAULT_PRIORITY_ANNOTATION, clock=time.monotonic):
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.priority_annotation = priority_annotation
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._pods: Dict[str, object] = {}
+        self._active: List[Tuple[int, int, str]] = []
+        self._active_seq: Dict[str, int] = {}
+        self._backoff: List[Tuple[float, int, str]] = []
+        self._backoff_seq: Dict[str, int] = {}
+        self._attempts: Dict[str, int] = {}
+
+    def add(self, pod):
+        key = pod_key(pod)
+        with self._cond:
+            self._pods[key] = pod
+            if key in self._active_seq or key in self._backoff_seq:
+                return
+            self._push_active(key, pod)
+            self._cond.notify()
+
+    def backoff(self, pod):
+        key = pod_key(pod)
+        with self._cond:
+            self._pods[key] = pod
+            self._active_seq.pop(key, None)
+            attempts = self._attempts.get(key, 0) + 1
+            self._attempts[key] = attempts
+            delay = min(self.initial_backoff * (2 ** (attempts - 1)), self.max_backoff)
+            seq = next(self._seq)
+            self._backoff_seq[key] = seq
+            heapq.heappush(self._backoff, (self._clock() + delay, seq, key))
+            self._cond.notify()
+
+    def activate(self, pods):
+        # Skip any remaining backoff, e.g. once the capacity a pod was
+        # waiting for has been freed.
+        with self._cond:
+            for pod in pods:
+                key = pod_key(pod)
+                self._pods[key] = pod
+                self._backoff_seq.pop(key, None)
+                if key not in self._active_seq:
+                    self._push_active(key, pod)
+            self._cond.notify()
+
+    def backing_off(self, key) -> bool:
+        with self._cond:
+            return key in self._backoff_seq
+
+    def done(self, key):
+        with self._cond:
+            self._attempts.pop(key, None)
+
+    def delete(self, key):
+        with self._cond:
+            self._pods.pop(key, None)
+            self._active_seq.pop(key, None)
+            self._backoff_seq.pop(key, None)
+            self._attempts.pop(key, None)
+
+    def pop(self, timeout: Optional[float] = None):
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            while True:
+                self._flush_locked()
+                while self._active:
+                    _, seq, key = heapq.heappop(self._active)
+                    if self._active_seq.get(key) == seq:
+                        del self._active_seq[key]
+                        return self._pods.pop(key)
+
+                wait = None if deadline is None else deadline - self._clock()
+                if self._backoff:
+                    until_ready = self._backoff[0][0] - self._clock()
+                    wait = until_ready if wait is None else min(wait, until_ready)
+                if wait is not None and wait <= 0:
+                    if deadline is not None and self._clock() >= deadline:
+                        return None
+                    continue
+                self._cond.wait(wait)
+
+    def flush(self):
+        with self._cond:
+            if self._flush_locked():
+                self._cond.notify()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._active_seq) + len(self._backoff_seq)
+
+    def _flush_locked(self):
+        self._compact_locked()
+        moved = False
+        now = self._clock()
+        while self._backoff and self._backoff[0][0] <= now:
+            _, seq, key = heapq.heappop(self._backoff)
+            if self._backoff_seq.get(key) != seq:
+                continue
+            del self._backoff_seq[key]
+            self._push_active(key, self._pods[key])
+            moved = True
+        return moved
+
+    def _compact_locked(self):
+        # delete/activate leave stale entries in the heaps that are only
+        # skipped when popped; rebuild a heap once they outnumber live ones.
+        for heap, live in ((self._active, self._active_seq), (self._backoff, self._backoff_seq)):
+            if len(heap) > 2 * len(live) + _COMPACT_SLACK:
+                heap[:] = [e for e in heap if live.get(e[2]) == e[1]]
+                heapq.heapify(heap)
+
+    def _push_active(self, key, pod):
+        seq = next(self._seq)
+        self._active_seq[key] = seq
+        priority = PodGroupDiscoverer._priority_of(pod, self.priority_annotation)
+        heapq.heappush(self._active, (-priority, seq, key))
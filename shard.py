@@ -0,0 +1,82 @@
+import multiprocessing
+import threading
+import time
+import zlib
+from typing import Optional, Tuple
+
+DEFAULT_CLAIM_TTL = 5.0
+
+# Sharded scheduling: N scheduler workers, each owning the gangs whose
+# pod-group hashes to its shard. Every worker watches the whole cluster, so
+# node choices are made against a local (possibly stale) view. A worker
+# claims a node in a shared table before binding to it; a claim held by
+# another worker is a conflict and the worker moves on to another node.
+# Claims expire after a TTL longer than a bind plus the watch delay, by
+# which time every worker sees the pod on the node.
+
+
+def shard_of(group_id, shards) -> int:
+    # crc32 rather than hash(): it has to agree across processes.
+    return zlib.crc32(group_id.encode()) % shards
+
+
+class NodeClaims:
+    # node name -> (holder, expiry). The table and lock default to local
+    # ones for workers sharing a process; shared() backs them with a
+    # multiprocessing manager so they can be handed to worker processes.
+
+    def __init__(self, table=None, lock=None, clock=time.time):
+        self._table = {} if table is None else table
+        self._lock = threading.Lock() if lock is None else lock
+        self._clock = clock
+
+    @classmethod
+    def shared(cls, manager):
+        return cls(manager.dict(), manager.Lock())
+
+    def claim(self, node, holder, ttl=DEFAULT_CLAIM_TTL) -> bool:
+        # Takes or extends the claim unless another holder's is still live.
+        with self._lock:
+            now = self._clock()
+            current = self._table.get(node)
+            if current is not None and current[0] != holder and current[1] > now:
+                return False
+            self._table[node] = (holder, now + ttl)
+            return True
+
+    def release(self, node, holder):
+        with self._lock:
+            current = self._table.get(node)
+            if current is not None and current[0] == holder:
+                del self._table[node]
+
+    def holder_of(self, node) -> Optional[str]:
+        current = self._table.get(node)
+        if current is None or current[1] <= self._clock():
+            return None
+        return current[0]
+
+
+def run_workers(workers, stop=None, **scheduler_kwargs):
+    # One Scheduler process per shard, sharing a claims table. Each process
+    # keeps its own cache and watches, so apiserver watch load grows with
+    # the worker count. Setting the optional stop event terminates them.
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        claims = NodeClaims.shared(manager)
+        processes = [context.Process(target=_run_worker, args=((i, workers), claims, scheduler_kwargs),
+                                     name=f"scheduler-shard-{i}")
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        if stop is not None:
+            stop.wait()
+            for process in processes:
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+def _run_worker(shard: Tuple[int, int], claims: NodeClaims, scheduler_kwargs):
+    from main import Scheduler
+    Scheduler(shard=shard, claims=claims, **scheduler_kwargs).run()
@@ -0,0 +1,95 @@
+import gc
+import marshal
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+from records import NodeRecord, PodRecord
+
+# On-disk copy of the cluster cache: pod and node records as plain tuples
+# plus the resource version each store had reached, marshalled behind a
+# small header. Loading maps the file and unmarshals straight from the map.
+# Gang state is not stored; GangIndex rebuilds it from the restored pods.
+
+MAGIC = b"GSNP"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sI")
+DEFAULT_SNAPSHOT_INTERVAL = 60.0
+
+
+@dataclass
+class Snapshot:
+    pods: List[PodRecord] = field(default_factory=list)
+    nodes: List[NodeRecord] = field(default_factory=list)
+    pods_version: Optional[str] = None
+    nodes_version: Optional[str] = None
+    taken_at: float = 0.0
+
+
+def save(path, snapshot: Snapshot):
+    payload = marshal.dumps({
+        "pods": [PodRecord.from_pod(p).fields() for p in snapshot.pods],
+        "nodes": [NodeRecord.from_node(n).fields() for n in snapshot.nodes],
+        "pods_version": snapshot.pods_version,
+        "nodes_version": snapshot.nodes_version,
+        "taken_at": snapshot.taken_at,
+    })
+    # Write then rename so a crash mid-write never leaves a torn snapshot.
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load(path) -> Optional[Snapshot]:
+    # Like pod_decode, keep the cyclic collector out of the bulk build.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load(path)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError("file too short")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version = _HEADER.unpack_from(mm)
+                if magic != MAGIC or version != FORMAT_VERSION:
+                    raise ValueError(f"unsupported snapshot format {magic!r} v{version}")
+                with memoryview(mm) as view, view[_HEADER.size:] as body:
+                    data = marshal.loads(body)
+        return Snapshot(
+            pods=[PodRecord.from_fields(f) for f in data["pods"]],
+            nodes=[NodeRecord.from_fields(f) for f in data["nodes"]],
+            pods_version=data["pods_version"],
+            nodes_version=data["nodes_version"],
+            taken_at=data["taken_at"],
+        )
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError, KeyError) as e:
+        print(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def save_cache(cache, path, clock=time.time):
+    pods, pods_version, nodes, nodes_version = cache.state()
+    save(path, Snapshot(pods=pods, nodes=nodes, pods_version=pods_version, nodes_version=nodes_version,
+                        taken_at=clock()))
+
+
+def restore_cache(cache, path) -> Optional[Snapshot]:
+    snap = load(path)
+    if snap is not None:
+        cache.restore(snap.pods, snap.pods_version, snap.nodes, snap.nodes_version)
+    return snap
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import unittest
+from types import SimpleNamespace
+from backfill import backfill_deadline
+from bench.cluster import make_gang, make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from main import Scheduler
+from node import NodeIndex
+
+
+def _annotated(pods, **annotations):
+    for pod in pods:
+        pod.metadata.annotations.update(annotations)
+    return pods
+
+
+class TestBackfillDeadline(unittest.TestCase):
+    def test_preemptible_or_short_enough(self):
+        self.assertEqual(backfill_deadline(_annotated(make_gang("a", 2), preemptible="true"), 60, now=10), 10)
+        self.assertEqual(backfill_deadline(_annotated(make_gang("b", 2), **{"expected-runtime": "30"}), 60, now=10),
+                         40)
+        self.assertIsNone(backfill_deadline(_annotated(make_gang("c", 2), **{"expected-runtime": "90"}), 60, now=10))
+        self.assertIsNone(backfill_deadline(make_gang("d", 2), 60, now=10))
+
+
+class TestReservation(unittest.TestCase):
+    def setUp(self):
+        self.index = NodeIndex()
+        for i in range(4):
+            self.index.on_node_event("ADDED", make_node(f"n{i}"))
+        for i in range(2):
+            self.index.on_pod_event("ADDED", make_pod(f"busy-{i}", "busy", node_name=f"n{i}"))
+
+    def test_freed_nodes_go_to_the_reservation(self):
+        self.index.reserve("big", 3, priority=10)
+        self.index.reserve("small", 1, priority=1)
+        self.assertEqual(self.index.free_nodes(), [])
+        self.assertEqual(self.index.count_free_nodes("big"), 2)
+
+        self.index.on_pod_event("DELETED", make_pod("busy-0", "busy", node_name="n0"))
+        self.assertEqual(self.index.nominated_to("n0"), "big")
+        self.index.on_pod_event("DELETED", make_pod("busy-1", "busy", node_name="n1"))
+        self.assertEqual(self.index.nominated_to("n1"), "small")
+
+        self.index.clear_nominations("big")
+        self.assertEqual(sorted(self.index.free_nodes()), ["n0", "n2", "n3"])
+
+    def test_borrowed_nodes_are_reclaimable_once_enough_are_held(self):
+        self.index.reserve("big", 3)
+        self.assertIsNone(self.index.assume_free_node("default/filler-0", "filler"))
+        node = self.index.assume_free_node("default/filler-0", "filler", borrow=["big"])
+        self.assertEqual(self.index.nominated_to(node), "big")
+        self.assertEqual(self.index.reclaimable("big"), set())
+
+        self.index.on_pod_event("DELETED", make_pod("busy-0", "busy", node_name="n0"))
+        self.assertEqual(self.index.reclaimable("big"), {"default/filler-0"})
+
+
+class TestBackfillScheduling(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        for i in range(4):
+            self.api.add_node(make_node(f"n{i}"))
+        for i in range(2):
+            self.api.add_pod(make_pod(f"svc-{i}", "svc", priority=100, node_name=f"n{i}"))
+        self.big = make_gang("big", 4, priority=50)
+        self.long = make_gang("long", 2, priority=1)
+        self.filler = _annotated(make_gang("filler", 2, priority=1), preemptible="true")
+        for pod in self.big + self.long + self.filler:
+            self.api.add_pod(pod)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api),
+                                       backfill_window=60)
+            self._sync()
+
+    def _sync(self):
+        self.scheduler.cache._relist(self.scheduler.cache._nodes)
+        self.scheduler.cache._relist(self.scheduler.cache._pods)
+
+    def _schedule(self, pods):
+        for pod in pods:
+            self.scheduler._schedule_pod(self.scheduler.cache.get_pod(f"default/{pod.metadata.name}"))
+
+    def _node_of(self, pod):
+        stored = self.api.get_pod("default", pod.metadata.name)
+        return stored.spec.node_name if stored is not None else None
+
+    def test_backfill_then_reclaim(self):
+        index = self.scheduler.node_index
+        with contextlib.redirect_stdout(io.StringIO()):
+            self._schedule(self.big)
+            self.assertEqual({index.nominated_to("n2"), index.nominated_to("n3")}, {"big"})
+
+            # Neither preemptible nor bounded in time: stays pending.
+            self._schedule(self.long)
+            self.assertEqual([self._node_of(p) for p in self.long], [None, None])
+
+            self._schedule(self.filler)
+            self.assertEqual(sorted(self._node_of(p) for p in self.filler), ["n2", "n3"])
+
+            for i in range(2):
+                self.api.remove_pod("default", f"svc-{i}")
+            self._sync()
+            self.assertEqual({index.nominated_to("n0"), index.nominated_to("n1")}, {"big"})
+
+            self.scheduler._on_tick()
+            self.assertEqual(self.api.calls["create_namespaced_pod_eviction"], 2)
+            self._sync()
+            self._schedule(self.big)
+
+        self.assertEqual(sorted(self._node_of(p) for p in self.big), ["n0", "n1", "n2", "n3"])
+        self.assertIsNone(index.reservation("big"))
+
+    def test_only_smaller_gangs_borrow(self):
+        wide = _annotated(make_gang("wide", 4, priority=1), preemptible="true")
+        for pod in wide:
+            self.api.add_pod(pod)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self._sync()
+            self._schedule(self.big)
+
+        def targets(pods):
+            gang = SimpleNamespace(gang_id=pods[0].metadata.annotations["pod-group"],
+                                   pods={f"default/{p.metadata.name}": p for p in pods})
+            return self.scheduler._backfill_targets(gang)
+
+        self.assertEqual(targets(self.filler), ["big"])
+        self.assertEqual(targets(wide), [])
+
+    def test_without_backfill_window_nothing_is_reserved(self):
+        self.scheduler.backfill_window = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            self._schedule(self.big)
+            self._schedule(self.filler)
+        self.assertIsNone(self.scheduler.node_index.reservation("big"))
+        self.assertEqual(sorted(self._node_of(p) for p in self.filler), ["n2", "n3"])
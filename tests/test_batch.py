@@ -0,0 +1,66 @@
+import contextlib
+import io
+import unittest
+from batch import BatchGang, sequential_count, solve
+from bench.cluster import make_gang, make_node
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from main import Scheduler
+
+
+def _names(mask):
+    return [f"n{i}" for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+def _pick(count, mask):
+    return _names(mask)[:count]
+
+
+def _rows(names):
+    return sum(1 << int(n[1:]) for n in names)
+
+
+class TestSolve(unittest.TestCase):
+    def test_most_high_priority_gangs_first(self):
+        gangs = [BatchGang(gang="a", priority=10, size=4, order=0),
+                 BatchGang(gang="b", priority=10, size=2, order=1),
+                 BatchGang(gang="c", priority=10, size=3, order=2),
+                 BatchGang(gang="d", priority=1, size=1, order=3)]
+        free = 0b111111
+
+        plan = solve(gangs, free, _pick, _rows)
+        self.assertEqual([g.gang for g, _ in plan.placed], ["b", "c", "d"])
+        self.assertEqual([g.gang for g in plan.unplaced], ["a"])
+        nodes = [n for _, placed in plan.placed for n in placed]
+        self.assertEqual(len(set(nodes)), 6)
+        self.assertEqual(sequential_count(gangs, free), 2)
+
+    def test_unconstrained_gangs_leave_constrained_nodes(self):
+        gangs = [BatchGang(gang="anywhere", priority=0, size=2, order=0),
+                 BatchGang(gang="pinned", priority=0, size=2, feasible=0b0011, order=1)]
+
+        plan = solve(gangs, 0b1111, _pick, _rows)
+        self.assertEqual({g.gang: nodes for g, nodes in plan.placed},
+                         {"anywhere": ["n2", "n3"], "pinned": ["n0", "n1"]})
+        self.assertEqual(sequential_count(gangs, 0b1111), 1)
+
+
+class TestBatchScheduling(unittest.TestCase):
+    def test_batch_prefers_priority_over_arrival(self):
+        api = FakeCoreV1Api()
+        for i in range(4):
+            api.add_node(make_node(f"node{i}"))
+        pods = make_gang("big", 4, priority=1) + make_gang("hi-a", 2, priority=100) + make_gang("hi-b", 2, priority=100)
+        for pod in pods:
+            api.add_pod(pod)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=api, watch_factory=lambda: FakeWatch(api), batch_window=0.1)
+            scheduler.cache._relist(scheduler.cache._nodes)
+            scheduler.cache._relist(scheduler.cache._pods)
+            report = scheduler._schedule_batch([scheduler.cache.get_pod(f"default/{p.metadata.name}") for p in pods])
+
+        bound = {p.metadata.name: api.get_pod("default", p.metadata.name).spec.node_name for p in pods}
+        self.assertTrue(all(bound[f"hi-{g}-{i}"] for g in "ab" for i in range(2)))
+        self.assertFalse(any(bound[f"big-{i}"] for i in range(4)))
+        self.assertEqual((report.gangs, report.placed, report.sequential), (3, 2, 1))
+        self.assertEqual(scheduler.batch_totals.placed, 2)
@@ -0,0 +1,23 @@
+import unittest
+from bench import micro
+
+
+class TestMicroBench(unittest.TestCase):
+    def test_synthetic_cluster_shape(self):
+        pods, nodes = micro.synthetic_cluster(100, 20)
+        self.assertEqual(len(pods), 100)
+        self.assertEqual(len(nodes), 20)
+        self.assertEqual(sum(1 for p in pods if p.spec.node_name), 18)
+
+    def test_run_reports_time_and_memory(self):
+        results = micro.run(["small"], repeats=1, only=["get_group", "select_node"])
+        self.assertEqual(sorted(results), ["small/get_group", "small/select_node"])
+        for result in results.values():
+            self.assertGreater(result["seconds"], 0)
+            self.assertIn("peak_bytes", result)
+
+    def test_compare_flags_regressions(self):
+        baseline = {"small/groups": {"seconds": 1.0}, "small/get_group": {"seconds": 1.0}}
+        results = {"small/groups": {"seconds": 1.1}, "small/get_group": {"seconds": 2.0},
+                   "small/new_case": {"seconds": 5.0}}
+        self.assertEqual(micro.compare(results, baseline, 1.25), [("small/get_group", 2.0)])
@@ -0,0 +1,253 @@
+import contextlib
+import io
+import json
+import time
+import unittest
+from unittest.mock import Mock
+from bench.cluster import make_node, make_pod
+from cache import ClusterCache, ResourceExpired
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from node import NodeDiscoverer
+from gang import PodGroupDiscoverer
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+
+
+class _FakeWatch:
+    def __init__(self, events):
+        self.events = events
+        self.kwargs = None
+
+    def stream(self, func, **kwargs):
+        self.kwargs = kwargs
+        yield from self.events
+
+    def stop(self):
+        pass
+
+
+class TestClusterCache(unittest.TestCase):
+    def setUp(self):
+        self.mock_v1 = Mock(spec=client.CoreV1Api)
+        self.events = []
+        self.watch = _FakeWatch(self.events)
+        self.cache = ClusterCache(self.mock_v1, resync_period=30, watch_factory=lambda: self.watch)
+
+    def _create_mock_pod(self, name, namespace="default", node_name=None, phase="Running"):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = namespace
+        pod.metadata.annotations = {"pod-group": "g"}
+        pod.metadata.owner_references = []
+        pod.spec = Mock()
+        pod.spec.node_name = node_name
+        pod.spec.priority = 0
+        pod.status = Mock()
+        pod.status.phase = phase
+        return pod
+
+    def _create_mock_node(self, name):
+        node = Mock(spec=client.V1Node)
+        node.metadata = Mock()
+        node.metadata.name = name
+        return node
+
+    def _list(self, items, resource_version="10"):
+        resp = Mock()
+        resp.items = items
+        resp.metadata.resource_version = resource_version
+        return resp
+
+    def test_relist_then_watch(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list(
+            [self._create_mock_pod("a"), self._create_mock_pod("b")])
+        seen = []
+        self.cache.add_pod_handler(lambda t, p: seen.append((t, p.metadata.name)))
+
+        self.cache._relist(self.cache._pods)
+        self.events.extend([
+            {"type": "DELETED", "object": self._create_mock_pod("a")},
+            {"type": "ADDED", "object": self._create_mock_pod("c")},
+        ])
+        self.cache._watch(self.cache._pods)
+
+        self.assertEqual(self.watch.kwargs["resource_version"], "10")
+        self.assertEqual(self.watch.kwargs["timeout_seconds"], 30)
+        self.assertEqual(sorted(p.metadata.name for p in self.cache.list_pods()), ["b", "c"])
+        self.assertEqual(seen, [("ADDED", "a"), ("ADDED", "b"), ("DELETED", "a"), ("ADDED", "c")])
+
+    def test_resync_reports_deletions(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list([self._create_mock_pod("a")])
+        self.cache._relist(self.cache._pods)
+        seen = []
+        self.cache.add_pod_handler(lambda t, p: seen.append((t, p.metadata.name)))
+
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list([self._create_mock_pod("b")])
+        self.cache._relist(self.cache._pods)
+
+        self.assertEqual(seen, [("ADDED", "b"), ("DELETED", "a")])
+
+    def test_relist_follows_continue_tokens_with_selectors(self):
+        cache = ClusterCache(self.mock_v1, watch_factory=lambda: self.watch, page_size=2,
+                             pod_field_selector="status.phase!=Succeeded")
+        first = self._list([self._create_mock_pod("a"), self._create_mock_pod("b")], resource_version="7")
+        first.metadata._continue = "next"
+        last = self._list([self._create_mock_pod("c")], resource_version="7")
+        last.metadata._continue = None
+        self.mock_v1.list_pod_for_all_namespaces.side_effect = [first, last]
+
+        rv = cache._relist(cache._pods)
+        cache._watch(cache._pods)
+
+        self.assertEqual(rv, "7")
+        self.assertEqual(sorted(p.metadata.name for p in cache.list_pods()), ["a", "b", "c"])
+        calls = self.mock_v1.list_pod_for_all_namespaces.call_args_list
+        self.assertEqual([c.kwargs["_continue"] for c in calls], [None, "next"])
+        self.assertTrue(all(c.kwargs["limit"] == 2 for c in calls))
+        self.assertTrue(all(c.kwargs["field_selector"] == "status.phase!=Succeeded" for c in calls))
+        self.assertEqual(self.watch.kwargs["field_selector"], "status.phase!=Succeeded")
+
+    def test_evict_finished_is_bounded(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list(
+            [self._create_mock_pod("a", phase="Succeeded"), self._create_mock_pod("b", phase="Failed"),
+             self._create_mock_pod("c")])
+        self.cache._relist(self.cache._pods)
+        seen = []
+        self.cache.add_pod_handler(lambda t, p: seen.append((t, p.metadata.name)))
+
+        self.assertEqual(self.cache.evict_finished(limit=1), 1)
+        self.assertEqual(self.cache.evict_finished(limit=1), 1)
+        self.assertEqual(self.cache.evict_finished(limit=1), 0)
+        self.assertEqual(seen, [("DELETED", "a"), ("DELETED", "b")])
+        self.assertEqual([p.metadata.name for p in self.cache.list_pods()], ["c"])
+
+    def test_wait_for_sync(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list([])
+        self.mock_v1.list_node.return_value = self._list([self._create_mock_node("node1")])
+        self.assertFalse(self.cache.wait_for_sync(timeout=0))
+
+        self.cache.start()
+        try:
+            self.assertTrue(self.cache.wait_for_sync(timeout=5))
+        finally:
+            self.cache.stop()
+        self.assertEqual([n.metadata.name for n in self.cache.list_nodes()], ["node1"])
+
+    def test_discoverers_read_from_cache(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = self._list(
+            [self._create_mock_pod("a", node_name="node1")])
+        self.mock_v1.list_node.return_value = self._list(
+            [self._create_mock_node("node1"), self._create_mock_node("node2")])
+        self.cache._relist(self.cache._pods)
+        self.cache._relist(self.cache._nodes)
+        self.mock_v1.reset_mock()
+
+        nodes = NodeDiscoverer(self.mock_v1, cache=self.cache)
+        gangs = PodGroupDiscoverer(self.mock_v1, cache=self.cache)
+
+        self.assertEqual(nodes.count_free_nodes(), 1)
+        self.assertEqual(gangs.get_group("g").size, 1)
+        self.mock_v1.list_pod_for_all_namespaces.assert_not_called()
+        self.mock_v1.list_node.assert_not_called()
+
+
+class TestWatchResumption(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        self.api.add_node(make_node("node1"))
+        self.api.add_pod(make_pod("a", "g"))
+        self.cache = ClusterCache(self.api, resync_period=0.02, watch_factory=lambda: FakeWatch(self.api),
+                                  retry_initial=0.01)
+        self.events = []
+        self.cache.add_pod_handler(lambda t, p: self.events.append((t, p.metadata.name)))
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+
+    def _start(self):
+        self.cache.start()
+        self.assertTrue(self.cache.wait_for_sync(timeout=5))
+
+    def tearDown(self):
+        self.cache.stop()
+        self._out.__exit__(None, None, None)
+
+    def _wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met")
+            time.sleep(0.01)
+
+    def test_reconnects_from_last_version_without_relisting(self):
+        self._start()
+        self._wait_for(lambda: self.api.calls["watch_pods"] >= 5)
+        self.api.add_pod(make_pod("b", "g"))
+        self._wait_for(lambda: self.cache.get_pod("default/b") is not None)
+
+        self.assertEqual(self.api.calls["list_pod_for_all_namespaces"], 1)
+        self.assertEqual(self.events, [("ADDED", "a"), ("ADDED", "b")])
+
+    def test_relists_only_when_version_expired_and_skips_unchanged(self):
+        self.api.add_pod(make_pod("c", "g"))
+        self.cache._relist(self.cache._pods)
+        self.api.add_pod(make_pod("b", "g"))
+        self.api.remove_pod("default", "a")
+        self.api.compact()
+
+        self._start()
+        self._wait_for(lambda: self.cache.get_pod("default/a") is None)
+
+        self.assertEqual(self.api.calls["list_pod_for_all_namespaces"], 2)
+        self.assertEqual(self.events, [("ADDED", "a"), ("ADDED", "c"), ("ADDED", "b"), ("DELETED", "a")])
+
+    def test_bookmarks_advance_the_resource_version(self):
+        self._start()
+        self.api.add_node(make_node("node2"))
+        before = self.cache._pods.resource_version
+        self._wait_for(lambda: self.cache._pods.resource_version != before)
+
+        self.assertEqual(self.cache._pods.resource_version, self.api.list_node().metadata.resource_version)
+
+
+class _Response:
+    # A streamed HTTP response carrying the given watch events, one per line.
+
+    def __init__(self, *events):
+        self.status = 200
+        self._body = "".join(json.dumps(e) + "\n" for e in events).encode()
+
+    def stream(self, amt=None, decode_content=False):
+        yield self._body
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class TestExpiredWatch(unittest.TestCase):
+    # A 410 ERROR line from the apiserver, read by the real watch
+    # machinery: both paths must report it as expiry, not as a failure.
+    GONE = {"type": "ERROR", "object": {"kind": "Status", "code": 410, "reason": "Expired",
+                                        "message": "too old resource version: 1 (500)"}}
+
+    def _cache(self, fast_decode):
+        v1 = Mock(spec=client.CoreV1Api)
+        v1.list_pod_for_all_namespaces.side_effect = lambda **kwargs: _Response(self.GONE)
+        cache = ClusterCache(v1, fast_decode=fast_decode)
+        cache._pods.resource_version = "1"
+        return cache, v1
+
+    def test_raw_watch_reports_expiry(self):
+        cache, v1 = self._cache(fast_decode=True)
+        with self.assertRaises(ResourceExpired):
+            cache._watch(cache._pods)
+        self.assertTrue(v1.list_pod_for_all_namespaces.call_args.kwargs["watch"])
+
+    def test_model_watch_reports_expiry(self):
+        cache, _ = self._cache(fast_decode=False)
+        with self.assertRaises(ApiException) as raised:
+            cache._watch(cache._pods)
+        self.assertEqual(raised.exception.status, 410)
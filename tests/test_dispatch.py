@@ -0,0 +1,42 @@
+import threading
+import time
+import unittest
+from dispatch import Dispatcher, serial_map
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher(max_workers=4)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def _work(self, item):
+        time.sleep(0.01 * (5 - item))
+        if item % 2:
+            raise ValueError(f"odd {item}")
+        return item * 10
+
+    def test_results_keep_input_order(self):
+        results = self.dispatcher.map(self._work, range(5))
+
+        self.assertEqual([r.item for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual([r.value for r in results if r.ok], [0, 20, 40])
+        self.assertEqual([str(r.error) for r in results if not r.ok], ["odd 1", "odd 3"])
+        self.assertEqual([r.value for r in serial_map(self._work, range(5)) if r.ok], [0, 20, 40])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def work(_):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+
+        self.dispatcher.map(work, range(20))
+        self.assertLessEqual(active[1], 4)
+        self.assertGreater(active[1], 1)
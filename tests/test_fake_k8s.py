@@ -0,0 +1,167 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+from bench.cluster import make_gang, make_node, make_pod
+from fake_k8s import FakeApiServer, FakeCoreV1Api, FakeWatch
+from main import Scheduler
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
+
+
+class TestFakeCoreV1Api(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        self.api.add_node(make_node("node1"))
+        self.api.add_pod(make_pod("a", "g"))
+        self.api.add_pod(make_pod("b", "g", node_name="node1"))
+
+    def test_list_selectors_and_pages(self):
+        pending = self.api.list_pod_for_all_namespaces(field_selector="status.phase=Pending,spec.nodeName=")
+        self.assertEqual([p.metadata.name for p in pending.items], ["a"])
+
+        first = self.api.list_pod_for_all_namespaces(limit=1)
+        second = self.api.list_pod_for_all_namespaces(limit=1, _continue=first.metadata._continue)
+        self.assertEqual(len(first.items) + len(second.items), 2)
+        self.assertIsNone(second.metadata._continue)
+
+        self.api.add_pod(make_pod("c", "h"))
+
+        def names(selector):
+            return sorted(p.metadata.name for p in self.api.list_pod_for_all_namespaces(label_selector=selector).items)
+        self.assertEqual(names("app in (g,x),app"), ["a", "b"])
+        self.assertEqual(names("app notin (g)"), ["c"])
+
+    def test_binding_emits_watch_event(self):
+        rv = self.api.list_pod_for_all_namespaces().metadata.resource_version
+        body = client.V1Binding(metadata=client.V1ObjectMeta(name="a"),
+                                target=client.V1ObjectReference(kind="Node", name="node1"))
+        self.api.create_namespaced_pod_binding("a", "default", body)
+        with self.assertRaises(ApiException):
+            self.api.create_namespaced_pod_binding("a", "default", body)
+
+        events = list(FakeWatch(self.api).stream(self.api.list_pod_for_all_namespaces,
+                                                 resource_version=rv, timeout_seconds=0))
+        self.assertEqual([(e["type"], e["object"].spec.node_name) for e in events], [("MODIFIED", "node1")])
+
+    def test_filtered_watch_reports_pods_leaving_the_selector(self):
+        rv = self.api.list_pod_for_all_namespaces().metadata.resource_version
+        body = client.V1Binding(metadata=client.V1ObjectMeta(name="a"),
+                                target=client.V1ObjectReference(kind="Node", name="node1"))
+        self.api.create_namespaced_pod_binding("a", "default", body)
+
+        events = list(FakeWatch(self.api).stream(self.api.list_pod_for_all_namespaces, resource_version=rv,
+                                                 timeout_seconds=0, field_selector="status.phase=Pending"))
+        self.assertEqual([(e["type"], e["object"].metadata.name) for e in events], [("DELETED", "a")])
+
+    def test_compacted_watch_is_gone(self):
+        self.api.compact()
+        with self.assertRaises(ApiException) as ctx:
+            list(FakeWatch(self.api).stream(self.api.list_node, resource_version="1", timeout_seconds=0))
+        self.assertEqual(ctx.exception.status, 410)
+
+
+def _http_client(server):
+    configuration = client.Configuration()
+    configuration.host = server.url
+    return client.CoreV1Api(client.ApiClient(configuration))
+
+
+class TestFakeApiServer(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        self.api.add_node(make_node("node1"))
+        self.api.add_pod(make_pod("a", "g"))
+        self.server = FakeApiServer(self.api).start()
+        self.addCleanup(self.server.stop)
+        self.v1 = _http_client(self.server)
+
+    def test_list_bind_and_watch(self):
+        pods = self.v1.list_pod_for_all_namespaces(field_selector="spec.nodeName=")
+        self.assertEqual([p.metadata.name for p in pods.items], ["a"])
+        body = client.V1Binding(metadata=client.V1ObjectMeta(name="a"),
+                                target=client.V1ObjectReference(kind="Node", name="node1"))
+        self.v1.create_namespaced_pod_binding("a", "default", body, _preload_content=False)
+        with self.assertRaises(ApiException) as ctx:
+            self.v1.create_namespaced_pod_binding("a", "default", body, _preload_content=False)
+        self.assertEqual(ctx.exception.status, 409)
+
+        events = list(watch.Watch().stream(self.v1.list_pod_for_all_namespaces,
+                                           resource_version=pods.metadata.resource_version, timeout_seconds=0))
+        self.assertEqual([(e["type"], e["object"].spec.node_name) for e in events], [("MODIFIED", "node1")])
+
+    def test_compacted_watch_is_gone(self):
+        self.api.compact()
+        with self.assertRaises(ApiException) as ctx:
+            list(watch.Watch().stream(self.v1.list_node, resource_version="1", timeout_seconds=0))
+        self.assertEqual(ctx.exception.status, 410)
+
+
+class TestSchedulerAgainstFake(unittest.TestCase):
+    fast_decode = False
+    over_http = False
+
+    def setUp(self):
+        self.api = FakeCoreV1Api(eviction_delay=0.05)
+        for i in range(3):
+            self.api.add_node(make_node(f"node{i}"))
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+        v1, watch_factory = self.api, lambda: FakeWatch(self.api)
+        if self.over_http:
+            self.server = FakeApiServer(self.api).start()
+            v1, watch_factory = _http_client(self.server), watch.Watch
+        self.scheduler = Scheduler(v1=v1, watch_factory=watch_factory, tick_interval=0.02,
+                                   fast_decode=self.fast_decode)
+        self.thread = threading.Thread(target=self.scheduler.run, daemon=True)
+        self.thread.start()
+        self.assertTrue(self.scheduler.cache.wait_for_sync(timeout=5))
+
+    def tearDown(self):
+        self.scheduler.stop()
+        if self.over_http:
+            self.server.stop()
+        self.thread.join(timeout=5)
+        self._out.__exit__(None, None, None)
+
+    def _wait_bound(self, names, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pods = [self.api.get_pod("default", n) for n in names]
+            if all(p is not None and p.spec.node_name for p in pods):
+                return {p.spec.node_name for p in pods}
+            time.sleep(0.01)
+        self.fail(f"pods {names} were not bound")
+
+    def test_gang_is_bound_to_distinct_nodes(self):
+        for pod in make_gang("train", 3):
+            self.api.add_pod(pod)
+
+        nodes = self._wait_bound([f"train-{i}" for i in range(3)])
+        self.assertEqual(len(nodes), 3)
+        self.assertEqual(self.api.calls["list_pod_for_all_namespaces"], 1)
+
+    def test_preemption_waits_for_victims(self):
+        for pod in make_gang("low", 3, priority=1):
+            self.api.add_pod(pod)
+        self._wait_bound([f"low-{i}" for i in range(3)])
+
+        for pod in make_gang("high", 2, priority=100):
+            self.api.add_pod(pod)
+
+        self.assertEqual(len(self._wait_bound(["high-0", "high-1"])), 2)
+        self.assertEqual(self.api.calls["create_namespaced_pod_eviction"], 3)
+
+
+class TestSchedulerAgainstFakeFastDecode(TestSchedulerAgainstFake):
+    fast_decode = True
+
+
+class TestSchedulerOverHttp(TestSchedulerAgainstFake):
+    over_http = True
+
+
+class TestSchedulerOverHttpFastDecode(TestSchedulerAgainstFake):
+    over_http = True
+    fast_decode = True
@@ -0,0 +1,144 @@
+import contextlib
+import io
+import json
+import unittest
+from bench.cluster import make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from feasibility import NodeLabelIndex, constraints_of
+from kubernetes import client
+from main import Scheduler
+from node import NodeDiscoverer, NodeIndex
+from pod_decode import decode_pod
+from records import PodRecord
+
+
+def _requirement(key, operator, values=None):
+    return client.V1NodeSelectorRequirement(key=key, operator=operator, values=values)
+
+
+def _constrained_pod(name, node_selector=None, terms=None, tolerations=None):
+    pod = make_pod(name, "g")
+    pod.spec.node_selector = node_selector
+    if terms is not None:
+        pod.spec.affinity = client.V1Affinity(node_affinity=client.V1NodeAffinity(
+            required_during_scheduling_ignored_during_execution=client.V1NodeSelector(node_selector_terms=terms)))
+    pod.spec.tolerations = tolerations
+    return pod
+
+
+def _node(name, labels=None, taints=None, unschedulable=None):
+    node = make_node(name, labels=labels)
+    node.spec = client.V1NodeSpec(taints=taints, unschedulable=unschedulable)
+    return node
+
+
+GPU_TAINT = client.V1Taint(key="gpu", value="true", effect="NoSchedule")
+
+
+class TestConstraints(unittest.TestCase):
+    def test_model_decoded_and_record_agree(self):
+        pod = _constrained_pod(
+            "a", node_selector={"disk": "ssd"},
+            terms=[client.V1NodeSelectorTerm(match_expressions=[_requirement("zone", "In", ["a", "b"])])],
+            tolerations=[client.V1Toleration(key="gpu", operator="Exists", effect="NoSchedule")])
+        constraints = constraints_of(pod)
+        raw = json.loads(json.dumps(client.ApiClient().sanitize_for_serialization(pod)))
+
+        self.assertEqual(constraints_of(decode_pod(raw)), constraints)
+        record = PodRecord.from_pod(pod)
+        self.assertIs(constraints_of(record), constraints)
+        self.assertIs(PodRecord.from_fields(record.fields()).constraints, constraints)
+        self.assertIsNone(constraints_of(make_pod("plain", "g")))
+
+
+class TestNodeLabelIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NodeLabelIndex()
+        for node in (_node("a", {"zone": "a", "disk": "ssd", "cores": "8"}),
+                     _node("b", {"zone": "b", "disk": "hdd", "cores": "32"}),
+                     _node("c", {"zone": "b"}, taints=[GPU_TAINT]),
+                     _node("d", {"zone": "a"}, unschedulable=True)):
+            self.index.on_node_event("ADDED", node)
+
+    def _feasible(self, pod):
+        return sorted(self.index.names(self.index.feasible(constraints_of(pod))))
+
+    def test_cordoned_and_tainted_nodes_are_excluded(self):
+        self.assertTrue(self.index.restricts(None))
+        self.assertEqual(self._feasible(make_pod("p", "g")), ["a", "b"])
+        tolerant = _constrained_pod("p", tolerations=[client.V1Toleration(key="gpu", value="true")])
+        self.assertEqual(self._feasible(tolerant), ["a", "b", "c"])
+        wrong_effect = _constrained_pod("p", tolerations=[
+            client.V1Toleration(key="gpu", operator="Exists", effect="NoExecute")])
+        self.assertEqual(self._feasible(wrong_effect), ["a", "b"])
+
+    def test_node_selector_and_affinity(self):
+        self.assertEqual(self._feasible(_constrained_pod("p", node_selector={"zone": "b"})), ["b"])
+        self.assertEqual(self._feasible(_constrained_pod("p", node_selector={"zone": "c"})), [])
+
+        def terms(*requirements):
+            return [client.V1NodeSelectorTerm(match_expressions=list(requirements))]
+
+        self.assertEqual(self._feasible(_constrained_pod("p", terms=terms(_requirement("disk", "Exists")))),
+                         ["a", "b"])
+        self.assertEqual(self._feasible(_constrained_pod("p", terms=terms(_requirement("disk", "NotIn", ["ssd"])))),
+                         ["b"])
+        self.assertEqual(self._feasible(_constrained_pod("p", terms=terms(_requirement("cores", "Gt", ["16"])))),
+                         ["b"])
+        either = [client.V1NodeSelectorTerm(match_expressions=[_requirement("disk", "In", ["ssd"])]),
+                  client.V1NodeSelectorTerm(match_fields=[_requirement("metadata.name", "In", ["b"])])]
+        self.assertEqual(self._feasible(_constrained_pod("p", terms=either)), ["a", "b"])
+
+    def test_node_updates_and_deletes(self):
+        self.index.on_node_event("MODIFIED", _node("a", {"zone": "b"}))
+        self.assertEqual(self._feasible(_constrained_pod("p", node_selector={"zone": "b"})), ["a", "b"])
+        self.index.on_node_event("DELETED", _node("b"))
+        self.index.on_node_event("ADDED", _node("e", {"zone": "b"}))
+        self.assertEqual(self._feasible(_constrained_pod("p", node_selector={"zone": "b"})), ["a", "e"])
+        self.assertEqual(len(self.index._names), 4)
+
+    def test_updates_keep_free_nodes_free(self):
+        index = NodeIndex()
+        index.on_node_event("ADDED", _node("a", {"zone": "a"}))
+        index.on_node_event("ADDED", _node("b", {"zone": "b"}))
+        zoned = index.feasible_mask(_constrained_pod("p", node_selector={"zone": "a"}))
+        index.on_node_event("MODIFIED", _node("a", {"zone": "a"}))
+        self.assertEqual(index.count_free_nodes(feasible=zoned), 1)
+        self.assertEqual(index.feasible_free_nodes(zoned), ["a"])
+        index.on_node_event("DELETED", _node("a"))
+        index.on_node_event("ADDED", _node("c", {"zone": "c"}))
+        self.assertEqual(index.count_free_nodes(feasible=index.feasible_mask(
+            _constrained_pod("p", node_selector={"zone": "c"}))), 1)
+        self.assertEqual(index.feasible_free_nodes(index.feasible_mask(
+            _constrained_pod("p", node_selector={"zone": "a"}))), [])
+
+
+class TestFeasiblePlacement(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        self.api.add_node(_node("plain"))
+        self.api.add_node(_node("gpu", {"accelerator": "a100"}, taints=[GPU_TAINT]))
+        self.api.add_node(_node("cordoned", unschedulable=True))
+
+    def test_scheduler_binds_only_to_feasible_nodes(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api))
+            scheduler.cache._relist(scheduler.cache._nodes)
+            trainer = _constrained_pod("trainer", node_selector={"accelerator": "a100"},
+                                       tolerations=[client.V1Toleration(key="gpu", operator="Exists")])
+            self.api.add_pod(trainer)
+            self.assertTrue(scheduler._schedule_pod(trainer))
+            for name in ("web-0", "web-1"):
+                pod = make_pod(name, name)
+                self.api.add_pod(pod)
+                scheduler._schedule_pod(pod)
+
+        self.assertEqual(self.api.get_pod("default", "trainer").spec.node_name, "gpu")
+        bound = [self.api.get_pod("default", n).spec.node_name for n in ("web-0", "web-1")]
+        self.assertEqual(sorted(bound, key=str), sorted([None, "plain"], key=str))
+
+    def test_discoverer_without_index(self):
+        discovery = NodeDiscoverer(self.api)
+        self.assertEqual([n.name for n in discovery.get_feasible_nodes(make_pod("p", "g"))], ["plain"])
+        tolerant = _constrained_pod("p", tolerations=[client.V1Toleration(operator="Exists")])
+        self.assertEqual(sorted(n.name for n in discovery.get_feasible_nodes(tolerant)), ["gpu", "plain"])
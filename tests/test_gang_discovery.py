@@ -1,6 +1,9 @@
+import random
 import unittest
 from unittest.mock import Mock
-from gang import PodGroupDiscoverer, GroupSelector, PodGroup
+from bench.cluster import make_pod
+from cache import pod_key
+from gang import GangIndex, PodGroupDiscoverer, GroupSelector, PodGroup
 from kubernetes import client
 
 
@@ -66,3 +69,87 @@ class TestGangDiscovery(unittest.TestCase):
         pod = self._create_mock_pod()
         self.assertFalse(self.discoverer._should_skip_eviction(pod))
 
+    def test_queries_are_pushed_to_the_apiserver(self):
+        self.mock_v1.list_pod_for_all_namespaces.return_value = Mock(items=[])
+        discoverer = PodGroupDiscoverer(self.mock_v1, group_label="pod-group")
+
+        discoverer.groups(GroupSelector(allowed_statuses={"Pending"}, scheduler_name="foobar"))
+        discoverer.get_group("target")
+
+        groups_call, get_call = self.mock_v1.list_pod_for_all_namespaces.call_args_list
+        self.assertEqual(groups_call.kwargs["field_selector"], "status.phase=Pending,spec.schedulerName=foobar")
+        self.assertEqual(get_call.kwargs["label_selector"], "pod-group=target")
+
+    def test_groups_filters_scheduler_name(self):
+        ours = self._create_mock_pod("ours", annotations={"pod-group": "a"})
+        ours.spec.scheduler_name = "foobar"
+        theirs = self._create_mock_pod("theirs", annotations={"pod-group": "b"})
+        theirs.spec.scheduler_name = "default-scheduler"
+        self.mock_v1.list_pod_for_all_namespaces.return_value = Mock(items=[ours, theirs])
+
+        result = self.discoverer.groups(GroupSelector(scheduler_name="foobar"))
+
+        self.assertEqual([g.gang_id for g in result], ["a"])
+
+    def test_groups_from_generator_with_top_k(self):
+        pods = [make_pod(f"{gang}-{i}", gang, priority=prio)
+                for gang, prio, size in (("a", 10, 2), ("b", 1, 3), ("c", 1, 1), ("d", 5, 1)) for i in range(size)]
+
+        result = self.discoverer.groups(GroupSelector(max_priority=5), pods=(p for p in pods), limit=2)
+
+        self.assertEqual([(g.gang_id, g.size) for g in result], [("b", 3), ("c", 1)])
+        self.mock_v1.list_pod_for_all_namespaces.assert_not_called()
+
+
+class TestGangIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GangIndex()
+        self.pods = {}
+
+    def _set(self, pod):
+        self.pods[pod_key(pod)] = pod
+        self.index.on_pod_event("MODIFIED", pod)
+
+    def _delete(self, pod):
+        del self.pods[pod_key(pod)]
+        self.index.on_pod_event("DELETED", pod)
+
+    def _scan(self):
+        mock_v1 = Mock(spec=client.CoreV1Api)
+        mock_v1.list_pod_for_all_namespaces.return_value = Mock(items=list(self.pods.values()))
+        return PodGroupDiscoverer(mock_v1)
+
+    def _shape(self, groups):
+        # Ties in (priority, -size) may come out in either order.
+        order = [(g.priority, -g.size) for g in groups]
+        self.assertEqual(order, sorted(order))
+        return sorted((g.gang_id, g.size, g.priority, sorted(p.metadata.name for p in g.pods)) for g in groups)
+
+    def test_matches_full_scan(self):
+        rng = random.Random(7)
+        for i in range(300):
+            gang = f"g{rng.randrange(30)}"
+            pod = make_pod(f"p{rng.randrange(120)}", gang, priority=rng.choice((0, 5, 10, 50)),
+                           namespace=rng.choice(("default", "default", "kube-system")),
+                           phase=rng.choice((None, None, "Succeeded")))
+            if pod_key(pod) in self.pods and rng.random() < 0.3:
+                self._delete(self.pods[pod_key(pod)])
+            else:
+                self._set(pod)
+
+        indexed = PodGroupDiscoverer(Mock(spec=client.CoreV1Api), index=self.index)
+        scan = self._scan()
+        for max_priority in (None, 0, 5, 10, 49):
+            selector = GroupSelector(max_priority=max_priority)
+            self.assertEqual(self._shape(indexed.groups(selector)), self._shape(scan.groups(selector)))
+        for gang in ("g1", "g7", "missing"):
+            self.assertEqual(self._shape([g for g in [indexed.get_group(gang)] if g]),
+                             self._shape([g for g in [scan.get_group(gang)] if g]))
+
+    def test_moving_a_pod_between_gangs(self):
+        self._set(make_pod("a", "one", priority=5))
+        self._set(make_pod("a", "two", priority=1))
+
+        self.assertIsNone(self.index.get_group("one"))
+        self.assertEqual(self.index.get_group("two").priority, 1)
+        self.assertEqual([g.gang_id for g in self.index.groups(GroupSelector(max_priority=1))], ["two"])
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import Mock, patch
 from gang import PodGroupDiscoverer, PodGroup
+from dispatch import Dispatcher
 from kubernetes import client
 
 
@@ -63,3 +64,19 @@ class TestGangEviction(unittest.TestCase):
         result = self.discoverer.preempt_group("missing")
         
         self.assertIsNone(result)
+
+    @patch.object(PodGroupDiscoverer, 'get_group')
+    @patch.object(PodGroupDiscoverer, '_try_eviction')
+    def test_preempt_groups_dispatches_all_evictions(self, mock_evict, mock_get_group):
+        groups = {
+            "a": PodGroup("a", pods=[self._create_mock_pod("a1"), self._create_mock_pod("a2")], size=2),
+            "b": PodGroup("b", pods=[self._create_mock_pod("b1")], size=1),
+        }
+        mock_get_group.side_effect = groups.get
+        mock_evict.side_effect = lambda name, namespace, grace, dry_run=False: name != "a2"
+        discoverer = PodGroupDiscoverer(self.mock_v1, dispatcher=Dispatcher(max_workers=2))
+
+        result = discoverer.preempt_groups(["a", "b", "missing"])
+
+        self.assertEqual(result, {"a": 1, "b": 1, "missing": None})
+        self.assertEqual(mock_evict.call_count, 3)
@@ -0,0 +1,133 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from bench.cluster import make_gang, make_node
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from kubernetes.client.exceptions import ApiException
+from leader import FileLease, InMemoryLease, KubernetesLease, LeaderElector
+from main import Scheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLeases(unittest.TestCase):
+    def setUp(self):
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self._out.__exit__(None, None, None)
+
+    def _check_exclusive_until_expiry(self, lease):
+        self.assertTrue(lease.try_acquire("a", 10, 0))
+        self.assertFalse(lease.try_acquire("b", 10, 5))
+        self.assertTrue(lease.try_acquire("a", 10, 8))
+        self.assertFalse(lease.try_acquire("b", 10, 17))
+        self.assertTrue(lease.try_acquire("b", 10, 18))
+        self.assertFalse(lease.try_acquire("a", 10, 19))
+        lease.release("a")
+        self.assertFalse(lease.try_acquire("a", 10, 20))
+        lease.release("b")
+        self.assertTrue(lease.try_acquire("a", 10, 21))
+
+    def test_in_memory_lease(self):
+        self._check_exclusive_until_expiry(InMemoryLease())
+
+    def test_file_lease_is_shared_through_the_file(self):
+        path = os.path.join(self.dir.name, "lease")
+        self._check_exclusive_until_expiry(FileLease(path))
+        self.assertFalse(FileLease(path).try_acquire("b", 10, 22))
+
+    def test_kubernetes_lease_conflict_loses(self):
+        api = Mock()
+        api.read_namespaced_lease.side_effect = ApiException(status=404)
+        api.create_namespaced_lease.side_effect = ApiException(status=409)
+        self.assertFalse(KubernetesLease(api=api).try_acquire("a", 10, 0))
+
+        lease = Mock()
+        lease.spec.holder_identity = None
+        lease.spec.renew_time = None
+        lease.spec.lease_transitions = 0
+        api.read_namespaced_lease.side_effect = None
+        api.read_namespaced_lease.return_value = lease
+        self.assertTrue(KubernetesLease(api=api).try_acquire("a", 10, 0))
+        self.assertEqual(lease.spec.holder_identity, "a")
+        self.assertEqual(lease.spec.lease_transitions, 1)
+
+    def test_elector_drops_leadership_when_renewals_stop(self):
+        clock = _Clock()
+        lease = InMemoryLease()
+        leader = LeaderElector(lease, "a", lease_duration=10, clock=clock)
+        standby = LeaderElector(lease, "b", lease_duration=10, clock=clock)
+        self.assertTrue(leader.try_acquire())
+        self.assertFalse(standby.try_acquire())
+        self.assertTrue(leader.is_leader)
+        self.assertFalse(standby.is_leader)
+
+        clock.now += 10
+        self.assertFalse(leader.is_leader)
+        self.assertTrue(standby.try_acquire())
+        self.assertTrue(standby.is_leader)
+
+
+class TestWarmStandby(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        for i in range(3):
+            self.api.add_node(make_node(f"node{i}"))
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+        lease = InMemoryLease()
+        self.replicas = []
+        for identity in ("a", "b"):
+            elector = LeaderElector(lease, identity, lease_duration=0.5, renew_interval=0.05)
+            scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api), tick_interval=0.02,
+                                  elector=elector)
+            thread = threading.Thread(target=scheduler.run, daemon=True)
+            thread.start()
+            self.assertTrue(scheduler.cache.wait_for_sync(timeout=5))
+            self.replicas.append((scheduler, thread))
+
+    def tearDown(self):
+        for scheduler, thread in self.replicas:
+            scheduler.stop()
+            thread.join(timeout=5)
+        self._out.__exit__(None, None, None)
+
+    def _wait(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("condition not met")
+
+    def test_standby_takes_over_without_relisting(self):
+        self._wait(lambda: any(s.is_leader for s, _ in self.replicas))
+        leader, thread = next(r for r in self.replicas if r[0].is_leader)
+        standby = next(s for s, _ in self.replicas if s is not leader)
+        self.assertFalse(standby.is_leader)
+
+        leader.stop()
+        thread.join(timeout=5)
+        lists = self.api.calls["list_pod_for_all_namespaces"]
+        for pod in make_gang("train", 3):
+            self.api.add_pod(pod)
+        self._wait(lambda: all(self.api.get_pod("default", f"train-{i}").spec.node_name for i in range(3)))
+
+        self.assertTrue(standby.is_leader)
+        self.assertEqual(self.api.calls["list_pod_for_all_namespaces"], lists)
+        self.assertEqual(len(standby.cache.list_pods()), 3)
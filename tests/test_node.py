@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import Mock, patch
-from node import NodeStatus, NodeDiscoverer
+from node import NodeStatus, NodeDiscoverer, NodeIndex
 from kubernetes import client
 
 
@@ -82,3 +82,117 @@ class TestNodeDiscoverer(unittest.TestCase):
         result = self.discoverer.count_free_nodes()
         
         self.assertEqual(result, 2)  # node1 and node3 are free
+
+
+class TestNodeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NodeIndex()
+        for name in ("node1", "node2", "node3"):
+            node = Mock(spec=client.V1Node)
+            node.metadata = Mock()
+            node.metadata.name = name
+            self.index.on_node_event("ADDED", node)
+
+    def _create_mock_pod(self, name, namespace="default", node_name=None, phase="Running", owner_kind=None):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = namespace
+        owner = Mock()
+        owner.kind = owner_kind
+        pod.metadata.owner_references = [owner] if owner_kind else []
+        pod.spec = Mock()
+        pod.spec.node_name = node_name
+        pod.status = Mock()
+        pod.status.phase = phase
+        return pod
+
+    def test_pod_lifecycle_updates_free_set(self):
+        self.index.on_pod_event("ADDED", self._create_mock_pod("p", node_name="node1"))
+        self.assertEqual(self.index.count_free_nodes(), 2)
+        self.assertFalse(self.index.is_free("node1"))
+
+        self.index.on_pod_event("MODIFIED", self._create_mock_pod("p", node_name="node1", phase="Succeeded"))
+        self.assertTrue(self.index.is_free("node1"))
+
+        self.index.on_pod_event("MODIFIED", self._create_mock_pod("p", node_name="node2"))
+        self.index.on_pod_event("DELETED", self._create_mock_pod("p", node_name="node2"))
+        self.assertEqual(self.index.count_free_nodes(), 3)
+
+    def test_exclusions(self):
+        self.index.on_pod_event("ADDED", self._create_mock_pod("sys", namespace="kube-system", node_name="node1"))
+        self.index.on_pod_event("ADDED", self._create_mock_pod("ds", node_name="node2", owner_kind="DaemonSet"))
+        self.index.on_pod_event("ADDED", self._create_mock_pod("pending", phase="Pending"))
+        self.assertEqual(self.index.count_free_nodes(), 3)
+
+    def test_pick_free_node_and_node_removal(self):
+        self.index.on_pod_event("ADDED", self._create_mock_pod("a", node_name="node1"))
+        self.index.on_pod_event("ADDED", self._create_mock_pod("b", node_name="node2"))
+        self.assertEqual(self.index.pick_free_node(), "node3")
+
+        node = Mock(spec=client.V1Node)
+        node.metadata = Mock()
+        node.metadata.name = "node3"
+        self.index.on_node_event("DELETED", node)
+        self.assertIsNone(self.index.pick_free_node())
+
+    def test_discoverer_uses_index(self):
+        mock_v1 = Mock(spec=client.CoreV1Api)
+        discoverer = NodeDiscoverer(mock_v1, index=self.index)
+        self.index.on_pod_event("ADDED", self._create_mock_pod("a", node_name="node1"))
+
+        self.assertEqual(discoverer.count_free_nodes(), 2)
+        self.assertEqual(sorted(n.name for n in discoverer.get_free_nodes()), ["node2", "node3"])
+        mock_v1.list_node.assert_not_called()
+
+    def test_assume_reserves_until_confirmed(self):
+        node = self.index.assume_free_node("default/a")
+        self.assertNotEqual(self.index.assume_free_node("default/b"), node)
+        self.assertEqual(self.index.count_free_nodes(), 1)
+
+        # A pending update without a node keeps the reservation in place.
+        self.index.on_pod_event("MODIFIED", self._create_mock_pod("a", phase="Pending"))
+        self.assertTrue(self.index.is_assumed("default/a"))
+
+        self.index.on_pod_event("MODIFIED", self._create_mock_pod("a", node_name=node, phase="Pending"))
+        self.assertFalse(self.index.is_assumed("default/a"))
+        self.assertEqual(self.index.count_free_nodes(), 1)
+
+    def test_forget_and_ttl_release_reservation(self):
+        now = [0.0]
+        index = NodeIndex(assume_ttl=10, clock=lambda: now[0])
+        for name in ("node1", "node2"):
+            node = Mock(spec=client.V1Node)
+            node.metadata = Mock()
+            node.metadata.name = name
+            index.on_node_event("ADDED", node)
+
+        index.assume_free_node("default/a")
+        index.assume_free_node("default/b")
+        self.assertIsNone(index.assume_free_node("default/c"))
+
+        index.forget("default/a")
+        self.assertEqual(index.count_free_nodes(), 1)
+
+        now[0] = 11
+        self.assertEqual(index.count_free_nodes(), 2)
+        self.assertFalse(index.is_assumed("default/b"))
+
+    def test_nominated_nodes_are_held_for_their_gang(self):
+        released = []
+        self.index.on_nominated_free = released.append
+        pod = self._create_mock_pod("victim", node_name="node1")
+        self.index.on_pod_event("ADDED", pod)
+        self.index.nominate("gang", {"node1", "node2"})
+
+        self.assertEqual(released, ["gang"])
+        self.assertEqual(self.index.count_free_nodes(), 1)
+        self.assertEqual(self.index.count_free_nodes("gang"), 2)
+
+        self.index.on_pod_event("DELETED", pod)
+        self.assertEqual(released, ["gang", "gang"])
+        self.assertEqual(self.index.assume_free_node("default/other"), "node3")
+        self.assertIn(self.index.assume_free_node("default/g-0", "gang"), {"node1", "node2"})
+
+        self.index.clear_nominations("gang")
+        self.assertEqual(self.index.count_free_nodes(), 1)
@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import Mock
+from permit import GangPermit, min_member_of
+from kubernetes import client
+
+
+class TestGangPermit(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.permit = GangPermit(timeout=10, clock=lambda: self.now[0])
+
+    def _create_mock_pod(self, name, annotations=None):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = "default"
+        pod.metadata.annotations = annotations or {}
+        return pod
+
+    def test_min_member_of(self):
+        self.assertEqual(min_member_of(self._create_mock_pod("a", {"pod-group-size": "4"})), 4)
+        self.assertIsNone(min_member_of(self._create_mock_pod("a", {"pod-group-size": "x"})))
+        self.assertIsNone(min_member_of(self._create_mock_pod("a")))
+
+    def test_add_is_idempotent_per_pod(self):
+        self.permit.add("g", self._create_mock_pod("a"), 2)
+        gang = self.permit.add("g", self._create_mock_pod("a"), 2)
+        self.assertEqual(len(gang.pods), 1)
+        self.assertEqual(gang.min_member, 2)
+
+    def test_discard_and_expire(self):
+        self.permit.add("g", self._create_mock_pod("a"), 2)
+        self.permit.add("h", self._create_mock_pod("b"), 2)
+        self.permit.discard_pod("g", "default/a")
+        self.assertIsNone(self.permit.get("g"))
+
+        self.now[0] = 10
+        self.assertEqual([g.gang_id for g in self.permit.expire()], ["h"])
+        self.assertEqual(self.permit.waiting(), [])
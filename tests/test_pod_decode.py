@@ -0,0 +1,65 @@
+import json
+import unittest
+from unittest.mock import Mock
+from kubernetes import client
+from bench.cluster import make_pod
+from cache import ClusterCache
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from gang import GroupSelector, PodGroupDiscoverer
+from pod_decode import Pod, decode_pod_list
+from pod_utils import active_node_of, is_terminating, should_skip_pod_for_scheduling
+from resources import pod_requests
+
+
+def _payload(pods, **meta):
+    body = client.V1PodList(items=pods, metadata=client.V1ListMeta(**meta))
+    return json.dumps(client.ApiClient().sanitize_for_serialization(body)).encode()
+
+
+class TestPodDecode(unittest.TestCase):
+    def test_decodes_scheduling_fields(self):
+        model = make_pod("a", "g", namespace="team", priority=7, node_name="node1", group_size=2)
+        model.metadata.owner_references = [client.V1OwnerReference(
+            api_version="apps/v1", kind="DaemonSet", name="ds", uid="1")]
+
+        page = decode_pod_list(_payload([model], resource_version="42", _continue="next"))
+        pod = page.items[0]
+
+        self.assertEqual((page.metadata.resource_version, page.metadata._continue), ("42", "next"))
+        self.assertEqual((pod.metadata.name, pod.metadata.namespace), ("a", "team"))
+        self.assertEqual(pod.metadata.annotations, {"pod-group": "g", "pod-group-size": "2"})
+        self.assertEqual((pod.spec.node_name, pod.spec.scheduler_name, pod.spec.priority), ("node1", "foobar", 7))
+        self.assertEqual(pod.status.phase, "Running")
+        self.assertEqual(pod_requests(pod), pod_requests(model))
+        self.assertTrue(should_skip_pod_for_scheduling(pod))
+        self.assertFalse(is_terminating(pod))
+
+    def test_predicates_and_groups_match_models(self):
+        models = [make_pod("a", "g", priority=5, node_name="node1"), make_pod("b", "g", priority=9),
+                  make_pod("c", "other", phase="Succeeded")]
+        decoded = decode_pod_list(_payload(models)).items
+
+        self.assertEqual([active_node_of(p) for p in decoded], [active_node_of(p) for p in models])
+        api = FakeCoreV1Api()
+        for pod in models:
+            api.add_pod(pod)
+        group = PodGroupDiscoverer(api).groups(GroupSelector())[0]
+        mock_v1 = Mock(spec=client.CoreV1Api)
+        mock_v1.list_pod_for_all_namespaces.return_value = Mock(items=decoded)
+        fast = PodGroupDiscoverer(mock_v1).groups(GroupSelector())[0]
+        self.assertEqual((fast.gang_id, fast.size, fast.priority), (group.gang_id, group.size, group.priority))
+
+    def test_cache_fast_decode_lists_and_watches_raw(self):
+        api = FakeCoreV1Api()
+        api.add_pod(make_pod("a", "g"))
+        cache = ClusterCache(api, watch_factory=lambda: FakeWatch(api), fast_decode=True)
+
+        cache._relist(cache._pods)
+        api.add_pod(make_pod("b", "g", node_name="node1"))
+        cache.resync_period = 0
+        cache._watch(cache._pods)
+
+        pods = {p.metadata.name: p for p in cache.list_pods()}
+        self.assertTrue(all(isinstance(p, Pod) for p in pods.values()))
+        self.assertEqual(pods["b"].spec.node_name, "node1")
+
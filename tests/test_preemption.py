@@ -0,0 +1,190 @@
+import contextlib
+import io
+import unittest
+from unittest.mock import Mock
+from bench.cluster import make_gang, make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from gang import PodGroupDiscoverer
+from node import NodeIndex
+from preemption import PreemptionPlanner
+from resources import MostAllocated
+from kubernetes import client
+from main import Scheduler
+
+
+class TestPreemptionPlanner(unittest.TestCase):
+    def setUp(self):
+        self.mock_v1 = Mock(spec=client.CoreV1Api)
+        self.pods = []
+        self.mock_v1.list_pod_for_all_namespaces.side_effect = lambda **_: Mock(items=list(self.pods))
+        self.index = NodeIndex()
+        self.planner = PreemptionPlanner(PodGroupDiscoverer(self.mock_v1), self.index)
+
+    def _add_nodes(self, count):
+        for i in range(count):
+            node = Mock(spec=client.V1Node)
+            node.metadata = Mock()
+            node.metadata.name = f"n{i}"
+            self.index.on_node_event("ADDED", node)
+
+    def _add_pod(self, name, group, priority, node_name=None, node_selector=None):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = "default"
+        pod.metadata.annotations = {"pod-group": group}
+        pod.metadata.owner_references = []
+        pod.metadata.deletion_timestamp = None
+        pod.spec = Mock()
+        pod.spec.priority = priority
+        pod.spec.node_name = node_name
+        pod.spec.node_selector = node_selector
+        pod.status = Mock()
+        pod.status.phase = "Running" if node_name else "Pending"
+        self.pods.append(pod)
+        self.index.on_pod_event("ADDED", pod)
+
+    def test_prefers_smallest_sufficient_victim(self):
+        self._add_nodes(66)
+        for i in range(64):
+            self._add_pod(f"big-{i}", "big", 10, node_name=f"n{i}")
+        self._add_pod("small-0", "small", 10, node_name="n64")
+        self._add_pod("small-1", "small", 10, node_name="n65")
+        self._add_pod("hi-0", "hi", 100)
+        self._add_pod("hi-1", "hi", 100)
+
+        plan = self.planner.plan("hi")
+
+        self.assertTrue(plan.feasible)
+        self.assertEqual([g.gang_id for g in plan.victims], ["small"])
+        self.assertEqual(plan.freed_nodes, {"n64", "n65"})
+        self.assertEqual(plan.evicted_pods, 2)
+
+    def test_prefers_lower_priority_at_equal_size(self):
+        self._add_nodes(2)
+        self._add_pod("a-0", "a", 50, node_name="n0")
+        self._add_pod("b-0", "b", 5, node_name="n1")
+        self._add_pod("hi-0", "hi", 100)
+
+        plan = self.planner.plan("hi")
+
+        self.assertEqual([g.gang_id for g in plan.victims], ["b"])
+
+    def test_shared_node_needs_every_occupant(self):
+        self._add_nodes(1)
+        self._add_pod("x-0", "x", 1, node_name="n0")
+        self._add_pod("y-0", "y", 1, node_name="n0")
+        self._add_pod("hi-0", "hi", 100)
+
+        plan = self.planner.plan("hi")
+
+        self.assertTrue(plan.feasible)
+        self.assertEqual(sorted(g.gang_id for g in plan.victims), ["x", "y"])
+        self.assertEqual(plan.freed_nodes, {"n0"})
+
+    def test_higher_priority_occupant_makes_plan_infeasible(self):
+        self._add_nodes(1)
+        self._add_pod("low-0", "low", 1, node_name="n0")
+        self._add_pod("top-0", "top", 1000, node_name="n0")
+        self._add_pod("hi-0", "hi", 100)
+
+        plan = self.planner.plan("hi")
+
+        self.assertFalse(plan.feasible)
+        self.assertEqual(plan.freed_nodes, set())
+
+    def test_only_nodes_the_preemptor_can_use_count(self):
+        self.index.on_node_event("ADDED", make_node("gpu-0", labels={"gpu": "true"}))
+        self.index.on_node_event("ADDED", make_node("cpu-0"))
+        self.index.on_node_event("ADDED", make_node("cpu-1"))
+        self._add_pod("cheap-0", "cheap", 1, node_name="cpu-0")
+        self._add_pod("gpu-job-0", "gpu-job", 5, node_name="gpu-0")
+        self._add_pod("hi-0", "hi", 100, node_selector={"gpu": "true"})
+
+        plan = self.planner.plan("hi")
+
+        # cpu-1 is free and cheap is the cheaper victim, but neither helps.
+        self.assertEqual(plan.needed_nodes, 1)
+        self.assertTrue(plan.feasible)
+        self.assertEqual([g.gang_id for g in plan.victims], ["gpu-job"])
+        self.assertEqual(plan.freed_nodes, {"gpu-0"})
+
+    def test_no_preemption_needed_when_nodes_are_free(self):
+        self._add_nodes(2)
+        self._add_pod("low-0", "low", 1, node_name="n0")
+        self._add_pod("hi-0", "hi", 100)
+
+        plan = self.planner.plan("hi")
+
+        self.assertTrue(plan.feasible)
+        self.assertEqual(plan.victims, [])
+
+
+class TestPackedPreemption(unittest.TestCase):
+    def test_frees_room_not_a_node_per_pod(self):
+        # Eight full 4-CPU nodes: one evicted group makes room for all
+        # four 1-CPU pods of the preemptor.
+        index = NodeIndex(packing=MostAllocated())
+        pods = []
+        for i in range(8):
+            index.on_node_event("ADDED", make_node(f"n{i}", cpu="4"))
+            pods.append(make_pod(f"low{i}-0", f"low{i}", priority=i + 1, node_name=f"n{i}", cpu="4"))
+        pods += [make_pod(f"hi-{i}", "hi", priority=100, cpu="1", group_size=4) for i in range(4)]
+        for pod in pods:
+            index.on_pod_event("ADDED", pod)
+        v1 = Mock(spec=client.CoreV1Api)
+        v1.list_pod_for_all_namespaces.side_effect = lambda **_: Mock(items=pods)
+
+        plan = PreemptionPlanner(PodGroupDiscoverer(v1), index).plan("hi")
+
+        self.assertEqual(plan.needed_nodes, 4)
+        self.assertTrue(plan.feasible)
+        self.assertEqual([g.gang_id for g in plan.victims], ["low0"])
+        self.assertEqual(plan.freed_nodes, {"n0"})
+
+
+class TestFeasiblePreemption(unittest.TestCase):
+    def test_only_feasible_free_nodes_are_nominated(self):
+        api = FakeCoreV1Api()
+        for name, zone in (("a0", "a"), ("a1", "a"), ("b0", "b"), ("b1", "b")):
+            api.add_node(make_node(name, labels={"zone": zone}))
+        api.add_pod(make_pod("low-0", "low", priority=1, node_name="a0"))
+        high = make_gang("high", 2, priority=100)
+        for pod in high:
+            pod.spec.node_selector = {"zone": "a"}
+            api.add_pod(pod)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=api, watch_factory=lambda: FakeWatch(api))
+            scheduler.cache._relist(scheduler.cache._nodes)
+            scheduler.cache._relist(scheduler.cache._pods)
+            for pod in high:
+                scheduler._schedule_pod(scheduler.cache.get_pod(f"default/{pod.metadata.name}"))
+
+        index = scheduler.node_index
+        self.assertEqual([index.nominated_to(n) for n in ("a0", "a1", "b0", "b1")], ["high", "high", None, None])
+
+
+class TestPreemptionDuringEvictions(unittest.TestCase):
+    def test_terminating_victims_are_not_chosen_again(self):
+        api = FakeCoreV1Api(eviction_delay=60)
+        for i in range(3):
+            api.add_node(make_node(f"n{i}"))
+        api.add_pod(make_pod("low-0", "low", priority=1, node_name="n0"))
+        api.add_pod(make_pod("spare-0", "spare", priority=5, node_name="n1"))
+        api.add_pod(make_pod("top-0", "top", priority=1000, node_name="n2"))
+        api.add_pod(make_pod("mid-0", "mid", priority=50))
+        api.add_pod(make_pod("hi-0", "hi", priority=100))
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=api, watch_factory=lambda: FakeWatch(api))
+            scheduler.cache._relist(scheduler.cache._nodes)
+            scheduler.cache._relist(scheduler.cache._pods)
+            scheduler._schedule_pod(scheduler.cache.get_pod("default/mid-0"))
+            scheduler.cache._relist(scheduler.cache._pods)
+            self.assertIsNotNone(api.get_pod("default", "low-0").metadata.deletion_timestamp)
+            self.assertEqual(scheduler.node_index.nominated_to("n0"), "mid")
+
+            plan = scheduler._preempt_for_group("hi")
+
+        self.assertEqual([g.gang_id for g in plan.victims], ["spare"])
+        self.assertEqual(plan.freed_nodes, {"n1"})
+        self.assertEqual(plan.victim_pods, {"spare": 1})
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import unittest
+from kubernetes import client
+from bench.cluster import make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakePolicyV1Api, FakeWatch
+from main import Scheduler
+from rebalance import RebalancePolicy
+from resources import MostAllocated
+
+
+def _replica(name, node_name, cpu="1", group=None):
+    group = group or name
+    pod = make_pod(name, group, node_name=node_name, cpu=cpu)
+    pod.metadata.owner_references = [client.V1OwnerReference(api_version="apps/v1", kind="ReplicaSet",
+                                                             name=f"{group}-rs", uid=f"{group}-uid")]
+    return pod
+
+
+class TestRebalancer(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        for i in range(3):
+            self.api.add_node(make_node(f"n{i}", cpu="4"))
+            self.api.add_pod(_replica(f"w{i}", f"n{i}"))
+        # A bare pod is not recreated once evicted, so its node stays put.
+        self.api.add_pod(make_pod("bare", "bare", node_name="n2", cpu="1"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api),
+                                       packing=MostAllocated(), rebalance=RebalancePolicy(interval=0))
+            self._sync()
+
+    def _sync(self):
+        self.scheduler.cache._relist(self.scheduler.cache._nodes)
+        self.scheduler.cache._relist(self.scheduler.cache._pods)
+
+    def test_plan_moves_whole_groups_onto_busy_nodes(self):
+        moves = self.scheduler.rebalancer.plan(want=3)
+        self.assertEqual(sorted((m.node, tuple(m.groups)) for m in moves), [("n0", ("w0",)), ("n1", ("w1",))])
+        self.assertEqual(self.scheduler.rebalancer.plan(want=1, budget=0), [])
+
+    def test_plan_for_pods_stops_once_they_have_room(self):
+        # Two 1-CPU pods fit on one freed 4-CPU node.
+        pods = [make_pod(f"small-{i}", "small", cpu="1") for i in range(2)]
+        self.assertEqual(len(self.scheduler.rebalancer.plan(want=2, for_pods=pods)), 1)
+        self.assertEqual(len(self.scheduler.rebalancer.plan(want=5, for_pods=pods)), 2)
+
+    def test_disruption_budget_blocks_the_move(self):
+        for i in range(3):
+            self.api.add_disruption_budget("default", {"app": f"w{i}"}, 0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(self.scheduler.rebalancer.step(want=1), [])
+        self.assertTrue(all(self.api.get_pod("default", f"w{i}") is not None for i in range(3)))
+
+    def test_frees_a_node_for_a_waiting_gang(self):
+        big = make_pod("big-0", "big", cpu="4", group_size=1)
+        self.api.add_pod(big)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self._sync()
+            self.assertFalse(self.scheduler._schedule_pod(self.scheduler.cache.get_pod("default/big-0")))
+            self.scheduler._on_tick()
+            self._sync()
+            freed = [n for n in ("n0", "n1") if self.scheduler.node_index.is_free(n)]
+            self.assertEqual(len(freed), 1)
+            self.assertEqual(self.scheduler.node_index.nominated_to(freed[0]), "big")
+            self.assertTrue(self.scheduler._schedule_pod(self.scheduler.cache.get_pod("default/big-0")))
+
+        self.assertEqual(self.api.get_pod("default", "big-0").spec.node_name, freed[0])
+        self.assertEqual(self.api.calls["create_namespaced_pod_eviction"], 2)
+
+    def test_needs_packing(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api), rebalance=True)
+        self.assertIsNone(scheduler.rebalancer)
+
+
+class TestRebalanceDisruptionBudget(unittest.TestCase):
+    # A two-pod group on n0 could move next to the bare pod on n1, but its
+    # budget allows one disruption: each pod passes a dry run on its own.
+
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        for i in range(2):
+            self.api.add_node(make_node(f"n{i}", cpu="4"))
+        for i in range(2):
+            self.api.add_pod(_replica(f"pair-{i}", "n0", group="pair"))
+        self.api.add_pod(make_pod("bare", "bare", node_name="n1", cpu="1"))
+        self.api.add_disruption_budget("default", {"app": "pair"}, 1, name="pair-pdb")
+
+    def _scheduler(self, policy_v1=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api), packing=MostAllocated(),
+                                  rebalance=RebalancePolicy(interval=0), policy_v1=policy_v1)
+            scheduler.cache._relist(scheduler.cache._nodes)
+            scheduler.cache._relist(scheduler.cache._pods)
+        self.assertEqual([m.groups for m in scheduler.rebalancer.plan(want=1)], [["pair"]])
+        return scheduler
+
+    def test_group_larger_than_allowance_stays(self):
+        scheduler = self._scheduler(FakePolicyV1Api(self.api))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(scheduler.rebalancer.step(want=1), [])
+        self.assertIn("default/pair-pdb", out.getvalue())
+        self.assertEqual(self.api.calls["create_namespaced_pod_eviction"], 0)
+
+    def test_split_group_is_not_a_move(self):
+        # Without PolicyV1Api only the eviction API catches it, half way.
+        scheduler = self._scheduler()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(scheduler.rebalancer.step(want=1), [])
+        self.assertIn("split groups pair", out.getvalue())
+        remaining = [i for i in range(2) if self.api.get_pod("default", f"pair-{i}") is not None]
+        self.assertEqual(len(remaining), 1)
@@ -0,0 +1,47 @@
+import unittest
+from kubernetes import client
+from bench.cluster import make_pod
+from pod_utils import active_node_of, is_terminating, should_skip_pod_for_scheduling
+from records import PodRecord
+from resources import pod_requests
+
+
+class TestPodRecord(unittest.TestCase):
+    def test_reads_like_a_pod(self):
+        pod = make_pod("a", "g", namespace="team", priority=3, node_name="node1", cpu="1500m",
+                       memory="1Gi", group_size=4)
+        pod.metadata.annotations["kubectl.kubernetes.io/last-applied-configuration"] = "{...}"
+        pod.spec.init_containers = [client.V1Container(
+            name="init", resources=client.V1ResourceRequirements(requests={"cpu": "2"}))]
+
+        record = PodRecord.from_pod(pod)
+
+        self.assertEqual((record.metadata.name, record.metadata.namespace), ("a", "team"))
+        self.assertEqual(record.metadata.annotations, {"pod-group": "g", "pod-group-size": "4"})
+        self.assertEqual((record.spec.node_name, record.spec.priority, record.status.phase), ("node1", 3, "Running"))
+        self.assertEqual(pod_requests(record), pod_requests(pod))
+        self.assertEqual(active_node_of(record), "node1")
+        self.assertFalse(is_terminating(record))
+        self.assertFalse(should_skip_pod_for_scheduling(record))
+
+    def test_daemonset_owner_and_deletion(self):
+        pod = make_pod("a", "g", node_name="node1")
+        pod.metadata.owner_references = [client.V1OwnerReference(
+            api_version="apps/v1", kind="DaemonSet", name="ds", uid="1")]
+        pod.metadata.deletion_timestamp = "2024-01-01T00:00:00Z"
+
+        record = PodRecord.from_pod(pod)
+
+        self.assertTrue(should_skip_pod_for_scheduling(record))
+        self.assertTrue(is_terminating(record))
+        self.assertIsNone(active_node_of(record))
+
+    def test_immutable_and_shared(self):
+        first = PodRecord.from_pod(make_pod("a", "g", namespace="team-" + "x", node_name="node1"))
+        second = PodRecord.from_pod(make_pod("b", "g", namespace="-".join(["team", "x"]), node_name="node1"))
+
+        with self.assertRaises(AttributeError):
+            first.node_name = "node2"
+        self.assertIs(first.namespace, second.namespace)
+        self.assertIs(first.containers, second.containers)
+        self.assertIs(PodRecord.from_pod(first), first)
@@ -0,0 +1,89 @@
+import unittest
+from kubernetes import client
+from node import NodeIndex
+from resources import LeastAllocated, MostAllocated, pod_requests, node_allocatable
+
+
+def make_node(name, cpu="4", memory="16Gi", gpus=None):
+    allocatable = {"cpu": cpu, "memory": memory}
+    if gpus:
+        allocatable["nvidia.com/gpu"] = str(gpus)
+    return client.V1Node(metadata=client.V1ObjectMeta(name=name),
+                         status=client.V1NodeStatus(allocatable=allocatable))
+
+
+def make_pod(name, cpu="1", memory="1Gi", node_name=None, gpus=None, init_cpu=None, namespace="default"):
+    requests = {"cpu": cpu, "memory": memory}
+    if gpus:
+        requests["nvidia.com/gpu"] = str(gpus)
+    init = None
+    if init_cpu:
+        init = [client.V1Container(name="init", resources=client.V1ResourceRequirements(requests={"cpu": init_cpu}))]
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name=name, namespace=namespace, annotations={"pod-group": "g"}),
+        spec=client.V1PodSpec(
+            node_name=node_name,
+            containers=[client.V1Container(name="c", resources=client.V1ResourceRequirements(requests=requests))],
+            init_containers=init),
+        status=client.V1PodStatus(phase="Running" if node_name else "Pending"))
+
+
+class TestResources(unittest.TestCase):
+    def test_pod_requests(self):
+        self.assertEqual(pod_requests(make_pod("a", cpu="100m", memory="1Gi", gpus=2)),
+                         {"cpu": 100, "memory": 1 << 30, "nvidia.com/gpu": 2})
+        self.assertEqual(pod_requests(make_pod("a", cpu="500m", init_cpu="2"))["cpu"], 2000)
+        self.assertEqual(node_allocatable(make_node("n", cpu="96"))["cpu"], 96000)
+
+    def test_strategies(self):
+        allocatable = {"cpu": 4000, "memory": 4000}
+        busy = {"cpu": 3000, "memory": 3000}
+        request = {"cpu": 500, "memory": 500}
+        self.assertGreater(MostAllocated().score(allocatable, busy, request),
+                           MostAllocated().score(allocatable, {}, request))
+        self.assertGreater(LeastAllocated().score(allocatable, {}, request),
+                           LeastAllocated().score(allocatable, busy, request))
+
+
+class TestNodeIndexPacking(unittest.TestCase):
+    def _index(self, packing):
+        index = NodeIndex(packing=packing)
+        index.on_node_event("ADDED", make_node("big", cpu="96", memory="256Gi"))
+        index.on_node_event("ADDED", make_node("small", cpu="4", memory="16Gi"))
+        index.on_pod_event("ADDED", make_pod("running", cpu="100m", node_name="big"))
+        return index
+
+    def test_small_pod_does_not_block_large_node(self):
+        index = self._index(MostAllocated())
+        self.assertEqual(index.count_free_nodes(), 1)
+        status = {s.name: s for s in index.statuses()}["big"]
+        self.assertEqual(status.available["cpu"], 95900)
+        self.assertEqual(index.capacity_for([make_pod(f"p{i}", cpu="2") for i in range(60)]), 49)
+
+    def test_strategy_decides_placement(self):
+        most = self._index(MostAllocated())
+        self.assertEqual(most.assume_free_node("default/a", request={"cpu": 1000, "memory": 1 << 30}), "small")
+        least = self._index(LeastAllocated())
+        self.assertEqual(least.assume_free_node("default/a", request={"cpu": 1000, "memory": 1 << 30}), "big")
+
+    def test_requests_must_fit(self):
+        index = self._index(MostAllocated())
+        self.assertIsNone(index.assume_free_node("default/gpu", request={"nvidia.com/gpu": 1}))
+        self.assertIsNone(index.assume_free_node("default/huge", request={"cpu": 200000}))
+
+        index.assume_free_node("default/a", request={"cpu": 4000})
+        index.forget("default/a")
+        self.assertEqual({s.name: s.requested.get("cpu", 0) for s in index.statuses()},
+                         {"big": 100, "small": 0})
+
+    def test_system_pods_use_capacity_but_leave_node_free(self):
+        index = NodeIndex(packing=MostAllocated())
+        index.on_node_event("ADDED", make_node("n0", cpu="4"))
+        system = make_pod("proxy", cpu="3", node_name="n0", namespace="kube-system")
+        index.on_pod_event("ADDED", system)
+        self.assertEqual(index.count_free_nodes(), 1)
+        self.assertIsNone(index.assume_free_node("default/a", request={"cpu": 3000}))
+        self.assertEqual(index.assume_free_node("default/b", request={"cpu": 1000}), "n0")
+
+        index.on_pod_event("DELETED", system)
+        self.assertEqual({s.name: s.requested.get("cpu", 0) for s in index.statuses()}, {"n0": 1000})
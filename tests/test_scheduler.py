@@ -0,0 +1,170 @@
+import unittest
+from unittest.mock import Mock
+from main import Scheduler, PreemptionError
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.mock_v1 = Mock(spec=client.CoreV1Api)
+        self.scheduler = Scheduler(scheduler_name="foobar", v1=self.mock_v1)
+        for name in ("node1", "node2"):
+            node = Mock(spec=client.V1Node)
+            node.metadata = Mock()
+            node.metadata.name = name
+            self.scheduler.node_index.on_node_event("ADDED", node)
+
+    def _create_mock_pod(self, name, group="g", namespace="default", node_name=None, phase="Pending", size=None):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = namespace
+        pod.metadata.annotations = {"pod-group": group}
+        if size is not None:
+            pod.metadata.annotations["pod-group-size"] = str(size)
+        pod.metadata.owner_references = []
+        pod.metadata.deletion_timestamp = None
+        pod.spec = Mock()
+        pod.spec.node_name = node_name
+        pod.spec.scheduler_name = "foobar"
+        pod.spec.priority = 0
+        pod.status = Mock()
+        pod.status.phase = phase
+        return pod
+
+    def _bound_nodes(self):
+        return [c[1]["body"].target.name for c in self.mock_v1.create_namespaced_pod_binding.call_args_list]
+
+    def test_back_to_back_binds_use_distinct_nodes(self):
+        self.scheduler._schedule_pod(self._create_mock_pod("a"))
+        self.scheduler._schedule_pod(self._create_mock_pod("b"))
+
+        self.assertEqual(sorted(self._bound_nodes()), ["node1", "node2"])
+        self.assertFalse(self.scheduler._is_schedulable(self._create_mock_pod("a"), "MODIFIED"))
+
+    def test_bind_failure_releases_reservation(self):
+        self.mock_v1.create_namespaced_pod_binding.side_effect = ApiException(status=500)
+
+        self.scheduler._schedule_pod(self._create_mock_pod("a"))
+
+        self.assertEqual(self.scheduler.node_index.count_free_nodes(), 2)
+        self.assertFalse(self.scheduler.node_index.is_assumed("default/a"))
+
+    def test_gang_waits_for_all_members(self):
+        self.scheduler._schedule_pod(self._create_mock_pod("a", size=2))
+        self.mock_v1.create_namespaced_pod_binding.assert_not_called()
+        self.assertEqual(self.scheduler.node_index.count_free_nodes(), 2)
+
+        self.scheduler._schedule_pod(self._create_mock_pod("b", size=2))
+        self.assertEqual(sorted(self._bound_nodes()), ["node1", "node2"])
+        self.assertIsNone(self.scheduler.permit.get("g"))
+
+    def test_gang_without_capacity_binds_nothing(self):
+        for name in ("a", "b"):
+            self.scheduler._schedule_pod(self._create_mock_pod(name, size=3))
+        self.scheduler._schedule_pod(self._create_mock_pod("c", size=3))
+
+        self.mock_v1.create_namespaced_pod_binding.assert_not_called()
+        self.assertEqual(self.scheduler.node_index.count_free_nodes(), 2)
+        self.assertEqual(len(self.scheduler.permit.get("g").pods), 3)
+
+    def test_events_are_queued_and_failures_backed_off(self):
+        pod = self._create_mock_pod("a", size=3)
+        self.scheduler._on_pod_event("ADDED", pod)
+        self.scheduler._on_pod_event("MODIFIED", pod)
+        self.assertEqual(len(self.scheduler.queue), 1)
+
+        self.scheduler._process(self.scheduler.queue.pop(timeout=0))
+        self.assertIsNone(self.scheduler.queue.pop(timeout=0))
+        self.assertEqual(len(self.scheduler.queue), 1)
+
+        self.scheduler._on_pod_event("DELETED", pod)
+        self.assertEqual(len(self.scheduler.queue), 0)
+        self.assertIsNone(self.scheduler.permit.get("g"))
+
+    def _add_to_cache(self, pod):
+        self.scheduler.cache._apply(self.scheduler.cache._pods, "ADDED", pod)
+
+    def test_preemption_dry_run_and_partial_eviction(self):
+        for i in range(2):
+            low = self._create_mock_pod(f"low-{i}", group="low", node_name=f"node{i + 1}", phase="Running")
+            low.spec.priority = 1
+            self._add_to_cache(low)
+        high = self._create_mock_pod("high-0", group="high")
+        high.spec.priority = 100
+        self._add_to_cache(high)
+
+        plan = self.scheduler._preempt_for_group("high", dry_run=True)
+        self.assertEqual([g.gang_id for g in plan.victims], ["low"])
+        self.assertEqual(plan.needed_nodes, 1)
+        self.mock_v1.create_namespaced_pod_eviction.assert_not_called()
+
+        self.mock_v1.create_namespaced_pod_eviction.side_effect = ApiException(status=429)
+        with self.assertRaises(PreemptionError):
+            self.scheduler._preempt_for_group("high")
+
+    def test_preemptor_binds_once_nominated_nodes_clear(self):
+        low_pods = []
+        for i in range(2):
+            low = self._create_mock_pod(f"low-{i}", group="low", node_name=f"node{i + 1}", phase="Running")
+            low.spec.priority = 1
+            low_pods.append(low)
+            self._add_to_cache(low)
+        high_pods = []
+        for i in range(2):
+            high = self._create_mock_pod(f"high-{i}", group="high", size=2)
+            high.spec.priority = 100
+            high_pods.append(high)
+            self._add_to_cache(high)
+
+        self.scheduler._process(self.scheduler.queue.pop(timeout=0))
+        self.scheduler._process(self.scheduler.queue.pop(timeout=0))
+        self.assertEqual(self.mock_v1.create_namespaced_pod_eviction.call_count, 2)
+        self.assertTrue(self.scheduler.node_index.has_nomination("high"))
+        self.mock_v1.create_namespaced_pod_binding.assert_not_called()
+
+        # Other gangs can't take the nodes while they drain.
+        self.scheduler.cache._apply(self.scheduler.cache._pods, "DELETED", low_pods[0])
+        self.assertIsNone(self.scheduler.node_index.assume_free_node("default/other", "other"))
+        self.assertIsNone(self.scheduler.queue.pop(timeout=0))
+
+        self.scheduler.cache._apply(self.scheduler.cache._pods, "DELETED", low_pods[1])
+        while True:
+            pod = self.scheduler.queue.pop(timeout=0)
+            if pod is None:
+                break
+            self.scheduler._process(pod)
+
+        self.assertEqual(sorted(self._bound_nodes()), ["node1", "node2"])
+        self.assertFalse(self.scheduler.node_index.has_nomination("high"))
+
+    def test_failed_bind_is_retried_with_bound_members_counted(self):
+        failed = []
+
+        def bind(name, namespace, body):
+            if name == "b" and not failed:
+                failed.append(name)
+                raise ApiException(status=500)
+
+        self.mock_v1.create_namespaced_pod_binding.side_effect = bind
+        self.scheduler.queue.initial_backoff = 0
+        for name in ("a", "b"):
+            self._add_to_cache(self._create_mock_pod(name, size=2))
+        for _ in range(2):
+            self.scheduler._process(self.scheduler.queue.pop(timeout=0))
+        self.assertTrue(self.scheduler.queue.backing_off("default/b"))
+        self.assertFalse(self.scheduler.queue.backing_off("default/a"))
+
+        node_a = self._bound_nodes()[[c[1]["name"] for c in
+                                      self.mock_v1.create_namespaced_pod_binding.call_args_list].index("a")]
+        self._add_to_cache(self._create_mock_pod("a", size=2, node_name=node_a, phase="Running"))
+        while True:
+            pod = self.scheduler.queue.pop(timeout=0)
+            if pod is None:
+                break
+            self.scheduler._process(pod)
+
+        calls = self.mock_v1.create_namespaced_pod_binding.call_args_list
+        self.assertEqual([c[1]["name"] for c in calls].count("b"), 2)
+        self.assertNotEqual(calls[-1][1]["body"].target.name, node_a)
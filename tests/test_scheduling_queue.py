@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import Mock
+from scheduling_queue import SchedulingQueue
+from kubernetes import client
+
+
+class TestSchedulingQueue(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.queue = SchedulingQueue(initial_backoff=1, max_backoff=4, clock=lambda: self.now[0])
+
+    def _create_mock_pod(self, name, priority=None, annotations=None):
+        pod = Mock(spec=client.V1Pod)
+        pod.metadata = Mock()
+        pod.metadata.name = name
+        pod.metadata.namespace = "default"
+        pod.metadata.annotations = annotations or {}
+        pod.spec = Mock()
+        pod.spec.priority = priority
+        return pod
+
+    def test_pops_highest_priority_first(self):
+        self.queue.add(self._create_mock_pod("low", priority=1))
+        self.queue.add(self._create_mock_pod("high", priority=100))
+        self.queue.add(self._create_mock_pod("mid", annotations={"priority": "50"}))
+
+        names = [self.queue.pop(timeout=0).metadata.name for _ in range(3)]
+        self.assertEqual(names, ["high", "mid", "low"])
+        self.assertIsNone(self.queue.pop(timeout=0))
+
+    def test_updates_coalesce_to_latest_object(self):
+        first = self._create_mock_pod("a", priority=1)
+        latest = self._create_mock_pod("a", priority=1)
+        self.queue.add(first)
+        self.queue.add(latest)
+
+        self.assertEqual(len(self.queue), 1)
+        self.assertIs(self.queue.pop(timeout=0), latest)
+
+    def test_exponential_backoff(self):
+        pod = self._create_mock_pod("a")
+        delays = []
+        for _ in range(4):
+            self.queue.backoff(pod)
+            start = self.now[0]
+            while self.queue.pop(timeout=0) is None:
+                self.now[0] += 0.5
+            delays.append(self.now[0] - start)
+        self.assertEqual(delays, [1, 2, 4, 4])
+
+        self.queue.done("default/a")
+        self.queue.backoff(pod)
+        self.now[0] += 1
+        self.assertIsNotNone(self.queue.pop(timeout=0))
+
+    def test_delete_drops_pending_entries(self):
+        self.queue.add(self._create_mock_pod("a"))
+        self.queue.backoff(self._create_mock_pod("b"))
+        self.queue.delete("default/a")
+        self.queue.delete("default/b")
+
+        self.now[0] = 10
+        self.assertIsNone(self.queue.pop(timeout=0))
+        self.assertEqual(len(self.queue), 0)
+
+    def test_deleted_entries_are_compacted(self):
+        for i in range(200):
+            self.queue.backoff(self._create_mock_pod(f"p{i}"))
+            self.queue.delete(f"default/p{i}")
+        self.queue.backoff(self._create_mock_pod("live"))
+
+        self.queue.flush()
+
+        self.assertEqual(len(self.queue._backoff), 1)
+        self.now[0] = 10
+        self.assertEqual(self.queue.pop(timeout=0).metadata.name, "live")
@@ -0,0 +1,120 @@
+import contextlib
+import io
+import multiprocessing
+import threading
+import time
+import unittest
+from collections import Counter
+from bench.cluster import make_gang, make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from main import NoNodesAvailableError, Scheduler
+from shard import NodeClaims, shard_of
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _claim_in_child(claims, node, holder, results):
+    results.put(claims.claim(node, holder, 60))
+
+
+class TestNodeClaims(unittest.TestCase):
+    def test_shard_of_is_stable_and_spread(self):
+        self.assertEqual(shard_of("gang-1", 4), shard_of("gang-1", 4))
+        counts = Counter(shard_of(f"gang-{i}", 4) for i in range(1000))
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertGreater(min(counts.values()), 200)
+
+    def test_claims_are_exclusive_until_expiry_or_release(self):
+        clock = _Clock()
+        claims = NodeClaims(clock=clock)
+        self.assertTrue(claims.claim("n", "a", ttl=5))
+        self.assertFalse(claims.claim("n", "b", ttl=5))
+        self.assertTrue(claims.claim("n", "a", ttl=5))
+        self.assertEqual(claims.holder_of("n"), "a")
+
+        clock.now = 5
+        self.assertIsNone(claims.holder_of("n"))
+        self.assertTrue(claims.claim("n", "b", ttl=5))
+        claims.release("n", "a")
+        self.assertEqual(claims.holder_of("n"), "b")
+        claims.release("n", "b")
+        self.assertTrue(claims.claim("n", "a", ttl=5))
+
+    def test_shared_claims_cross_processes(self):
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager:
+            claims = NodeClaims.shared(manager)
+            self.assertTrue(claims.claim("n", "parent", 60))
+            results = context.Queue()
+            for node in ("n", "m"):
+                child = context.Process(target=_claim_in_child, args=(claims, node, "child", results))
+                child.start()
+                child.join(timeout=30)
+                self.assertEqual(results.get(timeout=5), node == "m")
+            self.assertEqual(claims.holder_of("m"), "child")
+
+
+class TestShardedScheduler(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeCoreV1Api()
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+
+    def tearDown(self):
+        self._out.__exit__(None, None, None)
+
+    def _worker(self, index, count, claims):
+        return Scheduler(v1=self.api, watch_factory=lambda: FakeWatch(self.api), tick_interval=0.02,
+                         shard=(index, count), claims=claims)
+
+    def test_claimed_node_is_skipped(self):
+        for i in range(2):
+            self.api.add_node(make_node(f"node{i}"))
+        claims = NodeClaims()
+        claims.claim("node0", "other-worker", 60)
+        scheduler = self._worker(0, 1, claims)
+        scheduler.cache._relist(scheduler.cache._nodes)
+
+        self.assertEqual(scheduler._select_node(make_pod("a", "g")), "node1")
+        with self.assertRaises(NoNodesAvailableError):
+            scheduler._select_node(make_pod("b", "g"))
+        self.assertEqual(scheduler.claim_conflicts, 1)
+        self.assertEqual(claims.holder_of("node1"), scheduler.claim_holder)
+
+    def test_workers_split_gangs_without_double_booking(self):
+        for i in range(24):
+            self.api.add_node(make_node(f"node{i}"))
+        claims = NodeClaims()
+        workers = [self._worker(i, 3, claims) for i in range(3)]
+        threads = [threading.Thread(target=w.run, daemon=True) for w in workers]
+        for thread in threads:
+            thread.start()
+        try:
+            for worker in workers:
+                self.assertTrue(worker.cache.wait_for_sync(timeout=5))
+            names = []
+            for g in range(8):
+                for pod in make_gang(f"gang-{g}", 3):
+                    self.api.add_pod(pod)
+                    names.append(pod.metadata.name)
+
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline and not all(
+                    self.api.get_pod("default", n).spec.node_name for n in names):
+                time.sleep(0.01)
+        finally:
+            for worker in workers:
+                worker.stop()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        nodes = [self.api.get_pod("default", n).spec.node_name for n in names]
+        self.assertTrue(all(nodes))
+        self.assertEqual(len(set(nodes)), len(names))
+        self.assertEqual({shard_of(f"gang-{g}", 3) for g in range(8)}, {0, 1, 2})
@@ -0,0 +1,99 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from bench.cluster import make_gang, make_node, make_pod
+from cache import ClusterCache
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from main import Scheduler
+from records import NodeRecord, PodRecord
+from snapshot import Snapshot, load, save
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "state.snap")
+        self._out = contextlib.redirect_stdout(io.StringIO())
+        self._out.__enter__()
+
+    def tearDown(self):
+        self._out.__exit__(None, None, None)
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        pods = [make_pod("a", "g", priority=3, node_name="node1", cpu="2"), make_pod("b", "g")]
+        nodes = [make_node("node1", labels={"zone": "a"})]
+        save(self.path, Snapshot(pods=pods, nodes=nodes, pods_version="12", nodes_version="9", taken_at=5.0))
+
+        snap = load(self.path)
+
+        self.assertEqual([p.fields() for p in snap.pods], [PodRecord.from_pod(p).fields() for p in pods])
+        self.assertEqual([n.fields() for n in snap.nodes], [NodeRecord.from_node(n).fields() for n in nodes])
+        self.assertEqual((snap.pods_version, snap.nodes_version, snap.taken_at), ("12", "9", 5.0))
+
+    def test_missing_or_corrupt_snapshot_is_ignored(self):
+        self.assertIsNone(load(self.path))
+        with open(self.path, "wb") as f:
+            f.write(b"GSNP\x01\x00\x00\x00garbage")
+        self.assertIsNone(load(self.path))
+
+    def test_restore_resumes_watch_from_saved_version(self):
+        api = FakeCoreV1Api()
+        api.add_node(make_node("node1"))
+        api.add_pod(make_pod("a", "g"))
+        first = ClusterCache(api)
+        first._relist(first._nodes)
+        first._relist(first._pods)
+        pods, pods_version, nodes, nodes_version = first.state()
+        save(self.path, Snapshot(pods=pods, nodes=nodes, pods_version=pods_version, nodes_version=nodes_version))
+        api.add_pod(make_pod("b", "g"))
+        calls = api.calls["list_pod_for_all_namespaces"]
+
+        cache = ClusterCache(api, resync_period=0.02, watch_factory=lambda: FakeWatch(api))
+        snap = load(self.path)
+        cache.restore(snap.pods, snap.pods_version, snap.nodes, snap.nodes_version)
+        self.assertTrue(cache.has_synced())
+        cache.start()
+        try:
+            deadline = time.monotonic() + 5
+            while cache.get_pod("default/b") is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            cache.stop()
+
+        self.assertIsNotNone(cache.get_pod("default/b"))
+        self.assertEqual(api.calls["list_pod_for_all_namespaces"], calls)
+
+    def test_scheduler_restarts_from_snapshot(self):
+        api = FakeCoreV1Api()
+        for i in range(4):
+            api.add_node(make_node(f"node{i}"))
+
+        def run_until_bound(names):
+            scheduler = Scheduler(v1=api, watch_factory=lambda: FakeWatch(api), tick_interval=0.02,
+                                  snapshot_path=self.path)
+            thread = threading.Thread(target=scheduler.run, daemon=True)
+            thread.start()
+            deadline = time.monotonic() + 5
+            while not all(k in api.bound_at for k in names) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            scheduler.stop()
+            thread.join(timeout=5)
+
+        for pod in make_gang("first", 2):
+            api.add_pod(pod)
+        run_until_bound(["default/first-0", "default/first-1"])
+        self.assertIsNotNone(load(self.path))
+        lists = api.calls["list_pod_for_all_namespaces"]
+
+        for pod in make_gang("second", 2):
+            api.add_pod(pod)
+        run_until_bound(["default/second-0", "default/second-1"])
+
+        self.assertEqual(api.calls["list_pod_for_all_namespaces"], lists)
+        nodes = {api.get_pod("default", f"{g}-{i}").spec.node_name for g in ("first", "second") for i in range(2)}
+        self.assertEqual(len(nodes), 4)
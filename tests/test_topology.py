@@ -0,0 +1,110 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+from bench.cluster import make_gang, make_node, make_pod
+from fake_k8s import FakeCoreV1Api, FakeWatch
+from main import Scheduler
+from topology import RACK_LABEL, ZONE_LABEL, TopologyScorer, np
+
+
+def _cluster(zones=2, racks=2, per_rack=4):
+    nodes = []
+    for z in range(zones):
+        for r in range(racks):
+            for i in range(per_rack):
+                nodes.append(make_node(f"z{z}-r{r}-{i}", labels={ZONE_LABEL: f"z{z}", RACK_LABEL: f"z{z}-r{r}"}))
+    return nodes
+
+
+def _rack(name):
+    return name.rsplit("-", 1)[0]
+
+
+class TestTopologyScorer(unittest.TestCase):
+    def _scorer(self, nodes, vectorized=None, busy=(), seed=1):
+        scorer = TopologyScorer(vectorized=vectorized, seed=seed)
+        for node in nodes:
+            scorer.on_node_event("ADDED", node)
+            scorer.set_free(node.metadata.name, node.metadata.name not in busy)
+        return scorer
+
+    def test_gang_fits_in_one_rack(self):
+        ranked = self._scorer(_cluster()).rank(4)
+        self.assertEqual(len(ranked), 4)
+        self.assertEqual(len({_rack(n) for n in ranked}), 1)
+
+    def test_equal_racks_are_never_interleaved(self):
+        # Ties between racks are broken before ties between nodes, whatever the seed.
+        nodes = _cluster(zones=2, racks=3)
+        for seed in range(500):
+            for vectorized in (None, False):
+                ranked = self._scorer(nodes, vectorized=vectorized, busy={"z1-r2-0"}, seed=seed).rank(3)
+                self.assertEqual(len({_rack(n) for n in ranked}), 1, (seed, ranked))
+
+    def test_larger_gang_stays_in_one_zone(self):
+        # z0 has two busy nodes, so only z1 can hold all seven.
+        ranked = self._scorer(_cluster(), busy={"z0-r0-0", "z0-r1-0"}).rank(7)
+        self.assertEqual({n[:2] for n in ranked}, {"z1"})
+        self.assertEqual(len(self._scorer(_cluster()).rank(6)), 6)
+
+    def test_prefers_racks_with_placed_members(self):
+        nodes = _cluster()
+        scorer = self._scorer(nodes, busy={"z1-r0-0"})
+        ranked = scorer.rank(2, near=["z1-r0-0"])
+        self.assertEqual({_rack(n) for n in ranked}, {"z1-r0"})
+
+    def test_unlabelled_and_deleted_nodes(self):
+        nodes = [make_node("plain-0"), make_node("plain-1")] + _cluster(zones=1, racks=1, per_rack=2)
+        scorer = self._scorer(nodes)
+        self.assertEqual({_rack(n) for n in scorer.rank(2)}, {"z0-r0"})
+        scorer.on_node_event("DELETED", nodes[-1])
+        self.assertNotIn(nodes[-1].metadata.name, scorer.rank(10))
+        self.assertEqual(len(scorer.rank(10)), 3)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_python_fallback_matches_vectorized(self):
+        nodes = _cluster(zones=3, racks=4, per_rack=5)
+        busy = {n.metadata.name for n in nodes[::7]}
+        for seed in range(20):
+            vectorized = self._scorer(nodes, vectorized=True, busy=busy, seed=seed)
+            python = self._scorer(nodes, vectorized=False, busy=busy, seed=seed)
+            for count, near in ((3, ()), (8, ()), (5, ["z2-r1-0"]), (100, ["z0-r0-0", "z1-r3-4"])):
+                self.assertEqual(vectorized.rank(count, near), python.rank(count, near), (seed, count))
+
+
+class TestTopologyPlacement(unittest.TestCase):
+    def test_scheduler_binds_gang_within_a_rack(self):
+        for seed in (1, 520, None):
+            with self.subTest(seed=seed):
+                self._check_gangs_within_a_rack(TopologyScorer(seed=seed))
+
+    def _check_gangs_within_a_rack(self, topology):
+        api = FakeCoreV1Api()
+        for node in _cluster(zones=2, racks=3, per_rack=4):
+            api.add_node(node)
+        api.add_pod(make_pod("seed", "other", node_name="z1-r2-0"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = Scheduler(v1=api, watch_factory=lambda: FakeWatch(api), tick_interval=0.02,
+                                  topology=topology)
+            thread = threading.Thread(target=scheduler.run, daemon=True)
+            thread.start()
+            try:
+                self.assertTrue(scheduler.cache.wait_for_sync(timeout=5))
+                for g in range(4):
+                    for pod in make_gang(f"train-{g}", 3):
+                        api.add_pod(pod)
+                names = [f"train-{g}-{i}" for g in range(4) for i in range(3)]
+                deadline = time.monotonic() + 5
+                while time.monotonic() < deadline and not all(
+                        api.get_pod("default", n).spec.node_name for n in names):
+                    time.sleep(0.01)
+            finally:
+                scheduler.stop()
+                thread.join(timeout=5)
+
+        for g in range(4):
+            nodes = [api.get_pod("default", f"train-{g}-{i}").spec.node_name for i in range(3)]
+            self.assertTrue(all(nodes))
+            self.assertEqual(len({_rack(n) for n in nodes}), 1, nodes)
@@ -0,0 +1,184 @@
+import random
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+RACK_LABEL = "topology.kubernetes.io/rack"
+DEFAULT_LEVELS = (ZONE_LABEL, RACK_LABEL)
+DEFAULT_WEIGHTS = {ZONE_LABEL: 1.0, RACK_LABEL: 2.0}
+DEFAULT_MEMBER_WEIGHT = 2.0
+
+class TopologyScorer:
+    # Ranks free nodes for a gang so its members land close together. Each
+    # node has a domain per topology level (zone, rack, ...). For a gang
+    # that needs `count` nodes, a node scores per level
+    #
+    #   weight * (min(free nodes in its domain, count) / count
+    #             + member_weight * share of the gang's placed members there)
+    #
+    # so domains that can hold the whole gang, and domains the gang already
+    # uses, come first. Nodes without a level's label score 0 for it.
+    #
+    # Features live in NumPy arrays indexed by a row per node, updated by
+    # NodeIndex as nodes come and go and become free or busy; rank() is one
+    # vectorized pass over them. Without NumPy the same scores are computed
+    # in Python. Subclasses can override _score / _score_python.
+
+    def __init__(self, levels: Sequence[str] = DEFAULT_LEVELS, weights: Optional[Dict[str, float]] = None,
+                 member_weight=DEFAULT_MEMBER_WEIGHT, vectorized=None, seed=None):
+        self.levels = tuple(levels)
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        self.weights = [float(weights.get(level, 1.0)) for level in self.levels]
+        self.member_weight = member_weight
+        self.vectorized = np is not None if vectorized is None else vectorized
+        self._rng = random.Random(seed)
+        self._rows: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._domain_ids: List[Dict[object, int]] = [{} for _ in self.levels]
+        self._node_domains: List[List[int]] = []
+        self._free_set = set()
+        self._node_tiebreak: List[float] = []
+        self._domain_tiebreak: Dict[int, float] = {-1: 0.0}
+        if self.vectorized:
+            self._domains = np.full((len(self.levels), 16), -1, dtype=np.int64)
+            self._free = np.zeros(16, dtype=bool)
+            self._node_tiebreak_array = np.zeros(16)
+            self._domain_tiebreak_array = np.zeros(16)
+
+    def on_node_event(self, event_type, node):
+        name = node.metadata.name
+        if event_type == "DELETED":
+            self.set_free(name, False)
+            return
+        labels = node.metadata.labels or {}
+        row = self._row(name)
+        domains = [self._domain_id(i, labels.get(level)) for i, level in enumerate(self.levels)]
+        self._node_domains[row] = domains
+        if self.vectorized:
+            self._domains[:, row] = domains
+
+    def set_free(self, name, free):
+        row = self._row(name)
+        if free:
+            self._free_set.add(name)
+        else:
+            self._free_set.discard(name)
+        if self.vectorized:
+            self._free[row] = free
+
+    def rank(self, count, near: Iterable[str] = (), only: Optional[Iterable[str]] = None,
+             exclude: Iterable[str] = ()) -> List[str]:
+        # Up to `count` free nodes, best first. `near` are nodes the gang
+        # already occupies or has been promised. `only` / `exclude` narrow
+        # the free nodes considered, e.g. to those feasible for the pod.
+        if count <= 0 or not self._free_set:
+            return []
+        near_rows = [self._rows[n] for n in near if n in self._rows]
+        if not self.vectorized:
+            names = self._free_set if only is None else [n for n in only if n in self._free_set]
+            excluded = set(exclude)
+            return self._rank_python(count, [self._rows[n] for n in names if n not in excluded], near_rows)
+        if only is not None:
+            rows = np.array([self._rows[n] for n in only if n in self._free_set], dtype=np.int64)
+        else:
+            free = self._free[:len(self._names)]
+            if exclude:
+                free = free.copy()
+                free[[self._rows[n] for n in exclude if n in self._rows]] = False
+            rows = np.flatnonzero(free)
+        if not len(rows):
+            return []
+        score = self._score(rows, count, near_rows)
+        if len(rows) > count:
+            # Everything scoring at least the count-th best, ties included.
+            keep = score >= -np.partition(-score, count - 1)[count - 1]
+            rows, score = rows[keep], score[keep]
+        # Equal scores are ordered by separate keys: a random order of the
+        # deepest domains, so equally good racks are never interleaved, then
+        # a random order of nodes, so replicas don't all pick the same one.
+        order = np.lexsort((-self._node_tiebreak_array[rows],
+                            -self._domain_tiebreak_array[self._domains[-1, rows] + 1], -score))
+        return [self._names[r] for r in rows[order[:count]]]
+
+    def _score(self, rows, count, near_rows):
+        score = np.zeros(len(rows))
+        near = self._domains[:, near_rows] if near_rows else None
+        for level, weight in enumerate(self.weights):
+            # Shift ids by one so "no label" (-1) lands in bin 0.
+            domains = self._domains[level, rows] + 1
+            size = len(self._domain_ids[level]) + 1
+            fill = np.minimum(np.bincount(domains, minlength=size), count) / count
+            if near is not None:
+                fill = fill + self.member_weight * np.bincount(near[level] + 1, minlength=size) / len(near_rows)
+            fill[0] = 0.0
+            score = score + weight * fill[domains]
+        return score
+
+    def _rank_python(self, count, rows, near_rows):
+        scores = self._score_python(rows, count, near_rows)
+        domain_tiebreak, node_tiebreak, node_domains = self._domain_tiebreak, self._node_tiebreak, self._node_domains
+        ranked = sorted(zip(scores, rows), reverse=True,
+                        key=lambda e: (e[0], domain_tiebreak[node_domains[e[1]][-1]], node_tiebreak[e[1]]))
+        return [self._names[r] for _, r in ranked[:count]]
+
+    def _score_python(self, rows, count, near_rows):
+        node_domains = self._node_domains
+        scores = [0.0] * len(rows)
+        for level, weight in enumerate(self.weights):
+            free = Counter(node_domains[r][level] for r in rows)
+            near = Counter(node_domains[r][level] for r in near_rows)
+            for i, r in enumerate(rows):
+                domain = node_domains[r][level]
+                if domain < 0:
+                    continue
+                fill = min(free[domain], count) / count
+                if near_rows:
+                    fill += self.member_weight * near[domain] / len(near_rows)
+                scores[i] += weight * fill
+        return scores
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is not None:
+            return row
+        row = self._rows[name] = len(self._names)
+        self._names.append(name)
+        self._node_domains.append([-1] * len(self.levels))
+        self._node_tiebreak.append(self._rng.random())
+        if self.vectorized:
+            if row >= len(self._free):
+                self._grow()
+            self._node_tiebreak_array[row] = self._node_tiebreak[row]
+        return row
+
+    def _domain_id(self, level, value):
+        if value is None:
+            return -1
+        ids = self._domain_ids[level]
+        domain = ids.get(value)
+        if domain is None:
+            domain = ids[value] = len(ids)
+            if level == len(self.levels) - 1:
+                self._domain_tiebreak[domain] = self._rng.random()
+                if self.vectorized:
+                    if domain + 1 >= len(self._domain_tiebreak_array):
+                        self._domain_tiebreak_array = _grown(self._domain_tiebreak_array, 0.0)
+                    self._domain_tiebreak_array[domain + 1] = self._domain_tiebreak[domain]
+        return domain
+
+    def _grow(self):
+        self._domains = _grown(self._domains, -1)
+        self._free = _grown(self._free, False)
+        self._node_tiebreak_array = _grown(self._node_tiebreak_array, 0.0)
+
+
+def _grown(array, fill):
+    # Double the last axis, padding with fill.
+    grown = np.full(array.shape[:-1] + (array.shape[-1] * 2,), fill, dtype=array.dtype)
+    grown[..., :array.shape[-1]] = array
+    return grown